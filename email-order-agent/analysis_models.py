@@ -0,0 +1,176 @@
+"""
+Analysis Models Module
+Typed models for the structured results returned by Claude. Their JSON schemas
+are sent as tool input schemas, and every tool call is validated against them.
+
+The compact models are an alternate response format with short keys, line items
+as arrays and one-letter codes, to minimize output tokens; to_result() expands
+them back into the dict shape of the regular models
+"""
+from typing import Dict, List, Literal, Optional, Type
+from pydantic import BaseModel, ConfigDict, Field
+
+Confidence = Literal["high", "medium", "low"]
+
+
+class AnalysisModel(BaseModel):
+    """Base model: numbers are accepted where text is expected (e.g. quantities)"""
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    def to_result(self) -> Dict:
+        """Result dict used by the rest of the application"""
+        return self.model_dump()
+
+
+class Product(AnalysisModel):
+    name: str = Field(description="Product name")
+    quantity: Optional[str] = Field(None, description="Quantity with units")
+    unit_price: Optional[str] = Field(None, description="Unit price or null")
+
+
+class PurchaseOrderAnalysis(AnalysisModel):
+    # Decision fields come first so a streamed response can be stopped as soon
+    # as the document is known not to be a purchase order
+    is_purchase_order: bool = Field(description="True if the document is a purchase order")
+    special_notes: Optional[str] = Field(
+        None,
+        description="Important notes; if not a purchase order, briefly explain what the document is",
+    )
+    confidence: Confidence
+    client_name: Optional[str] = Field(None, description="Company or client name")
+    order_number: Optional[str] = Field(None, description="PO number or null")
+    order_date: Optional[str] = Field(None, description="Order date or null")
+    products: List[Product] = Field(default_factory=list)
+    total_amount: Optional[str] = Field(None, description="Total amount or null")
+
+
+class AttachmentAnalysis(PurchaseOrderAnalysis):
+    filename: str = Field(description="Filename of the attachment this analysis belongs to")
+
+
+class MentionedProduct(AnalysisModel):
+    nombre: str = Field(description="Nombre del producto")
+    cantidad: Optional[str] = Field(None, description="Cantidad con unidades o null")
+    especificaciones: Optional[str] = Field(None, description="Detalles adicionales o null")
+
+
+class EmailAnalysis(AnalysisModel):
+    tipo_mensaje: Literal["orden_compra", "cotizacion", "consulta", "reclamo", "otro"]
+    productos_mencionados: List[MentionedProduct] = Field(default_factory=list)
+    fecha_entrega: Optional[str] = Field(None, description="Fecha solicitada o null")
+    numero_orden: Optional[str] = Field(None, description="Número de OC mencionado o null")
+    urgencia: Literal["urgente", "normal", "baja"] = "normal"
+    notas_importantes: Optional[str] = Field(
+        None, description="Resumen de puntos clave del correo"
+    )
+    requiere_respuesta: bool = False
+    confianza: Confidence
+
+
+class CombinedAnalysis(AnalysisModel):
+    attachments: List[AttachmentAnalysis] = Field(
+        description="One analysis per PDF attachment, in the same order"
+    )
+    email_context: Optional[EmailAnalysis] = Field(
+        None, description="Analysis of the email body, or null if the body is empty"
+    )
+
+
+# Compact response format
+CONFIDENCE_CODES = {"h": "high", "m": "medium", "l": "low"}
+MESSAGE_TYPE_CODES = {
+    "oc": "orden_compra",
+    "cot": "cotizacion",
+    "con": "consulta",
+    "rec": "reclamo",
+    "otro": "otro",
+}
+URGENCY_CODES = {"u": "urgente", "n": "normal", "b": "baja"}
+
+# [name, quantity, unit_price] / [nombre, cantidad, especificaciones]
+CompactItem = List[Optional[str]]
+
+
+def _expand_item(item: CompactItem, keys: List[str]) -> Dict:
+    """Map a compact line item array onto its keys (missing values become None)"""
+    values = list(item) + [None] * len(keys)
+    return dict(zip(keys, values))
+
+
+class CompactPurchaseOrder(AnalysisModel):
+    # Decision fields first, as in PurchaseOrderAnalysis
+    po: bool = Field(description="True if the document is a purchase order")
+    n: Optional[str] = Field(
+        None, description="Notes; if not a purchase order, what the document is (one short sentence)"
+    )
+    c: Literal["h", "m", "l"] = Field(description="Confidence: h=high, m=medium, l=low")
+    cl: Optional[str] = Field(None, description="Client name")
+    no: Optional[str] = Field(None, description="PO number")
+    d: Optional[str] = Field(None, description="Order date")
+    it: List[CompactItem] = Field(
+        default_factory=list, description="Line items as [name, quantity with units, unit price]"
+    )
+    t: Optional[str] = Field(None, description="Total amount")
+
+    def to_result(self) -> Dict:
+        return PurchaseOrderAnalysis(
+            is_purchase_order=self.po,
+            special_notes=self.n,
+            confidence=CONFIDENCE_CODES[self.c],
+            client_name=self.cl,
+            order_number=self.no,
+            order_date=self.d,
+            products=[
+                _expand_item(item, ["name", "quantity", "unit_price"]) for item in self.it if item
+            ],
+            total_amount=self.t,
+        ).model_dump()
+
+
+class CompactEmailAnalysis(AnalysisModel):
+    tm: Literal["oc", "cot", "con", "rec", "otro"] = Field(
+        description="Tipo: oc=orden de compra, cot=cotización, con=consulta, rec=reclamo, otro"
+    )
+    p: List[CompactItem] = Field(
+        default_factory=list, description="Productos como [nombre, cantidad con unidades, especificaciones]"
+    )
+    fe: Optional[str] = Field(None, description="Fecha de entrega solicitada")
+    no: Optional[str] = Field(None, description="Número de OC mencionado")
+    u: Literal["u", "n", "b"] = Field("n", description="Urgencia: u=urgente, n=normal, b=baja")
+    nt: Optional[str] = Field(None, description="Resumen breve de puntos clave")
+    r: bool = Field(False, description="Requiere respuesta")
+    c: Literal["h", "m", "l"] = Field(description="Confianza: h=alta, m=media, l=baja")
+
+    def to_result(self) -> Dict:
+        return EmailAnalysis(
+            tipo_mensaje=MESSAGE_TYPE_CODES[self.tm],
+            productos_mencionados=[
+                _expand_item(item, ["nombre", "cantidad", "especificaciones"]) for item in self.p if item
+            ],
+            fecha_entrega=self.fe,
+            numero_orden=self.no,
+            urgencia=URGENCY_CODES[self.u],
+            notas_importantes=self.nt,
+            requiere_respuesta=self.r,
+            confianza=CONFIDENCE_CODES[self.c],
+        ).model_dump()
+
+
+def build_tool(name: str, description: str, model: Type[BaseModel]) -> Dict:
+    """
+    Build a Messages API tool definition whose input schema is the model's JSON schema
+
+    Args:
+        name: Tool name
+        description: What the tool records
+        model: Pydantic model describing the tool input
+
+    Returns:
+        Tool definition dict
+    """
+    return {
+        "name": name,
+        "description": description,
+        "input_schema": model.model_json_schema(),
+    }
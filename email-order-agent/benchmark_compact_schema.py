@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark del formato de respuesta compacto (CLAUDE_COMPACT_RESPONSES)
+
+Analiza los mismos documentos con el formato normal y con el compacto y compara
+tokens de salida y latencia. Los resultados compactos se expanden al mismo
+formato de diccionario, lo que también se verifica aquí.
+
+Uso:
+    python benchmark_compact_schema.py                 # API real (consume tokens)
+    python benchmark_compact_schema.py --rounds 5 --pdf orden.pdf
+    python benchmark_compact_schema.py --mock          # Servidor mock local (latencia no representativa)
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+SAMPLE_PURCHASE_ORDER = "\n".join(
+    [
+        "ORDEN DE COMPRA No. OC-2024-0417",
+        "Cliente: Industrias Químicas del Norte S.A. de C.V.",
+        "Fecha: 15/03/2024    Entrega: 22/03/2024",
+        "Partida  Descripción                        Cantidad     Precio unitario",
+    ]
+    + [
+        f"{i}  Resina epóxica grado industrial tipo {i}   {i * 20} kg   ${i * 12}.50"
+        for i in range(1, 16)
+    ]
+    + ["Subtotal $24,000.00", "IVA 16% $3,840.00", "TOTAL $27,840.00"]
+)
+
+SAMPLE_INVOICE = "\n".join(
+    [
+        "FACTURA F-88231",
+        "CFDI 4.0  Uso: G01  Método de pago: PUE",
+        "Cliente: Industrias Químicas del Norte S.A. de C.V.",
+    ]
+    + [f"{i}  Servicio de flete {i}   1 servicio   ${i * 150}.00" for i in range(1, 8)]
+    + ["TOTAL $4,200.00"]
+)
+
+SAMPLE_EMAIL = (
+    "Buen día, les pido por favor surtir 200 kg de resina epóxica tipo 3 y 50 kg de "
+    "catalizador para el viernes 22 de marzo, es urgente porque tenemos paro de línea. "
+    "La OC-2024-0417 va en camino. Quedo atento a su confirmación."
+)
+
+
+def run_format(compact: bool, documents, rounds: int):
+    """Analyze every document rounds times with one response format
+
+    Returns:
+        Tuple of (output tokens per call, seconds per call, result keys by kind)
+    """
+    import config
+    from claude_analyzer import ClaudeAnalyzer
+    from usage_ledger import UsageLedger
+
+    analyzer = ClaudeAnalyzer()
+    analyzer.compact_responses = compact
+    # Every call must reach the API, on a single model
+    analyzer.response_cache = None
+    analyzer.document_classifier = None
+    analyzer.email_classifier = None
+    analyzer.models = [analyzer.model]
+    config.PDF_CHUNKED_ANALYSIS = False
+    analyzer.usage_ledger = UsageLedger(Path(tempfile.mkdtemp()) / "benchmark.db")
+
+    latencies = []
+    keys = {}
+    for _ in range(rounds):
+        for kind, label, text in documents:
+            start = time.perf_counter()
+            if kind == "email":
+                result = analyzer.analyze_email_content(text, "cliente@ejemplo.com", label)
+            else:
+                result = analyzer.analyze_purchase_order(text, "cliente@ejemplo.com", label)
+            latencies.append(time.perf_counter() - start)
+            if result:
+                keys[kind] = set(result) - {"model", "escalated"}
+
+    rows = analyzer.usage_ledger.report("type", days=None)
+    calls = sum(row["api_calls"] for row in rows)
+    output_tokens = sum(row["output_tokens"] for row in rows) / max(calls, 1)
+    return output_tokens, latencies, keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the regular and compact response formats")
+    parser.add_argument("--rounds", type=int, default=3, help="Times each document is analyzed")
+    parser.add_argument("--pdf", action="append", default=[], help="Additional PDF to analyze")
+    parser.add_argument("--mock", action="store_true", help="Use the local mock server")
+    args = parser.parse_args()
+
+    server = None
+    if args.mock:
+        from mock_anthropic_server import MockAnthropicServer
+
+        server = MockAnthropicServer(port=0)
+        server.start()
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+    documents = [
+        ("purchase_order", "orden.pdf", SAMPLE_PURCHASE_ORDER),
+        ("purchase_order", "factura.pdf", SAMPLE_INVOICE),
+        ("email", "Pedido urgente", SAMPLE_EMAIL),
+    ]
+    if args.pdf:
+        from pdf_processor import PDFProcessor
+
+        for path in args.pdf:
+            text = PDFProcessor.extract_text(Path(path).read_bytes(), Path(path).name)
+            if text:
+                documents.append(("purchase_order", Path(path).name, text))
+
+    print("=" * 70)
+    print("BENCHMARK FORMATO COMPACTO" + (" - Servidor mock local" if server else " - API real"))
+    print("=" * 70)
+    print(f"\n📄 Documentos: {len(documents)}, rondas: {args.rounds}")
+
+    results = {}
+    for compact in (False, True):
+        name = "compacto" if compact else "normal"
+        print(f"\n⏳ Analizando con formato {name}...")
+        results[name] = run_format(compact, documents, args.rounds)
+
+    print(f"\n{'formato':<10} {'tokens salida':>14} {'p50 (s)':>9} {'media (s)':>10} {'máx (s)':>9}")
+    for name, (output_tokens, latencies, _) in results.items():
+        print(
+            f"{name:<10} {output_tokens:>14.1f} {statistics.median(latencies):>9.3f} "
+            f"{statistics.mean(latencies):>10.3f} {max(latencies):>9.3f}"
+        )
+
+    regular_tokens, regular_latencies, regular_keys = results["normal"]
+    compact_tokens, compact_latencies, compact_keys = results["compacto"]
+    if regular_tokens:
+        print(f"\n📉 Tokens de salida: {100 * (1 - compact_tokens / regular_tokens):.1f}% menos")
+    print(
+        f"⏱️  Latencia media: "
+        f"{100 * (1 - statistics.mean(compact_latencies) / statistics.mean(regular_latencies)):.1f}% menos"
+    )
+
+    same_shape = regular_keys == compact_keys
+    print(f"🔑 Mismo formato de resultado: {'sí' if same_shape else 'no'}")
+
+    if server:
+        server.stop()
+
+    print("\n" + "=" * 70)
+    print("BENCHMARK COMPLETADO" if same_shape else "BENCHMARK CON DIFERENCIAS")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,579 @@
 Claude Analyzer Module
 Uses Claude Haiku API to analyze PDF content and extract purchase order information
 """
+import asyncio
+import contextvars
 import logging
 import json
-from typing import Optional, Dict
-from anthropic import Anthropic
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional, Dict, List, Tuple
+from anthropic import Anthropic, APIConnectionError, AsyncAnthropic
+from anthropic.types import Message
+from pydantic import ValidationError
 import config
+from analysis_models import (
+    CombinedAnalysis,
+    CompactEmailAnalysis,
+    CompactPurchaseOrder,
+    EmailAnalysis,
+    PurchaseOrderAnalysis,
+    build_tool,
+)
+from metrics import metrics
+from preclassifier import DOCUMENT, EMAIL, REASON_LABELS, PreClassifier
+from rate_limiter import RETRYABLE_STATUS_CODES, RateLimiter, backoff_delay, retry_after_seconds
+from response_cache import ResponseCache
+from text_selector import chunk_overlap, estimate_tokens, select_relevant_text, split_into_chunks
+from usage_ledger import UsageLedger
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever prompts or response parsing change, so cached responses are not reused
+PROMPT_VERSION = "3"
+
+# Tools Claude must call to return its analysis; their input schemas come from
+# the typed models, so every response can be validated
+PURCHASE_ORDER_TOOL = build_tool(
+    "record_purchase_order",
+    "Record the information extracted from a document that may be a purchase order",
+    PurchaseOrderAnalysis,
+)
+EMAIL_ANALYSIS_TOOL = build_tool(
+    "record_email_analysis",
+    "Registra la información de negocio extraída de un correo de cliente",
+    EmailAnalysis,
+)
+PURCHASE_ORDER_PART_TOOL = build_tool(
+    "record_purchase_order_part",
+    "Record the information extracted from one part of a long document that may be a purchase order",
+    PurchaseOrderAnalysis,
+)
+# Compact alternates of the purchase order and email tools (CLAUDE_COMPACT_RESPONSES)
+COMPACT_PURCHASE_ORDER_TOOL = build_tool(
+    "record_purchase_order_compact",
+    "Record the information extracted from a document that may be a purchase order, using short keys",
+    CompactPurchaseOrder,
+)
+COMPACT_EMAIL_ANALYSIS_TOOL = build_tool(
+    "record_email_analysis_compact",
+    "Registra la información de negocio extraída de un correo de cliente, con claves cortas",
+    CompactEmailAnalysis,
+)
+COMBINED_ANALYSIS_TOOL = build_tool(
+    "record_combined_analysis",
+    "Record the analysis of every PDF attachment and of the email body",
+    CombinedAnalysis,
+)
+
+# Static instructions, sent as a cacheable system prompt so that only the
+# per-document content changes between requests
+PURCHASE_ORDER_INSTRUCTIONS = f"""You analyze documents that may be purchase orders.
+
+Extract the client, order number, date, products, total and any important notes,
+and record them by calling the {PURCHASE_ORDER_TOOL["name"]} tool.
+
+If this is NOT a purchase order, set is_purchase_order to false and briefly explain what it is
+in special_notes (one short sentence)."""
+
+PURCHASE_ORDER_PART_INSTRUCTIONS = f"""You analyze one part of a long document that may be a purchase order.
+
+Extract every product line item in this part, and the client, order number, date and total
+only if they appear in this part (null otherwise). Record them by calling the
+{PURCHASE_ORDER_PART_TOOL["name"]} tool.
+
+Set is_purchase_order to true if this part belongs to a purchase order. Only put notes that
+appear in this part in special_notes."""
+
+COMPACT_PURCHASE_ORDER_INSTRUCTIONS = f"""You analyze documents that may be purchase orders.
+
+Extract the client, order number, date, line items, total and any important notes,
+and record them by calling the {COMPACT_PURCHASE_ORDER_TOOL["name"]} tool. Keep values short.
+
+If this is NOT a purchase order, set po to false and briefly explain what it is
+in n (one short sentence)."""
+
+EMAIL_ANALYSIS_INSTRUCTIONS = f"""Analiza correos electrónicos de clientes y extrae información relevante de negocio.
+
+Registra la información más importante llamando a la herramienta {EMAIL_ANALYSIS_TOOL["name"]}.
+
+IMPORTANTE: Extrae solo información explícitamente mencionada en el correo."""
+
+COMPACT_EMAIL_ANALYSIS_INSTRUCTIONS = f"""Analiza correos electrónicos de clientes y extrae información relevante de negocio.
+
+Registra la información más importante llamando a la herramienta {COMPACT_EMAIL_ANALYSIS_TOOL["name"]},
+con valores breves.
+
+IMPORTANTE: Extrae solo información explícitamente mencionada en el correo."""
+
+COMBINED_ANALYSIS_INSTRUCTIONS = f"""You analyze customer emails and their PDF attachments, which may be purchase orders.
+
+Record the results by calling the {COMBINED_ANALYSIS_TOOL["name"]} tool, with one attachment
+analysis per PDF (in the same order, with its filename) and the email context.
+
+For each attachment: if it is NOT a purchase order, set is_purchase_order to false and briefly explain what it is in special_notes.
+For email_context: write the values in Spanish and extract only information explicitly mentioned in the email body,
+or set it to null if the email body is empty."""
+
+# Tool name -> (typed model, instructions), used to validate and repair responses
+TOOL_SPECS = {
+    PURCHASE_ORDER_TOOL["name"]: (PURCHASE_ORDER_TOOL, PurchaseOrderAnalysis, PURCHASE_ORDER_INSTRUCTIONS),
+    PURCHASE_ORDER_PART_TOOL["name"]: (
+        PURCHASE_ORDER_PART_TOOL, PurchaseOrderAnalysis, PURCHASE_ORDER_PART_INSTRUCTIONS
+    ),
+    EMAIL_ANALYSIS_TOOL["name"]: (EMAIL_ANALYSIS_TOOL, EmailAnalysis, EMAIL_ANALYSIS_INSTRUCTIONS),
+    COMPACT_PURCHASE_ORDER_TOOL["name"]: (
+        COMPACT_PURCHASE_ORDER_TOOL, CompactPurchaseOrder, COMPACT_PURCHASE_ORDER_INSTRUCTIONS
+    ),
+    COMPACT_EMAIL_ANALYSIS_TOOL["name"]: (
+        COMPACT_EMAIL_ANALYSIS_TOOL, CompactEmailAnalysis, COMPACT_EMAIL_ANALYSIS_INSTRUCTIONS
+    ),
+    COMBINED_ANALYSIS_TOOL["name"]: (COMBINED_ANALYSIS_TOOL, CombinedAnalysis, COMBINED_ANALYSIS_INSTRUCTIONS),
+}
+
+# Tools a purchase order / email analysis response may have called (regular first)
+PURCHASE_ORDER_TOOL_NAMES = [PURCHASE_ORDER_TOOL["name"], COMPACT_PURCHASE_ORDER_TOOL["name"]]
+EMAIL_ANALYSIS_TOOL_NAMES = [EMAIL_ANALYSIS_TOOL["name"], COMPACT_EMAIL_ANALYSIS_TOOL["name"]]
+
+# Sent instead of the whole document when a tool call fails validation
+REPAIR_PROMPT = """Your previous call to the {tool_name} tool had invalid input:
+
+{tool_input}
+
+Validation errors:
+{errors}
+
+Call {tool_name} again with corrected input. Keep every value that was valid."""
+REPAIR_MAX_TOKENS = 4096
+
+# A part of a chunked document may list many line items
+PART_MAX_TOKENS = 2048
+
+CONFIDENCE_LEVELS = ["low", "medium", "high"]
+
 
 class ClaudeAnalyzer:
     """Analyzes documents using Claude Haiku for cost-effective processing"""
 
     def __init__(self):
         """Initialize Claude client with API key"""
-        self.client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
-        self.model = "claude-3-5-haiku-20241022"  # Most cost-effective model
-        logger.info(f"Initialized Claude Analyzer with model: {self.model}")
+        # Retries are handled by _create_message, within the client-side rate limits
+        self.client = Anthropic(api_key=config.ANTHROPIC_API_KEY, max_retries=0)
+        self.rate_limiter = RateLimiter(
+            config.CLAUDE_REQUESTS_PER_MINUTE, config.CLAUDE_INPUT_TOKENS_PER_MINUTE
+        )
+        # Model tiers: the first (most cost-effective) handles everything, the
+        # next ones only get documents whose result needs escalation
+        self.models = config.CLAUDE_MODELS
+        if not self.models:
+            raise ValueError("CLAUDE_MODELS must list at least one model")
+        self.model = self.models[0]
+
+        # Response format of the purchase order and email analyses
+        self.compact_responses = config.CLAUDE_COMPACT_RESPONSES
+
+        # Async client and concurrency limit are bound to the running event loop,
+        # so they are created lazily by _get_async_client()
+        self.max_concurrency = config.CLAUDE_MAX_CONCURRENCY
+        self.async_client: Optional[AsyncAnthropic] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Message Batches: requests queued for the next batch, and submitted
+        # batches still waiting for results (persisted across restarts)
+        self.batch_state_file = config.CLAUDE_BATCHES_FILE
+        self._batch_queue: List[Dict] = []
+        self._pending_batches: Dict[str, Dict] = self._load_batch_state()
+
+        # Persistent cache of responses to identical requests
+        self.response_cache = ResponseCache() if config.LLM_CACHE_ENABLED else None
+
+        # Persistent record of every call, for cost and latency reports
+        self.usage_ledger = UsageLedger()
+
+        # Local classifiers that let obvious non-orders skip Claude
+        self.document_classifier = PreClassifier(DOCUMENT) if config.PRECLASSIFIER_ENABLED else None
+        self.email_classifier = PreClassifier(EMAIL) if config.PRECLASSIFIER_ENABLED else None
+
+        logger.info(
+            f"Initialized Claude Analyzer with models: {', '.join(self.models)} "
+            f"(max concurrent requests: {self.max_concurrency})"
+        )
+
+    def _get_async_client(self) -> AsyncAnthropic:
+        """Return the async client for the running event loop, creating it if needed"""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self.async_client = AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY, max_retries=0)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_loop = loop
+        return self.async_client
+
+    def _create_message(self, request: Dict, purpose: str = "analysis"):
+        """Send a Messages API request within the rate limits, retrying transient errors"""
+        tokens = estimate_tokens(json.dumps([request.get("system"), request["messages"]]))
+
+        for attempt in range(config.CLAUDE_MAX_RETRIES + 1):
+            metrics.observe("claude_rate_limit_wait_seconds", self.rate_limiter.acquire(tokens))
+            started = time.monotonic()
+            try:
+                if self._use_early_stop(request):
+                    message = self._stream_message(request)
+                else:
+                    message = self.client.messages.create(**request)
+            except Exception as e:
+                self._record_call(request, "error", purpose=purpose, started=started)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self._record_call(request, self._call_outcome(message), message, purpose, started)
+            return message
+
+    async def _create_message_async(self, request: Dict, purpose: str = "analysis"):
+        """Async version of _create_message; also waits for a free concurrency slot"""
+        client = self._get_async_client()
+        tokens = estimate_tokens(json.dumps([request.get("system"), request["messages"]]))
+
+        for attempt in range(config.CLAUDE_MAX_RETRIES + 1):
+            metrics.observe(
+                "claude_rate_limit_wait_seconds", await self.rate_limiter.acquire_async(tokens)
+            )
+            started = None
+            try:
+                async with self._semaphore:
+                    started = time.monotonic()
+                    if self._use_early_stop(request):
+                        message = await self._stream_message_async(client, request)
+                    else:
+                        message = await client.messages.create(**request)
+            except Exception as e:
+                self._record_call(request, "error", purpose=purpose, started=started)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self._record_call(request, self._call_outcome(message), message, purpose, started)
+            return message
+
+    def _record_call(
+        self, request: Dict, outcome: str, message=None, purpose: str = "analysis",
+        started: Optional[float] = None
+    ):
+        """Add a call (or a call avoided by the cache) to the usage ledger"""
+        self.usage_ledger.record(
+            model=request["model"],
+            request_type=request["tool_choice"]["name"].replace("record_", ""),
+            outcome=outcome,
+            usage=message.usage if message is not None else None,
+            latency=time.monotonic() - started if started is not None else None,
+            purpose=purpose,
+        )
+
+    @staticmethod
+    def _call_outcome(message) -> str:
+        """Ledger outcome of a response; forced tool calls only end with end_turn when stopped early"""
+        return "early_stop" if message.stop_reason == "end_turn" else "ok"
+
+    def _use_early_stop(self, request: Dict) -> bool:
+        """Purchase order analyses are streamed so non-PO documents can stop early"""
+        return (
+            config.CLAUDE_STREAM_EARLY_STOP
+            and request["tool_choice"]["name"] in PURCHASE_ORDER_TOOL_NAMES
+        )
+
+    def _stream_message(self, request: Dict):
+        """
+        Stream a purchase order analysis, parsing the tool input as it arrives
+
+        Generation is stopped (by closing the stream) as soon as the input says
+        the document is not a purchase order and its note is complete.
+        """
+        with self.client.messages.stream(**request) as stream:
+            for event in stream:
+                if event.type == "input_json" and self._is_decided_non_po(event.snapshot):
+                    return self._early_stop_message(stream.current_message_snapshot)
+            return stream.get_final_message()
+
+    async def _stream_message_async(self, client: AsyncAnthropic, request: Dict):
+        """Async version of _stream_message"""
+        async with client.messages.stream(**request) as stream:
+            async for event in stream:
+                if event.type == "input_json" and self._is_decided_non_po(event.snapshot):
+                    return self._early_stop_message(stream.current_message_snapshot)
+            return await stream.get_final_message()
+
+    @staticmethod
+    def _is_decided_non_po(tool_input) -> bool:
+        """
+        True once a partial tool input says the document is not a purchase order
+
+        Partially streamed strings are left out of the parsed snapshot, so the
+        presence of confidence (which follows special_notes) means both are complete.
+        Both the regular and the compact keys are recognized.
+        """
+        return isinstance(tool_input, dict) and (
+            (tool_input.get("is_purchase_order") is False and "confidence" in tool_input)
+            or (tool_input.get("po") is False and "c" in tool_input)
+        )
+
+    def _early_stop_message(self, snapshot):
+        """Finalize a stream stopped early; output tokens are estimated from the partial input"""
+        tool_use = next(block for block in snapshot.content if block.type == "tool_use")
+        output_tokens = max(
+            snapshot.usage.output_tokens, estimate_tokens(json.dumps(tool_use.input))
+        )
+
+        metrics.increment("claude_early_stops")
+        logger.info(f"Not a purchase order, stopped generation after ~{output_tokens} output tokens")
+
+        usage = snapshot.usage.model_copy(update={"output_tokens": output_tokens})
+        return snapshot.model_copy(update={"usage": usage, "stop_reason": "end_turn"})
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Decide whether a failed request is retried
+
+        Rate limit responses pause the limiter for every caller until retry-after;
+        overload and other transient errors use jittered exponential backoff.
+
+        Returns:
+            Seconds to wait before retrying, or None if the error is not retryable
+        """
+        status_code = getattr(error, "status_code", None)
+        retryable = (
+            status_code in RETRYABLE_STATUS_CODES if status_code is not None
+            else isinstance(error, APIConnectionError)
+        )
+        if not retryable or attempt >= config.CLAUDE_MAX_RETRIES:
+            return None
+
+        if status_code == 429:
+            metrics.increment("claude_rate_limited")
+        elif status_code == 529:
+            metrics.increment("claude_overloaded")
+        metrics.increment("claude_retries")
+
+        delay = retry_after_seconds(error)
+        if delay is not None:
+            self.rate_limiter.pause(delay)
+        else:
+            delay = backoff_delay(
+                attempt, config.CLAUDE_BACKOFF_BASE_SECONDS, config.CLAUDE_BACKOFF_MAX_SECONDS
+            )
+
+        logger.warning(
+            f"Claude request failed ({status_code or type(error).__name__}), "
+            f"retry {attempt + 1}/{config.CLAUDE_MAX_RETRIES} in {delay:.1f}s"
+        )
+        return delay
+
+    def _run_request(self, request: Dict, handler: Callable):
+        """
+        Send a request through the response cache and parse it with handler
+
+        Identical requests (same model, prompts and PROMPT_VERSION) are answered
+        from the cache; responses are only cached when their tool input is valid.
+        """
+        if self.response_cache is None:
+            return handler(self._create_validated(request))
+
+        key = ResponseCache.make_key(request, PROMPT_VERSION)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            self._record_call(request, "cache_hit")
+            return handler(self._without_usage(Message.model_validate(cached)))
+
+        message, is_leader = self.response_cache.single_flight(
+            key, lambda: self._create_validated(request)
+        )
+        return self._handle_and_cache(key, message, is_leader, request, handler)
+
+    async def _run_request_async(self, request: Dict, handler: Callable):
+        """Async version of _run_request; concurrent identical requests share one call"""
+        if self.response_cache is None:
+            return handler(await self._create_validated_async(request))
+
+        key = ResponseCache.make_key(request, PROMPT_VERSION)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            self._record_call(request, "cache_hit")
+            return handler(self._without_usage(Message.model_validate(cached)))
+
+        message, is_leader = await self.response_cache.single_flight_async(
+            key, lambda: self._create_validated_async(request)
+        )
+        return self._handle_and_cache(key, message, is_leader, request, handler)
+
+    def _handle_and_cache(
+        self, key: str, message, is_leader: bool, request: Dict, handler: Callable
+    ):
+        """Parse a fresh response and cache it if its tool input was valid"""
+        if message is None:
+            raise RuntimeError("Identical in-flight request failed")
+
+        if not is_leader:
+            self._record_call(request, "coalesced")
+            # Tokens were already accounted for by the request that made the call
+            metrics.increment(
+                "llm_cache_saved_tokens",
+                message.usage.input_tokens + message.usage.output_tokens,
+            )
+            return handler(self._without_usage(message))
+
+        result = handler(message)
+        tool_input, _ = self._validate_tool_input(message, request["tool_choice"]["name"])
+        if result is not None and tool_input is not None:
+            self.response_cache.put(
+                key,
+                message.model_dump(mode="json"),
+                tokens=message.usage.input_tokens + message.usage.output_tokens,
+            )
+        return result
+
+    def _create_validated(self, request: Dict):
+        """Send a request and, if its tool input fails validation, one repair request"""
+        message = self._create_message(request)
+        tool_name = request["tool_choice"]["name"]
+
+        _, errors = self._validate_tool_input(message, tool_name)
+        if errors is None:
+            return message
+        return self._repair(message, tool_name, errors)
+
+    async def _create_validated_async(self, request: Dict):
+        """Async version of _create_validated"""
+        message = await self._create_message_async(request)
+        tool_name = request["tool_choice"]["name"]
+
+        _, errors = self._validate_tool_input(message, tool_name)
+        if errors is None:
+            return message
+
+        repair_request = self._build_repair_request(message, tool_name, errors)
+        try:
+            repaired = await self._create_message_async(repair_request, purpose="repair")
+        except Exception as e:
+            logger.error(f"Repair request for {tool_name} failed: {str(e)}")
+            return message
+        return self._combine_repair(message, repaired, tool_name)
+
+    def _repair(self, message, tool_name: str, errors: str):
+        """Send one repair request for an invalid response
+
+        Returns:
+            The repaired response if valid, otherwise the original one
+        """
+        repair_request = self._build_repair_request(message, tool_name, errors)
+        try:
+            repaired = self._create_message(repair_request, purpose="repair")
+        except Exception as e:
+            logger.error(f"Repair request for {tool_name} failed: {str(e)}")
+            return message
+        return self._combine_repair(message, repaired, tool_name)
+
+    @staticmethod
+    def _called_tool(message, tool_names: List[str]) -> str:
+        """Name of the tool a response called among tool_names (the first one if none matches)"""
+        called = {block.name for block in message.content if block.type == "tool_use"}
+        return next((name for name in tool_names if name in called), tool_names[0])
+
+    def _validate_tool_input(self, message, tool_name: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Validate the tool call of a response against the tool's typed model
+
+        Returns:
+            Tuple of (validated input, None), or (None, description of the errors)
+        """
+        _, model, _ = TOOL_SPECS[tool_name]
+        tool_use = next(
+            (block for block in message.content
+             if block.type == "tool_use" and block.name == tool_name),
+            None,
+        )
+        if tool_use is None:
+            return None, f"The response did not call the {tool_name} tool"
+
+        try:
+            return model.model_validate(tool_use.input).to_result(), None
+        except ValidationError as e:
+            return None, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+
+    def _build_repair_request(self, message, tool_name: str, errors: str) -> Dict:
+        """Build a short request asking Claude to fix an invalid tool call
+
+        Only the invalid output and the validation errors are sent, not the document.
+        """
+        tool, _, instructions = TOOL_SPECS[tool_name]
+        tool_use = next((block for block in message.content if block.type == "tool_use"), None)
+        if tool_use is not None:
+            tool_input = json.dumps(tool_use.input, ensure_ascii=False)
+        else:
+            tool_input = "".join(getattr(block, "text", "") for block in message.content)
+
+        logger.warning(f"Invalid {tool_name} response, sending repair request: {errors}")
+        metrics.increment("llm_repair_requests")
+
+        return {
+            "model": message.model,
+            "max_tokens": REPAIR_MAX_TOKENS,
+            "system": self._build_system_prompt(instructions),
+            "tools": [tool],
+            "tool_choice": {"type": "tool", "name": tool_name},
+            "messages": [{
+                "role": "user",
+                "content": REPAIR_PROMPT.format(
+                    tool_name=tool_name, tool_input=tool_input, errors=errors
+                ),
+            }],
+        }
+
+    def _combine_repair(self, message, repaired, tool_name: str):
+        """Return the repaired response if valid (else the original), with the usage of both calls"""
+        _, errors = self._validate_tool_input(repaired, tool_name)
+        if errors is None:
+            metrics.increment("llm_repair_successes")
+            logger.info(f"Repair of {tool_name} response succeeded")
+            result = repaired
+        else:
+            logger.error(f"Repair of {tool_name} response failed: {errors}")
+            result = message
+
+        usage = result.usage.model_copy(update={
+            field: (getattr(message.usage, field, None) or 0) + (getattr(repaired.usage, field, None) or 0)
+            for field in (
+                "input_tokens", "output_tokens",
+                "cache_read_input_tokens", "cache_creation_input_tokens",
+            )
+        })
+        return result.model_copy(update={"usage": usage})
+
+    @staticmethod
+    def _without_usage(message):
+        """Copy of a message with zero token usage (nothing was spent to obtain it)"""
+        usage = message.usage.model_copy(update={
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+        })
+        return message.model_copy(update={"usage": usage})
+
+    async def aclose(self):
+        """Close the async client (call before the event loop shuts down)"""
+        if self.async_client is not None:
+            await self.async_client.close()
+        self.async_client = None
+        self._async_loop = None
+        self._semaphore = None
 
     def analyze_purchase_order(
         self, pdf_text: str, sender_email: str, filename: str
@@ -35,106 +591,614 @@ class ClaudeAnalyzer:
             Dictionary with extracted information or None if analysis fails
         """
         try:
-            # Limit text to first 4000 characters to optimize costs
-            # Most PO info is in the first pages
-            text_sample = pdf_text[:4000] if len(pdf_text) > 4000 else pdf_text
-
-            logger.info(f"Analyzing PDF: {filename} from {sender_email}")
-            logger.debug(f"Text length: {len(text_sample)} characters")
+            decision = self._preclassify(self.document_classifier, pdf_text)
+            if decision and decision["skip"]:
+                return self._preclassified_purchase_order(decision, sender_email, filename)
 
-            prompt = self._build_analysis_prompt(text_sample, sender_email, filename)
+            # Long documents are analyzed in parts so no line items are dropped
+            chunks = self._split_for_analysis(pdf_text)
+            if len(chunks) > 1:
+                analysis_result = self._analyze_chunks(chunks, sender_email, filename)
+            else:
+                analysis_result = self._run_with_escalation(
+                    lambda model: self._build_purchase_order_request(pdf_text, sender_email, filename, model),
+                    lambda message: self._handle_purchase_order_response(message, sender_email, filename),
+                    self._purchase_order_escalation_reason,
+                )
 
-            # Call Claude API
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                messages=[{"role": "user", "content": prompt}],
+            self._record_outcome(
+                self.document_classifier, decision, analysis_result,
+                lambda result: result["is_purchase_order"],
             )
+            return analysis_result
 
-            # Extract response
-            response_text = message.content[0].text
+        except Exception as e:
+            logger.error(f"Error analyzing PDF with Claude: {str(e)}")
+            return None
 
-            # Log token usage for cost tracking
-            input_tokens = message.usage.input_tokens
-            output_tokens = message.usage.output_tokens
-            logger.info(
-                f"Claude API call completed. Tokens: {input_tokens} input, "
-                f"{output_tokens} output"
-            )
+    async def analyze_purchase_order_async(
+        self, pdf_text: str, sender_email: str, filename: str
+    ) -> Optional[Dict]:
+        """
+        Async version of analyze_purchase_order
 
-            # Parse JSON response
-            analysis_result = self._parse_claude_response(response_text)
+        Calls share the analyzer's concurrency limit, so many documents can be
+        analyzed at once without exceeding CLAUDE_MAX_CONCURRENCY requests in flight.
 
-            if analysis_result:
-                analysis_result["sender_email"] = sender_email
-                analysis_result["filename"] = filename
-                analysis_result["tokens_used"] = input_tokens + output_tokens
+        Args:
+            pdf_text: Extracted text from PDF
+            sender_email: Email address of sender
+            filename: Name of the PDF file
 
-                logger.info(
-                    f"Analysis complete. Is PO: {analysis_result.get('is_purchase_order')}"
+        Returns:
+            Dictionary with extracted information or None if analysis fails
+        """
+        try:
+            decision = self._preclassify(self.document_classifier, pdf_text)
+            if decision and decision["skip"]:
+                return self._preclassified_purchase_order(decision, sender_email, filename)
+
+            # Long documents are analyzed in parts so no line items are dropped
+            chunks = self._split_for_analysis(pdf_text)
+            if len(chunks) > 1:
+                analysis_result = await self._analyze_chunks_async(chunks, sender_email, filename)
+            else:
+                analysis_result = await self._run_with_escalation_async(
+                    lambda model: self._build_purchase_order_request(pdf_text, sender_email, filename, model),
+                    lambda message: self._handle_purchase_order_response(message, sender_email, filename),
+                    self._purchase_order_escalation_reason,
                 )
 
+            self._record_outcome(
+                self.document_classifier, decision, analysis_result,
+                lambda result: result["is_purchase_order"],
+            )
             return analysis_result
 
         except Exception as e:
             logger.error(f"Error analyzing PDF with Claude: {str(e)}")
             return None
 
+    def _split_for_analysis(self, pdf_text: str) -> List[str]:
+        """Split a PDF text that exceeds PDF_TEXT_TOKEN_BUDGET into parts (a single part otherwise)"""
+        total_tokens = estimate_tokens(pdf_text)
+        if not config.PDF_CHUNKED_ANALYSIS or total_tokens <= config.PDF_TEXT_TOKEN_BUDGET:
+            return [pdf_text]
+
+        # Grow the chunks rather than exceed PDF_MAX_CHUNKS requests per document
+        budget = max(config.PDF_CHUNK_TOKEN_BUDGET, total_tokens // config.PDF_MAX_CHUNKS + 1)
+        return split_into_chunks(pdf_text, budget)
+
+    def _analyze_chunks(self, chunks: List[str], sender_email: str, filename: str) -> Optional[Dict]:
+        """
+        Analyze the parts of a long document in parallel and merge the results
+
+        Args:
+            chunks: Document parts, in order
+            sender_email: Email address of sender
+            filename: Name of the PDF file
+
+        Returns:
+            Merged analysis, or None if every part failed
+        """
+        logger.info(f"Analyzing {filename} in {len(chunks)} parts")
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(chunks))) as executor:
+            futures = [
+                # Each part runs in a copy of the caller's context (usage ledger sender)
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._run_with_escalation,
+                    self._part_request_builder(chunk, part, len(chunks), sender_email, filename),
+                    self._part_handler(sender_email, filename),
+                    self._part_escalation_reason,
+                )
+                for part, chunk in enumerate(chunks, 1)
+            ]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error analyzing part of {filename}: {str(e)}")
+                    results.append(None)
+        return self._merge_part_results(results, sender_email, filename, chunks)
+
+    async def _analyze_chunks_async(
+        self, chunks: List[str], sender_email: str, filename: str
+    ) -> Optional[Dict]:
+        """Async version of _analyze_chunks"""
+        logger.info(f"Analyzing {filename} in {len(chunks)} parts")
+        results = await asyncio.gather(
+            *(
+                self._run_with_escalation_async(
+                    self._part_request_builder(chunk, part, len(chunks), sender_email, filename),
+                    self._part_handler(sender_email, filename),
+                    self._part_escalation_reason,
+                )
+                for part, chunk in enumerate(chunks, 1)
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error analyzing part of {filename}: {str(result)}")
+        return self._merge_part_results(
+            [None if isinstance(result, Exception) else result for result in results],
+            sender_email, filename, chunks,
+        )
+
+    def _part_request_builder(
+        self, chunk: str, part: int, total_parts: int, sender_email: str, filename: str
+    ) -> Callable[[str], Dict]:
+        """Request builder (by model) for one part of a chunked document"""
+        return lambda model: self._build_purchase_order_part_request(
+            chunk, part, total_parts, sender_email, filename, model
+        )
+
+    def _part_handler(self, sender_email: str, filename: str) -> Callable:
+        """Response handler for the parts of a chunked document"""
+        return lambda message: self._handle_purchase_order_response(
+            message, sender_email, filename, PURCHASE_ORDER_PART_TOOL["name"]
+        )
+
+    def _merge_part_results(
+        self, results: List[Optional[Dict]], sender_email: str, filename: str,
+        chunks: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """
+        Merge the analyses of a chunked document's parts into one purchase order
+
+        Header fields come from the parts that contain them (the total from the
+        last one), line items are concatenated in order, and the confidence is
+        the lowest of the parts. A line item is only dropped as a duplicate when
+        the previous part has the same item and it is in the lines both parts
+        share; items legitimately repeated in a document are kept.
+
+        Args:
+            results: Part analyses in document order (None for failed parts)
+            sender_email: Email address of sender
+            filename: Name of the PDF file
+            chunks: Text of each part, used to find the lines adjacent parts share
+
+        Returns:
+            Merged analysis, or None if every part failed
+        """
+        parts = [result for result in results if result]
+        if not parts:
+            return None
+
+        valid = [part for part in parts if not part.get("analysis_failed")] or parts
+        is_purchase_order = any(part.get("is_purchase_order") for part in valid)
+        # Notes and confidence only from parts that agree with the document decision
+        agreeing = [part for part in valid if bool(part.get("is_purchase_order")) == is_purchase_order]
+
+        merged = {"is_purchase_order": is_purchase_order}
+        for field in ("client_name", "order_number", "order_date"):
+            merged[field] = next((part[field] for part in valid if part.get(field)), None)
+        merged["total_amount"] = next(
+            (part["total_amount"] for part in reversed(valid) if part.get("total_amount")), None
+        )
+
+        products = []
+        previous_keys: Dict[tuple, int] = {}
+        valid_ids = {id(part) for part in valid}
+        for i, part in enumerate(results):
+            if id(part) not in valid_ids:
+                previous_keys = {}
+                continue
+            # Parts overlap by a few lines where a page had to be cut
+            overlap = chunk_overlap(chunks[i - 1], chunks[i]).lower() if chunks and i > 0 else ""
+            keys: Dict[tuple, int] = {}
+            for product in part.get("products") or []:
+                key = self._product_key(product)
+                keys[key] = keys.get(key, 0) + 1
+                if previous_keys.get(key) and self._in_overlap(product, overlap):
+                    previous_keys[key] -= 1
+                    continue
+                products.append(product)
+            previous_keys = keys
+        merged["products"] = products
+
+        notes = []
+        for part in agreeing:
+            note = part.get("special_notes")
+            if note and note not in notes:
+                notes.append(note)
+        failed = len(results) - len(parts) + sum(1 for part in parts if part.get("analysis_failed"))
+        if failed:
+            notes.append(
+                f"{failed} de {len(results)} partes del documento no se pudieron interpretar, "
+                f"revisa el documento manualmente."
+            )
+        merged["special_notes"] = " ".join(notes) or None
+
+        confidences = [part.get("confidence", "low") for part in agreeing]
+        merged["confidence"] = (
+            "low" if failed else min(confidences, key=CONFIDENCE_LEVELS.index, default="low")
+        )
+        if failed == len(results):
+            merged["analysis_failed"] = True
+
+        models = [part["model"] for part in parts if part.get("model") in self.models]
+        merged.update({
+            "sender_email": sender_email,
+            "filename": filename,
+            "parts": len(results),
+            "model": max(models, key=self.models.index, default=self.model),
+            "escalated": any(part.get("escalated") for part in parts),
+        })
+        for key in ("tokens_used", "cache_read_tokens", "cache_write_tokens"):
+            merged[key] = sum(part.get(key, 0) for part in parts)
+
+        metrics.increment("pdf_chunked_analyses")
+        metrics.observe("pdf_chunks_per_document", len(results))
+        logger.info(
+            f"Merged {len(results)} parts of {filename}: {len(products)} products, "
+            f"Is PO: {is_purchase_order}"
+        )
+        return merged
+
+    @staticmethod
+    def _product_key(product: Dict) -> tuple:
+        return tuple(
+            " ".join(str(product.get(field) or "").lower().split())
+            for field in ("name", "quantity", "unit_price")
+        )
+
+    @staticmethod
+    def _in_overlap(product: Dict, overlap: str) -> bool:
+        """True if a line item's name appears in the overlapping lines of two parts"""
+        words = [word for word in str(product.get("name") or "").lower().split() if len(word) > 2]
+        return bool(overlap) and bool(words) and all(word in overlap for word in words)
+
+    def _run_with_escalation(
+        self, build_request: Callable[[str], Dict], handler: Callable,
+        escalation_reason: Callable[[Dict], Optional[str]]
+    ) -> Optional[Dict]:
+        """
+        Run an analysis on the first model tier, escalating to the next tier while
+        the result needs it (low confidence, invalid output or missing fields)
+
+        Args:
+            build_request: Builds the request for a given model
+            handler: Parses a response into a result dict
+            escalation_reason: Returns why a result needs escalation, or None
+
+        Returns:
+            Result of the last model that ran, with the tokens of every tier; if
+            an escalated call fails, the result of the tier below it
+        """
+        spent = {}
+        kept = None
+        for tier, model in enumerate(self.models):
+            try:
+                analysis_result = self._run_request(build_request(model), handler)
+            except Exception as e:
+                if kept is None:
+                    raise
+                logger.error(f"Escalated analysis on {model} failed: {str(e)}")
+                analysis_result = None
+            if kept is not None and self._escalation_failed(analysis_result):
+                return self._keep_lower_tier(kept, analysis_result)
+            spent_before = dict(spent)
+            if not self._should_escalate(analysis_result, tier, escalation_reason, spent):
+                break
+            kept = (analysis_result, model, tier, spent_before)
+        return self._with_tier_usage(analysis_result, spent, model, tier)
+
+    async def _run_with_escalation_async(
+        self, build_request: Callable[[str], Dict], handler: Callable,
+        escalation_reason: Callable[[Dict], Optional[str]]
+    ) -> Optional[Dict]:
+        """Async version of _run_with_escalation"""
+        spent = {}
+        kept = None
+        for tier, model in enumerate(self.models):
+            try:
+                analysis_result = await self._run_request_async(build_request(model), handler)
+            except Exception as e:
+                if kept is None:
+                    raise
+                logger.error(f"Escalated analysis on {model} failed: {str(e)}")
+                analysis_result = None
+            if kept is not None and self._escalation_failed(analysis_result):
+                return self._keep_lower_tier(kept, analysis_result)
+            spent_before = dict(spent)
+            if not self._should_escalate(analysis_result, tier, escalation_reason, spent):
+                break
+            kept = (analysis_result, model, tier, spent_before)
+        return self._with_tier_usage(analysis_result, spent, model, tier)
+
+    @staticmethod
+    def _escalation_failed(analysis_result: Optional[Dict]) -> bool:
+        """True if an escalated call gave nothing better than the tier below"""
+        return not analysis_result or bool(analysis_result.get("analysis_failed"))
+
+    def _keep_lower_tier(self, kept: tuple, failed_result: Optional[Dict]) -> Optional[Dict]:
+        """Return the result of the tier below a failed escalation, adding the failed call's tokens"""
+        analysis_result, model, tier, spent = kept
+        logger.warning(f"Escalation from {model} failed, keeping its result")
+        metrics.increment("claude_escalation_failures")
+        for key in ("tokens_used", "cache_read_tokens", "cache_write_tokens"):
+            spent[key] = spent.get(key, 0) + (failed_result or {}).get(key, 0)
+        return self._with_tier_usage(analysis_result, spent, model, tier)
+
+    def _should_escalate(
+        self, analysis_result: Optional[Dict], tier: int,
+        escalation_reason: Callable[[Dict], Optional[str]], spent: Dict
+    ) -> bool:
+        """Decide whether to retry a result on the next model tier, recording escalation rates"""
+        reason = None
+        if analysis_result and tier + 1 < len(self.models):
+            reason = escalation_reason(analysis_result)
+
+        metrics.increment(f"claude_tier{tier}_analyses")
+        if reason is not None:
+            metrics.increment(f"claude_tier{tier}_escalations")
+        # Share of this tier's results that had to go to the next one
+        metrics.set_gauge(
+            f"claude_tier{tier}_escalation_rate",
+            metrics.get_counter(f"claude_tier{tier}_escalations")
+            / metrics.get_counter(f"claude_tier{tier}_analyses"),
+        )
+        if reason is None:
+            return False
+
+        for key in ("tokens_used", "cache_read_tokens", "cache_write_tokens"):
+            spent[key] = spent.get(key, 0) + analysis_result.get(key, 0)
+
+        logger.info(f"Escalating analysis to {self.models[tier + 1]}: {reason}")
+        return True
+
+    @staticmethod
+    def _with_tier_usage(
+        analysis_result: Optional[Dict], spent: Dict, model: str, tier: int
+    ) -> Optional[Dict]:
+        """Add the tokens spent on lower tiers and the model that produced the result"""
+        if analysis_result:
+            for key, value in spent.items():
+                analysis_result[key] = analysis_result.get(key, 0) + value
+            analysis_result["model"] = model
+            analysis_result["escalated"] = tier > 0
+        return analysis_result
+
+    @staticmethod
+    def _purchase_order_escalation_reason(analysis_result: Dict) -> Optional[str]:
+        """Why a purchase order result needs a stronger model, or None"""
+        if analysis_result.get("analysis_failed"):
+            return "invalid response"
+        if analysis_result.get("confidence") in config.CLAUDE_ESCALATION_CONFIDENCE:
+            return f"{analysis_result.get('confidence')} confidence"
+        if config.CLAUDE_ESCALATE_ON_MISSING_FIELDS and analysis_result.get("is_purchase_order"):
+            if not analysis_result.get("order_number"):
+                return "missing PO number"
+            if not analysis_result.get("products"):
+                return "missing line items"
+        return None
+
+    @staticmethod
+    def _part_escalation_reason(analysis_result: Dict) -> Optional[str]:
+        """Why the analysis of a document part needs a stronger model (header fields may be elsewhere)"""
+        if analysis_result.get("analysis_failed"):
+            return "invalid response"
+        if analysis_result.get("confidence") in config.CLAUDE_ESCALATION_CONFIDENCE:
+            return f"{analysis_result.get('confidence')} confidence"
+        return None
+
+    @staticmethod
+    def _email_escalation_reason(analysis_result: Dict) -> Optional[str]:
+        """Why an email analysis result needs a stronger model, or None"""
+        if analysis_result.get("analysis_failed"):
+            return "invalid response"
+        if analysis_result.get("confianza") in config.CLAUDE_ESCALATION_CONFIDENCE:
+            return f"{analysis_result.get('confianza')} confidence"
+        return None
+
+    def _preclassify(
+        self, classifier: Optional[PreClassifier], text: str, subject: str = ""
+    ) -> Optional[Dict]:
+        """Run a pre-classifier if enabled; returns its decision or None"""
+        if classifier is None:
+            return None
+        decision = classifier.classify(text, subject)
+        logger.debug(
+            f"Pre-classifier ({classifier.kind}): p={decision['probability']:.3f}, "
+            f"skip={decision['skip']}, audit={decision['audit']}"
+        )
+        return decision
+
+    def _record_outcome(
+        self, classifier: Optional[PreClassifier], decision: Optional[Dict],
+        analysis_result: Optional[Dict], is_order: Callable[[Dict], bool]
+    ):
+        """Feed Claude's label for a pre-classified document back to the classifier"""
+        if decision is None or not analysis_result or analysis_result.get("analysis_failed"):
+            return
+        classifier.record_outcome(decision, is_order(analysis_result))
+
+    def _preclassified_purchase_order(
+        self, decision: Dict, sender_email: str, filename: str
+    ) -> Dict:
+        """Result for a document the pre-classifier identified as a non-order"""
+        reason = REASON_LABELS.get(decision["reason"], decision["reason"])
+        logger.info(
+            f"Skipping Claude for {filename}: looks like {decision['reason']} "
+            f"(p={decision['probability']:.3f})"
+        )
+        self.usage_ledger.record(
+            self.model, "purchase_order", "preclassified", sender_email=sender_email
+        )
+        return {
+            "is_purchase_order": False,
+            "special_notes": f"Clasificado localmente como {reason} (sin análisis de Claude)",
+            "confidence": "medium",
+            "products": [],
+            "preclassified": True,
+            "sender_email": sender_email,
+            "filename": filename,
+            "tokens_used": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+        }
+
+    def _preclassified_email(self, decision: Dict, sender_email: str, subject: str) -> Dict:
+        """Result for an email body the pre-classifier identified as not business relevant"""
+        reason = REASON_LABELS.get(decision["reason"], decision["reason"])
+        logger.info(
+            f"Skipping Claude for email '{subject}': looks like {decision['reason']} "
+            f"(p={decision['probability']:.3f})"
+        )
+        self.usage_ledger.record(
+            self.model, "email_analysis", "preclassified", sender_email=sender_email
+        )
+        return {
+            "tipo_mensaje": "otro",
+            "productos_mencionados": [],
+            "urgencia": "baja",
+            "notas_importantes": f"Clasificado localmente como {reason} (sin análisis de Claude)",
+            "requiere_respuesta": False,
+            "confianza": "medium",
+            "preclassified": True,
+            "sender_email": sender_email,
+            "subject": subject,
+            "tokens_used": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+        }
+
+    def _build_purchase_order_request(
+        self, pdf_text: str, sender_email: str, filename: str, model: Optional[str] = None
+    ) -> Dict:
+        """Build the Messages API request for a purchase order analysis (default model tier if None)"""
+        # Keep only the most relevant lines within the token budget to optimize costs;
+        # with chunked analysis a document that fits one chunk is sent whole
+        token_budget = config.PDF_TEXT_TOKEN_BUDGET
+        if config.PDF_CHUNKED_ANALYSIS:
+            token_budget = max(token_budget, config.PDF_CHUNK_TOKEN_BUDGET)
+        text_sample = select_relevant_text(pdf_text, token_budget)
+
+        logger.info(f"Analyzing PDF: {filename} from {sender_email}")
+        logger.debug(f"Text length: {len(text_sample)} characters")
+
+        prompt = self._build_analysis_prompt(text_sample, sender_email, filename)
+
+        return {
+            "model": model or self.model,
+            "max_tokens": 1024,
+            **self._tool_request_fields(
+                COMPACT_PURCHASE_ORDER_TOOL if self.compact_responses else PURCHASE_ORDER_TOOL
+            ),
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def _build_purchase_order_part_request(
+        self, chunk: str, part: int, total_parts: int, sender_email: str, filename: str,
+        model: Optional[str] = None
+    ) -> Dict:
+        """Build the Messages API request for one part of a chunked purchase order analysis"""
+        prompt = f"""Analyze part {part} of {total_parts} of the following document that may be a purchase order.
+
+Sender: {sender_email}
+Filename: {filename}
+
+Content of part {part}:
+{chunk}"""
+
+        return {
+            "model": model or self.model,
+            "max_tokens": PART_MAX_TOKENS,
+            "system": self._build_system_prompt(PURCHASE_ORDER_PART_INSTRUCTIONS),
+            "tools": [PURCHASE_ORDER_PART_TOOL],
+            "tool_choice": {"type": "tool", "name": PURCHASE_ORDER_PART_TOOL["name"]},
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def _handle_purchase_order_response(
+        self, message, sender_email: str, filename: str,
+        tool_name: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Validate a purchase order analysis response and attach request metadata
+
+        An invalid response yields a result flagged for manual review (not
+        announced as a purchase order), so the email is still notified instead
+        of re-analyzed every cycle.
+        """
+        # Log token usage for cost tracking
+        usage = self._log_usage(message, "Claude API call")
+
+        tool_name = tool_name or self._called_tool(message, PURCHASE_ORDER_TOOL_NAMES)
+        analysis_result, errors = self._validate_tool_input(message, tool_name)
+        if analysis_result is None:
+            logger.error(f"Invalid purchase order analysis for {filename}: {errors}")
+            metrics.increment("llm_invalid_responses")
+            analysis_result = {
+                "is_purchase_order": False,
+                "products": [],
+                "special_notes": "No se pudo interpretar el análisis automático, revisa el documento manualmente.",
+                "confidence": "low",
+                "analysis_failed": True,
+            }
+
+        analysis_result["sender_email"] = sender_email
+        analysis_result["filename"] = filename
+        analysis_result.update(usage)
+
+        logger.info(
+            f"Analysis complete. Is PO: {analysis_result.get('is_purchase_order')}"
+        )
+
+        return analysis_result
+
     def _build_analysis_prompt(
         self, text: str, sender_email: str, filename: str
     ) -> str:
-        """Build the prompt for Claude API"""
+        """Build the per-document prompt for Claude API (instructions go in the system prompt)"""
         return f"""Analyze the following document that may be a purchase order.
 
 Sender: {sender_email}
 Filename: {filename}
 
 Document content:
-{text}
-
-Extract the following information and respond ONLY with valid JSON:
-
-{{
-    "is_purchase_order": true/false,
-    "client_name": "company or client name",
-    "order_number": "PO number or null",
-    "order_date": "date or null",
-    "products": [
-        {{
-            "name": "product name",
-            "quantity": "quantity with units",
-            "unit_price": "price or null"
-        }}
-    ],
-    "total_amount": "total amount or null",
-    "special_notes": "any important notes or null",
-    "confidence": "high/medium/low"
-}}
-
-If this is NOT a purchase order, set is_purchase_order to false and briefly explain what it is in special_notes.
-Respond with ONLY valid JSON, no additional text."""
-
-    def _parse_claude_response(self, response_text: str) -> Optional[Dict]:
-        """Parse Claude's JSON response"""
-        try:
-            # Find JSON in response
-            start_idx = response_text.find("{")
-            end_idx = response_text.rfind("}") + 1
+{text}"""
 
-            if start_idx == -1 or end_idx == 0:
-                logger.error("No JSON found in Claude response")
-                return None
+    def _tool_request_fields(self, tool: Dict) -> Dict:
+        """System prompt, tools and forced tool choice of a request answered by calling tool"""
+        _, _, instructions = TOOL_SPECS[tool["name"]]
+        return {
+            "system": self._build_system_prompt(instructions),
+            "tools": [tool],
+            "tool_choice": {"type": "tool", "name": tool["name"]},
+        }
 
-            json_text = response_text[start_idx:end_idx]
-            result = json.loads(json_text)
+    def _build_system_prompt(self, instructions: str) -> List[Dict]:
+        """Build a system prompt, marking it as a prompt cache breakpoint if enabled"""
+        block = {"type": "text", "text": instructions}
+        if config.CLAUDE_PROMPT_CACHING:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [block]
 
-            logger.debug("Successfully parsed Claude JSON response")
-            return result
+    def _log_usage(self, message, label: str) -> Dict:
+        """Log the token usage of a response
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Claude response as JSON: {str(e)}")
-            logger.debug(f"Response text: {response_text}")
-            return None
+        Returns:
+            Dict with tokens_used (input + output), cache_read_tokens and cache_write_tokens
+        """
+        usage = message.usage
+        input_tokens = usage.input_tokens
+        output_tokens = usage.output_tokens
+        cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+
+        logger.info(
+            f"{label} completed. Tokens: {input_tokens} input, {output_tokens} output, "
+            f"{cache_read_tokens} cache read, {cache_write_tokens} cache write"
+        )
+
+        return {
+            "tokens_used": input_tokens + output_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
+        }
 
     def format_for_whatsapp(self, analysis: Dict) -> str:
         """
@@ -146,6 +1210,16 @@ Respond with ONLY valid JSON, no additional text."""
         Returns:
             Formatted WhatsApp message
         """
+        if analysis.get("analysis_failed"):
+            # Claude's answer could not be interpreted: neither an order nor a non-order
+            return f"""🔍 DOCUMENTO POR REVISAR MANUALMENTE
+
+👤 Cliente: {analysis.get('client_name') or 'Desconocido'}
+📧 De: {analysis.get('sender_email', 'Desconocido')}
+📎 Archivo: {analysis.get('filename', 'Desconocido')}
+
+ℹ️ {analysis.get('special_notes') or 'No se pudo interpretar el análisis automático.'}"""
+
         if not analysis.get("is_purchase_order", False):
             # Not a purchase order
             return f"""⚠️ DOCUMENTO RECIBIDO (No es orden de compra)
@@ -218,74 +1292,502 @@ Respond with ONLY valid JSON, no additional text."""
             Dictionary with extracted information or None if analysis fails
         """
         try:
-            # Limit text to first 2000 characters to optimize costs
-            text_sample = email_body[:2000] if len(email_body) > 2000 else email_body
+            decision = self._preclassify(self.email_classifier, email_body, subject)
+            if decision and decision["skip"]:
+                return self._preclassified_email(decision, sender_email, subject)
 
-            logger.info(f"Analyzing email content from {sender_email}")
-            logger.debug(f"Email body length: {len(text_sample)} characters")
+            analysis_result = self._run_with_escalation(
+                lambda model: self._build_email_analysis_request(email_body, sender_email, subject, model),
+                lambda message: self._handle_email_analysis_response(message, sender_email, subject),
+                self._email_escalation_reason,
+            )
 
-            prompt = f"""Analiza el siguiente correo electrónico de un cliente y extrae información relevante de negocio.
+            self._record_outcome(
+                self.email_classifier, decision, analysis_result,
+                lambda result: result["tipo_mensaje"] != "otro",
+            )
+            return analysis_result
+
+        except Exception as e:
+            logger.error(f"Error analyzing email with Claude: {str(e)}")
+            return None
+
+    async def analyze_email_content_async(
+        self, email_body: str, sender_email: str, subject: str
+    ) -> Optional[Dict]:
+        """
+        Async version of analyze_email_content
+
+        Args:
+            email_body: Text content of the email
+            sender_email: Email address of sender
+            subject: Email subject line
+
+        Returns:
+            Dictionary with extracted information or None if analysis fails
+        """
+        try:
+            decision = self._preclassify(self.email_classifier, email_body, subject)
+            if decision and decision["skip"]:
+                return self._preclassified_email(decision, sender_email, subject)
+
+            analysis_result = await self._run_with_escalation_async(
+                lambda model: self._build_email_analysis_request(email_body, sender_email, subject, model),
+                lambda message: self._handle_email_analysis_response(message, sender_email, subject),
+                self._email_escalation_reason,
+            )
+
+            self._record_outcome(
+                self.email_classifier, decision, analysis_result,
+                lambda result: result["tipo_mensaje"] != "otro",
+            )
+            return analysis_result
+
+        except Exception as e:
+            logger.error(f"Error analyzing email with Claude: {str(e)}")
+            return None
+
+    def _build_email_analysis_request(
+        self, email_body: str, sender_email: str, subject: str, model: Optional[str] = None
+    ) -> Dict:
+        """Build the Messages API request for an email body analysis (default model tier if None)"""
+        # Keep only the most relevant lines within the token budget to optimize costs
+        text_sample = select_relevant_text(email_body, config.EMAIL_TEXT_TOKEN_BUDGET)
+
+        logger.info(f"Analyzing email content from {sender_email}")
+        logger.debug(f"Email body length: {len(text_sample)} characters")
+
+        prompt = self._build_email_analysis_prompt(text_sample, sender_email, subject)
+
+        return {
+            "model": model or self.model,
+            "max_tokens": 1024,
+            **self._tool_request_fields(
+                COMPACT_EMAIL_ANALYSIS_TOOL if self.compact_responses else EMAIL_ANALYSIS_TOOL
+            ),
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def _build_email_analysis_prompt(
+        self, text: str, sender_email: str, subject: str
+    ) -> str:
+        """Build the per-email prompt for Claude API (instructions go in the system prompt)"""
+        return f"""Analiza el siguiente correo electrónico de un cliente.
 
 Remitente: {sender_email}
 Asunto: {subject}
 
 Contenido del correo:
-{text_sample}
-
-Extrae la información más importante y responde SOLO con JSON válido:
-
-{{
-    "tipo_mensaje": "orden_compra/cotizacion/consulta/reclamo/otro",
-    "productos_mencionados": [
-        {{
-            "nombre": "nombre del producto",
-            "cantidad": "cantidad con unidades o null",
-            "especificaciones": "detalles adicionales o null"
-        }}
-    ],
-    "fecha_entrega": "fecha solicitada o null",
-    "numero_orden": "número de OC mencionado o null",
-    "urgencia": "urgente/normal/baja",
-    "notas_importantes": "resumen de puntos clave del correo",
-    "requiere_respuesta": true/false,
-    "confianza": "high/medium/low"
-}}
-
-IMPORTANTE: Extrae solo información explícitamente mencionada en el correo.
-Responde con SOLO JSON válido, sin texto adicional."""
-
-            # Call Claude API
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                messages=[{"role": "user", "content": prompt}],
+{text}"""
+
+    def _handle_email_analysis_response(
+        self, message, sender_email: str, subject: str
+    ) -> Optional[Dict]:
+        """Validate an email analysis response and attach request metadata
+
+        An invalid response yields a low-confidence result flagged for manual review.
+        """
+        # Log token usage
+        usage = self._log_usage(message, "Email analysis")
+
+        analysis_result, errors = self._validate_tool_input(
+            message, self._called_tool(message, EMAIL_ANALYSIS_TOOL_NAMES)
+        )
+        if analysis_result is None:
+            logger.error(f"Invalid email analysis for '{subject}': {errors}")
+            metrics.increment("llm_invalid_responses")
+            analysis_result = {
+                "tipo_mensaje": "otro",
+                "productos_mencionados": [],
+                "notas_importantes": "No se pudo interpretar el análisis automático, revisa el correo manualmente.",
+                "requiere_respuesta": True,
+                "confianza": "low",
+                "analysis_failed": True,
+            }
+
+        analysis_result["sender_email"] = sender_email
+        analysis_result["subject"] = subject
+        analysis_result.update(usage)
+
+        logger.info(
+            f"Email analysis complete. Type: {analysis_result.get('tipo_mensaje')}"
+        )
+
+        return analysis_result
+
+    def analyze_email_with_attachments(
+        self, email_body: str, documents: List[Dict], sender_email: str, subject: str
+    ) -> Optional[Tuple[List[Optional[Dict]], Optional[Dict]]]:
+        """
+        Analyze an email body and all of its PDF texts in a single Claude call
+
+        Args:
+            email_body: Text content of the email (may be empty)
+            documents: List of dicts with 'filename' and extracted 'text'
+            sender_email: Email address of sender
+            subject: Email subject line
+
+        Returns:
+            Tuple of (PO analyses in the same order as documents, email analysis),
+            or None if the request exceeds the token budget or analysis fails
+        """
+        try:
+            request = self._build_combined_request(email_body, documents, sender_email, subject)
+            if request is None:
+                return None
+
+            return self._run_request(
+                request,
+                lambda message: self._handle_combined_response(
+                    message, email_body, documents, sender_email, subject
+                ),
             )
 
-            # Extract response
-            response_text = message.content[0].text
+        except Exception as e:
+            logger.error(f"Error running combined analysis with Claude: {str(e)}")
+            return None
+
+    async def analyze_email_with_attachments_async(
+        self, email_body: str, documents: List[Dict], sender_email: str, subject: str
+    ) -> Optional[Tuple[List[Optional[Dict]], Optional[Dict]]]:
+        """
+        Async version of analyze_email_with_attachments
 
-            # Log token usage
-            input_tokens = message.usage.input_tokens
-            output_tokens = message.usage.output_tokens
+        Args:
+            email_body: Text content of the email (may be empty)
+            documents: List of dicts with 'filename' and extracted 'text'
+            sender_email: Email address of sender
+            subject: Email subject line
+
+        Returns:
+            Tuple of (PO analyses in the same order as documents, email analysis),
+            or None if the request exceeds the token budget or analysis fails
+        """
+        try:
+            request = self._build_combined_request(email_body, documents, sender_email, subject)
+            if request is None:
+                return None
+
+            return await self._run_request_async(
+                request,
+                lambda message: self._handle_combined_response(
+                    message, email_body, documents, sender_email, subject
+                ),
+            )
+
+        except Exception as e:
+            logger.error(f"Error running combined analysis with Claude: {str(e)}")
+            return None
+
+    def _build_combined_request(
+        self, email_body: str, documents: List[Dict], sender_email: str, subject: str
+    ) -> Optional[Dict]:
+        """Build a single request covering the email body and every attachment
+
+        Returns:
+            Request dict, or None if the prompt exceeds COMBINED_ANALYSIS_MAX_TOKENS
+        """
+        body_sample = (
+            select_relevant_text(email_body, config.EMAIL_TEXT_TOKEN_BUDGET) if email_body else ""
+        )
+
+        long_documents = [
+            document["filename"] for document in documents
+            if len(self._split_for_analysis(document["text"])) > 1
+        ]
+        if long_documents:
             logger.info(
-                f"Email analysis completed. Tokens: {input_tokens} input, "
-                f"{output_tokens} output"
+                f"{', '.join(long_documents)} need(s) a chunked analysis, "
+                f"analyzing attachments separately"
             )
+            return None
 
-            # Parse JSON response
-            analysis_result = self._parse_claude_response(response_text)
+        attachment_sections = []
+        for i, document in enumerate(documents, 1):
+            attachment_sections.append(
+                f"--- Attachment {i}: {document['filename']} ---\n"
+                f"{select_relevant_text(document['text'], config.PDF_TEXT_TOKEN_BUDGET)}"
+            )
 
-            if analysis_result:
-                analysis_result["sender_email"] = sender_email
-                analysis_result["subject"] = subject
-                analysis_result["tokens_used"] = input_tokens + output_tokens
+        prompt = self._build_combined_prompt(
+            body_sample, "\n\n".join(attachment_sections), sender_email, subject
+        )
 
-                logger.info(
-                    f"Email analysis complete. Type: {analysis_result.get('tipo_mensaje')}"
-                )
+        estimated_tokens = estimate_tokens(COMBINED_ANALYSIS_INSTRUCTIONS + prompt)
+        if estimated_tokens > config.COMBINED_ANALYSIS_MAX_TOKENS:
+            logger.info(
+                f"Combined prompt too large (~{estimated_tokens} tokens > "
+                f"{config.COMBINED_ANALYSIS_MAX_TOKENS}), analyzing attachments separately"
+            )
+            return None
 
-            return analysis_result
+        logger.info(
+            f"Analyzing email from {sender_email} with {len(documents)} attachment(s) "
+            f"in a single request (~{estimated_tokens} tokens)"
+        )
+
+        return {
+            "model": self.model,
+            # Each attachment needs room for its own PO object
+            "max_tokens": min(1024 * (len(documents) + 1), 4096),
+            "system": self._build_system_prompt(COMBINED_ANALYSIS_INSTRUCTIONS),
+            "tools": [COMBINED_ANALYSIS_TOOL],
+            "tool_choice": {"type": "tool", "name": COMBINED_ANALYSIS_TOOL["name"]},
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def _build_combined_prompt(
+        self, body: str, attachments: str, sender_email: str, subject: str
+    ) -> str:
+        """Build the per-email combined prompt for Claude API (instructions go in the system prompt)"""
+        return f"""Analyze the following customer email and its PDF attachments.
+
+Sender: {sender_email}
+Subject: {subject}
+
+Email body:
+{body or "(empty)"}
+
+Attachments:
+{attachments}"""
+
+    def _handle_combined_response(
+        self, message, email_body: str, documents: List[Dict], sender_email: str, subject: str
+    ) -> Optional[Tuple[List[Optional[Dict]], Optional[Dict]]]:
+        """Split a combined response into per-attachment and email analyses
+
+        Returns None if the response is invalid or does not have one analysis
+        per attachment, so attachments are analyzed separately.
+        """
+        usage = self._log_usage(message, "Combined analysis")
+
+        result, errors = self._validate_tool_input(message, COMBINED_ANALYSIS_TOOL["name"])
+        if result is None:
+            logger.error(f"Invalid combined analysis: {errors}")
+            metrics.increment("llm_invalid_responses")
+            return None
+
+        # Spread token usage over the results produced by this single call
+        num_results = max(len(documents) + (1 if email_body else 0), 1)
+        usage_share = {key: value // num_results for key, value in usage.items()}
+
+        # Attachments are matched by position (as the instructions ask), since
+        # several attachments may share a filename (e.g. "OC.pdf")
+        attachments = result["attachments"]
+        if len(attachments) != len(documents):
+            logger.error(
+                f"Combined analysis returned {len(attachments)} attachment(s) for "
+                f"{len(documents)} PDF(s), analyzing attachments separately"
+            )
+            metrics.increment("llm_invalid_responses")
+            return None
+
+        pdf_analyses = []
+        for document, analysis in zip(documents, attachments):
+            analysis["sender_email"] = sender_email
+            analysis["filename"] = document["filename"]
+            analysis.update(usage_share)
+            pdf_analyses.append(analysis)
+
+        email_analysis = result["email_context"] if email_body else None
+        if email_analysis is not None:
+            email_analysis["sender_email"] = sender_email
+            email_analysis["subject"] = subject
+            email_analysis.update(usage_share)
+
+        logger.info(
+            f"Combined analysis complete. POs: "
+            f"{[a.get('is_purchase_order') if a else None for a in pdf_analyses]}"
+        )
+
+        return pdf_analyses, email_analysis
+
+    def queue_purchase_order(
+        self, custom_id: str, pdf_text: str, sender_email: str, filename: str
+    ):
+        """
+        Queue a purchase order analysis for the next Message Batch
+
+        Args:
+            custom_id: Identifier used to route the result back (^[a-zA-Z0-9_-]{1,64}$)
+            pdf_text: Extracted text from PDF
+            sender_email: Email address of sender
+            filename: Name of the PDF file
+        """
+        self._batch_queue.append({
+            "custom_id": custom_id,
+            "kind": "purchase_order",
+            "sender_email": sender_email,
+            "label": filename,
+            "params": self._build_purchase_order_request(pdf_text, sender_email, filename),
+        })
+
+    def queue_email_content(
+        self, custom_id: str, email_body: str, sender_email: str, subject: str
+    ):
+        """
+        Queue an email body analysis for the next Message Batch
+
+        Args:
+            custom_id: Identifier used to route the result back (^[a-zA-Z0-9_-]{1,64}$)
+            email_body: Text content of the email
+            sender_email: Email address of sender
+            subject: Email subject line
+        """
+        self._batch_queue.append({
+            "custom_id": custom_id,
+            "kind": "email_content",
+            "sender_email": sender_email,
+            "label": subject,
+            "params": self._build_email_analysis_request(email_body, sender_email, subject),
+        })
+
+    def submit_batch(self) -> Optional[str]:
+        """
+        Submit all queued analyses as a single Message Batch
+
+        Returns:
+            Batch ID, or None if nothing was queued or the submission failed
+            (the queue is cleared either way)
+        """
+        queued, self._batch_queue = self._batch_queue, []
+        if not queued:
+            return None
+
+        try:
+            batch = self.client.messages.batches.create(
+                requests=[
+                    {"custom_id": item["custom_id"], "params": item["params"]}
+                    for item in queued
+                ]
+            )
+
+            self._pending_batches[batch.id] = {
+                "submitted_at": datetime.now().isoformat(),
+                "requests": {
+                    item["custom_id"]: {
+                        "kind": item["kind"],
+                        "sender_email": item["sender_email"],
+                        "label": item["label"],
+                    }
+                    for item in queued
+                },
+            }
+            self._save_batch_state()
+
+            logger.info(f"Submitted Message Batch {batch.id} with {len(queued)} request(s)")
+            return batch.id
 
         except Exception as e:
-            logger.error(f"Error analyzing email with Claude: {str(e)}")
+            logger.error(f"Error submitting Message Batch: {str(e)}")
             return None
+
+    def poll_batches(self) -> Dict[str, Optional[Dict]]:
+        """
+        Check submitted batches and collect the results of those that ended
+
+        Returns:
+            Dictionary mapping custom_id to its analysis result
+            (None for requests that errored, expired or could not be parsed)
+        """
+        results = {}
+
+        for batch_id in list(self._pending_batches):
+            try:
+                batch = self.client.messages.batches.retrieve(batch_id)
+                if batch.processing_status != "ended":
+                    logger.info(
+                        f"Message Batch {batch_id} still {batch.processing_status} "
+                        f"({batch.request_counts.processing} request(s) processing)"
+                    )
+                    continue
+
+                requests = self._pending_batches[batch_id]["requests"]
+                batch_results = {custom_id: None for custom_id in requests}
+
+                for entry in self.client.messages.batches.results(batch_id):
+                    request_info = requests.get(entry.custom_id)
+                    if request_info is None:
+                        continue
+                    request_type = (
+                        "purchase_order" if request_info["kind"] == "purchase_order"
+                        else "email_analysis"
+                    )
+                    if entry.result.type != "succeeded":
+                        logger.error(
+                            f"Batch request {entry.custom_id} did not succeed: {entry.result.type}"
+                        )
+                        self.usage_ledger.record(
+                            self.model, request_type, entry.result.type, batch=True,
+                            sender_email=request_info["sender_email"],
+                        )
+                        continue
+                    self.usage_ledger.record(
+                        entry.result.message.model, request_type, "ok",
+                        usage=entry.result.message.usage, batch=True,
+                        sender_email=request_info["sender_email"],
+                    )
+                    batch_results[entry.custom_id] = self._handle_batch_result(
+                        entry.result.message, request_info
+                    )
+
+                results.update(batch_results)
+                del self._pending_batches[batch_id]
+                self._save_batch_state()
+
+                logger.info(f"Collected results of Message Batch {batch_id}")
+
+            except Exception as e:
+                logger.error(f"Error polling Message Batch {batch_id}: {str(e)}")
+
+        return results
+
+    def has_pending_batches(self) -> bool:
+        """Return True if submitted batches are still waiting for results"""
+        return bool(self._pending_batches)
+
+    def _handle_batch_result(self, message, request_info: Dict) -> Optional[Dict]:
+        """Validate a batch result (repairing it if needed) and parse it with the
+        handler matching its request kind"""
+        try:
+            tool_name = self._called_tool(
+                message,
+                PURCHASE_ORDER_TOOL_NAMES if request_info["kind"] == "purchase_order"
+                else EMAIL_ANALYSIS_TOOL_NAMES,
+            )
+            _, errors = self._validate_tool_input(message, tool_name)
+            if errors is not None:
+                message = self._repair(message, tool_name, errors)
+
+            if request_info["kind"] == "purchase_order":
+                return self._handle_purchase_order_response(
+                    message, request_info["sender_email"], request_info["label"]
+                )
+            return self._handle_email_analysis_response(
+                message, request_info["sender_email"], request_info["label"]
+            )
+        except Exception as e:
+            logger.error(f"Error parsing batch result: {str(e)}")
+            return None
+
+    def _load_batch_state(self) -> Dict[str, Dict]:
+        """Load submitted batches that are still waiting for results"""
+        try:
+            if self.batch_state_file.exists():
+                with open(self.batch_state_file, "r") as f:
+                    batches = json.load(f)
+                if batches:
+                    logger.info(f"Loaded {len(batches)} pending Message Batch(es)")
+                return batches
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading Message Batch state: {str(e)}")
+            return {}
+
+    def _save_batch_state(self):
+        """Persist submitted batches that are still waiting for results"""
+        try:
+            with open(self.batch_state_file, "w") as f:
+                json.dump(self._pending_batches, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving Message Batch state: {str(e)}")
@@ -14,6 +14,15 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent
 LOGS_DIR = BASE_DIR / "logs"
 PROCESSED_EMAILS_FILE = LOGS_DIR / "processed_emails.txt"
+CLAUDE_BATCHES_FILE = LOGS_DIR / "claude_batches.json"
+BATCH_PENDING_EMAILS_FILE = LOGS_DIR / "batch_pending_emails.json"
+LLM_CACHE_FILE = LOGS_DIR / "llm_cache.sqlite3"
+METRICS_FILE = LOGS_DIR / "metrics.json"
+USAGE_LEDGER_FILE = LOGS_DIR / "usage_ledger.sqlite3"
+NOTIFICATION_OUTBOX_FILE = LOGS_DIR / "notification_outbox.sqlite3"
+ATTACHMENT_SPOOL_DIR = LOGS_DIR / "attachments"
+PRECLASSIFIER_SAMPLES_FILE = LOGS_DIR / "preclassifier_samples.jsonl"
+PRECLASSIFIER_MODEL_FILE = LOGS_DIR / "preclassifier_model.json"
 
 # Ensure directories exist
 LOGS_DIR.mkdir(exist_ok=True)
@@ -26,26 +35,136 @@ IMAP_PASSWORD = os.getenv("IMAP_PASSWORD")
 
 # Claude API Configuration
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-
-# Notification Configuration (choose one: telegram or twilio)
+# Model tiers, cheapest first; later models only see results that need escalation
+DEFAULT_CLAUDE_MODELS = "claude-3-5-haiku-20241022,claude-sonnet-4-20250514"
+CLAUDE_MODELS = [
+    model.strip() for model in
+    (os.getenv("CLAUDE_MODELS") or DEFAULT_CLAUDE_MODELS).split(",")
+    if model.strip()
+]
+# Confidence values that trigger escalation, and whether POs missing their
+# number or line items are escalated too
+CLAUDE_ESCALATION_CONFIDENCE = [
+    value.strip() for value in os.getenv("CLAUDE_ESCALATION_CONFIDENCE", "low").split(",")
+    if value.strip()
+]
+CLAUDE_ESCALATE_ON_MISSING_FIELDS = os.getenv("CLAUDE_ESCALATE_ON_MISSING_FIELDS", "true").lower() == "true"
+# Ask for the compact response format (short keys, line items as arrays) to
+# reduce output tokens; see benchmark_compact_schema.py
+CLAUDE_COMPACT_RESPONSES = os.getenv("CLAUDE_COMPACT_RESPONSES", "false").lower() == "true"
+# Mark the static analysis instructions as a prompt cache breakpoint
+CLAUDE_PROMPT_CACHING = os.getenv("CLAUDE_PROMPT_CACHING", "true").lower() == "true"
+CLAUDE_MAX_CONCURRENCY = int(os.getenv("CLAUDE_MAX_CONCURRENCY", "4"))  # Requests in flight at once
+MAX_PARALLEL_EMAILS = int(os.getenv("MAX_PARALLEL_EMAILS", "5"))  # Emails analyzed at once per cycle
+# Client-side rate limits (match your API tier; 0 disables a limit) and retry policy
+CLAUDE_REQUESTS_PER_MINUTE = int(os.getenv("CLAUDE_REQUESTS_PER_MINUTE", "50"))
+CLAUDE_INPUT_TOKENS_PER_MINUTE = int(os.getenv("CLAUDE_INPUT_TOKENS_PER_MINUTE", "50000"))
+CLAUDE_MAX_RETRIES = int(os.getenv("CLAUDE_MAX_RETRIES", "5"))
+CLAUDE_BACKOFF_BASE_SECONDS = float(os.getenv("CLAUDE_BACKOFF_BASE_SECONDS", "1"))
+CLAUDE_BACKOFF_MAX_SECONDS = float(os.getenv("CLAUDE_BACKOFF_MAX_SECONDS", "60"))
+# Token budgets for the text sent to Claude (most relevant lines are kept)
+PDF_TEXT_TOKEN_BUDGET = int(os.getenv("PDF_TEXT_TOKEN_BUDGET", "1000"))
+EMAIL_TEXT_TOKEN_BUDGET = int(os.getenv("EMAIL_TEXT_TOKEN_BUDGET", "500"))
+# PDFs longer than PDF_TEXT_TOKEN_BUDGET are split into page-aligned chunks that
+# are analyzed in parallel and merged, so no line items are dropped
+PDF_CHUNKED_ANALYSIS = os.getenv("PDF_CHUNKED_ANALYSIS", "true").lower() == "true"
+PDF_CHUNK_TOKEN_BUDGET = int(os.getenv("PDF_CHUNK_TOKEN_BUDGET", "1500"))
+PDF_MAX_CHUNKS = int(os.getenv("PDF_MAX_CHUNKS", "20"))  # Chunks grow beyond the budget past this
+# Stream PO analyses and stop generating once a document is known not to be a PO
+CLAUDE_STREAM_EARLY_STOP = os.getenv("CLAUDE_STREAM_EARLY_STOP", "true").lower() == "true"
+# Local pre-classifier: documents scored below the threshold skip Claude;
+# a sample of them (audit rate) still goes to Claude to measure false negatives
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() == "true"
+PRECLASSIFIER_SKIP_THRESHOLD = float(os.getenv("PRECLASSIFIER_SKIP_THRESHOLD", "0.05"))
+PRECLASSIFIER_AUDIT_RATE = float(os.getenv("PRECLASSIFIER_AUDIT_RATE", "0.1"))
+# Analyze the email body and all its PDFs in a single request
+CLAUDE_COMBINED_ANALYSIS = os.getenv("CLAUDE_COMBINED_ANALYSIS", "false").lower() == "true"
+COMBINED_ANALYSIS_MAX_TOKENS = int(os.getenv("COMBINED_ANALYSIS_MAX_TOKENS", "8000"))
+# Send backlog emails (older than BATCH_BACKLOG_AGE_HOURS) through the Message Batches API
+# at half price; recent emails are still analyzed synchronously
+CLAUDE_BATCH_MODE = os.getenv("CLAUDE_BATCH_MODE", "false").lower() == "true"
+BATCH_BACKLOG_AGE_HOURS = float(os.getenv("BATCH_BACKLOG_AGE_HOURS", "6"))
+# Emails whose batch results have not arrived after this long are fetched again
+BATCH_RESULTS_MAX_AGE_HOURS = float(os.getenv("BATCH_RESULTS_MAX_AGE_HOURS", "48"))
+# Persistent cache of Claude responses to identical requests
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "50"))
+
+# Notification Configuration: one or more of telegram, twilio, webhook, file
+# (comma-separated); every notification is delivered to each of them
 NOTIFICATION_PROVIDER = os.getenv("NOTIFICATION_PROVIDER", "telegram").lower()
+NOTIFICATION_PROVIDERS = [p.strip() for p in NOTIFICATION_PROVIDER.split(",") if p.strip()]
+# Optional rules sending each customer's notifications to its account manager
+# (see notification_router.py); unrouted emails go to NOTIFICATION_PROVIDER
+NOTIFICATION_ROUTES_FILE = Path(os.getenv("NOTIFICATION_ROUTES_FILE", str(BASE_DIR / "notification_routes.json")))
+
+# Background notification delivery: queued notifications are retried with
+# backoff, and an email is marked as processed once its delivery is confirmed
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "100"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "2"))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", "300"))
+# Rendered notifications are kept in a persistent outbox and retried across
+# cycles until delivered or older than this
+NOTIFICATION_OUTBOX_MAX_AGE_HOURS = float(os.getenv("NOTIFICATION_OUTBOX_MAX_AGE_HOURS", "48"))
+# Bursts of non-urgent notifications are merged into digest messages, each
+# notification waiting at most this long for others to join it
+NOTIFICATION_DIGEST_ENABLED = os.getenv("NOTIFICATION_DIGEST_ENABLED", "true").lower() == "true"
+NOTIFICATION_DIGEST_MAX_DELAY_SECONDS = float(os.getenv("NOTIFICATION_DIGEST_MAX_DELAY_SECONDS", "120"))
+# Longest a message waits on provider rate limits (429 retry-after included)
+# before its delivery attempt counts as failed
+NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS = float(os.getenv("NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS", "300"))
+# A channel failing this many times in a row is not called again until the
+# reset time has passed; then a single probe decides whether it is back
+NOTIFICATION_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("NOTIFICATION_CIRCUIT_FAILURE_THRESHOLD", "5"))
+NOTIFICATION_CIRCUIT_RESET_SECONDS = float(os.getenv("NOTIFICATION_CIRCUIT_RESET_SECONDS", "60"))
+
+# Webhook channel: each notification is POSTed as JSON
+NOTIFICATION_WEBHOOK_URL = os.getenv("NOTIFICATION_WEBHOOK_URL")
+NOTIFICATION_WEBHOOK_TIMEOUT = float(os.getenv("NOTIFICATION_WEBHOOK_TIMEOUT", "10"))
+# File channel: each notification is appended as a JSON line
+NOTIFICATION_FILE_SINK = Path(os.getenv("NOTIFICATION_FILE_SINK", str(LOGS_DIR / "notifications.jsonl")))
 
 # Telegram Configuration (RECOMMENDED - Simple and reliable)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# Telegram allows ~20 messages per minute in a group chat and ~30 per second overall
+TELEGRAM_CHAT_MESSAGES_PER_MINUTE = float(os.getenv("TELEGRAM_CHAT_MESSAGES_PER_MINUTE", "20"))
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "30"))
+# Attach the original PDFs to Telegram notifications (the summary is their caption)
+TELEGRAM_ATTACH_PDFS = os.getenv("TELEGRAM_ATTACH_PDFS", "true").lower() == "true"
 
 # Twilio WhatsApp Configuration (LEGACY - Has 24h window restrictions)
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
 TWILIO_WHATSAPP_TO = os.getenv("TWILIO_WHATSAPP_TO", "whatsapp:+526141211388")
+# Messages per second sent from the WhatsApp sender (Twilio's default throughput is 1 MPS)
+TWILIO_WHATSAPP_MESSAGES_PER_SECOND = float(os.getenv("TWILIO_WHATSAPP_MESSAGES_PER_SECOND", "1"))
+# Delivery statuses of sent WhatsApp messages are fetched in bulk this often
+# (0 disables it); undelivered ones are escalated to TWILIO_ESCALATION_CHANNEL
+# if it is enabled, otherwise resent
+TWILIO_RECONCILE_INTERVAL_MINUTES = float(os.getenv("TWILIO_RECONCILE_INTERVAL_MINUTES", "10"))
+TWILIO_RECONCILE_MAX_AGE_HOURS = float(os.getenv("TWILIO_RECONCILE_MAX_AGE_HOURS", "24"))
+TWILIO_ESCALATION_CHANNEL = os.getenv("TWILIO_ESCALATION_CHANNEL", "telegram").lower()
+# A heartbeat message keeps the WhatsApp session open after this many hours
+# without messages (0 disables it)
+WHATSAPP_HEARTBEAT_HOURS = float(os.getenv("WHATSAPP_HEARTBEAT_HOURS", "48"))
 # WhatsApp Template SID (optional - for sending outside 24h window)
 # Get this from: https://console.twilio.com/us1/develop/sms/content-editor
 TWILIO_WHATSAPP_TEMPLATE_SID = os.getenv("TWILIO_WHATSAPP_TEMPLATE_SID")
 
+# PDF Processing Configuration
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "200"))  # Pages beyond this limit are ignored
+
 # Monitoring Configuration
 CHECK_INTERVAL_MINUTES = int(os.getenv("CHECK_INTERVAL_MINUTES", "10"))
 DAYS_BACK_TO_SEARCH = int(os.getenv("DAYS_BACK_TO_SEARCH", "1"))  # How many days back to search for emails
+# A monitoring cycle running longer than this is reported with the stack of
+# every thread; under systemd the watchdog then stops pinging and the service
+# is restarted (see cycle_watchdog.py)
+CYCLE_DEADLINE_MINUTES = float(os.getenv("CYCLE_DEADLINE_MINUTES", "15"))
 
 # Monitored clients
 MONITORED_CLIENTS = [
@@ -73,23 +192,28 @@ def validate_config():
         missing.append("IMAP_PASSWORD")
     if not ANTHROPIC_API_KEY:
         missing.append("ANTHROPIC_API_KEY")
+    if not CLAUDE_MODELS:
+        missing.append("CLAUDE_MODELS")
 
-    # Validate notification provider
-    if NOTIFICATION_PROVIDER == "telegram":
+    # Validate notification providers
+    invalid = [p for p in NOTIFICATION_PROVIDERS if p not in ("telegram", "twilio", "webhook", "file")]
+    if invalid or not NOTIFICATION_PROVIDERS:
+        raise ValueError(
+            f"Invalid NOTIFICATION_PROVIDER: {NOTIFICATION_PROVIDER}\n"
+            f"Must be one or more of 'telegram', 'twilio', 'webhook', 'file' (comma-separated)"
+        )
+    if "telegram" in NOTIFICATION_PROVIDERS:
         if not TELEGRAM_BOT_TOKEN:
             missing.append("TELEGRAM_BOT_TOKEN")
         if not TELEGRAM_CHAT_ID:
             missing.append("TELEGRAM_CHAT_ID")
-    elif NOTIFICATION_PROVIDER == "twilio":
+    if "twilio" in NOTIFICATION_PROVIDERS:
         if not TWILIO_ACCOUNT_SID:
             missing.append("TWILIO_ACCOUNT_SID")
         if not TWILIO_AUTH_TOKEN:
             missing.append("TWILIO_AUTH_TOKEN")
-    else:
-        raise ValueError(
-            f"Invalid NOTIFICATION_PROVIDER: {NOTIFICATION_PROVIDER}\n"
-            f"Must be 'telegram' or 'twilio'"
-        )
+    if "webhook" in NOTIFICATION_PROVIDERS and not NOTIFICATION_WEBHOOK_URL:
+        missing.append("NOTIFICATION_WEBHOOK_URL")
 
     if missing:
         raise ValueError(
@@ -109,14 +233,18 @@ def get_config_summary():
         "check_interval_minutes": CHECK_INTERVAL_MINUTES,
         "monitored_clients": MONITORED_CLIENTS,
         "anthropic_configured": bool(ANTHROPIC_API_KEY),
-        "notification_provider": NOTIFICATION_PROVIDER,
+        "notification_providers": NOTIFICATION_PROVIDERS,
     }
 
-    if NOTIFICATION_PROVIDER == "telegram":
+    if "telegram" in NOTIFICATION_PROVIDERS:
         summary["telegram_chat_id"] = TELEGRAM_CHAT_ID
         summary["telegram_configured"] = bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
-    elif NOTIFICATION_PROVIDER == "twilio":
+    if "twilio" in NOTIFICATION_PROVIDERS:
         summary["whatsapp_to"] = TWILIO_WHATSAPP_TO
         summary["twilio_configured"] = bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN)
+    if "webhook" in NOTIFICATION_PROVIDERS:
+        summary["webhook_url"] = NOTIFICATION_WEBHOOK_URL
+    if "file" in NOTIFICATION_PROVIDERS:
+        summary["notification_file"] = str(NOTIFICATION_FILE_SINK)
 
     return summary
@@ -0,0 +1,186 @@
+"""
+Cycle Watchdog Module
+Watches the monitoring cycles from a background thread. Cycle start and finish
+times are kept in memory; a cycle running past its deadline is logged with the
+stack of every thread, showing where it is stuck (e.g. an IMAP socket or a PDF).
+
+Under systemd (Type=notify with WatchdogSec) the watchdog reports READY=1 and
+pings WATCHDOG=1 while the agent is healthy. It stops pinging once a cycle
+hangs or cycles stop running, so systemd restarts the service. Periodic tasks
+that only need in-memory state (e.g. the WhatsApp heartbeat) run on the same
+thread.
+"""
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional, Tuple
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def sd_notify(state: str) -> bool:
+    """
+    Send a state (e.g. "READY=1", "WATCHDOG=1") to systemd
+
+    Returns:
+        True if sent; False when not running under systemd (no NOTIFY_SOCKET) or on error
+    """
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # Abstract namespace socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode("utf-8"))
+        return True
+    except OSError as e:
+        logger.error(f"Error notifying systemd ({state}): {str(e)}")
+        return False
+
+
+class CycleWatchdog:
+    """Background thread checking that monitoring cycles start and finish on time"""
+
+    # Longest time between checks (systemd's watchdog interval may shorten it)
+    CHECK_SECONDS = 10.0
+
+    def __init__(
+        self,
+        deadline_seconds: float = None,
+        idle_seconds: float = None,
+        periodic: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            deadline_seconds: Longest a cycle may run (defaults to config.CYCLE_DEADLINE_MINUTES)
+            idle_seconds: Longest time without a cycle running before the
+                scheduler is considered stuck (defaults to the check interval
+                plus the deadline)
+            periodic: Called on every check from the watchdog thread; must be
+                cheap and not block (e.g. deciding whether a heartbeat is due)
+        """
+        self.deadline = deadline_seconds or config.CYCLE_DEADLINE_MINUTES * 60
+        self.idle_limit = idle_seconds or config.CHECK_INTERVAL_MINUTES * 60 + self.deadline
+        self.periodic = periodic
+
+        # systemd asks for a ping at least every WATCHDOG_USEC; ping twice as often
+        watchdog_usec = int(os.environ.get("WATCHDOG_USEC", "0") or 0)
+        self.interval = self.CHECK_SECONDS
+        if watchdog_usec > 0:
+            self.interval = min(self.interval, watchdog_usec / 2_000_000)
+
+        self._lock = threading.Lock()
+        self._cycle_started: Optional[float] = None
+        self._cycle_thread: Optional[int] = None
+        self._last_finished = time.monotonic()
+        self._reported = False
+        self._healthy = True
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Tell systemd the agent is ready and start watching"""
+        self._thread = threading.Thread(target=self._run, name="cycle-watchdog", daemon=True)
+        self._thread.start()
+        if sd_notify("READY=1"):
+            logger.info(f"Notified systemd (watchdog checks every {self.interval:.0f}s)")
+        logger.info(f"Cycle watchdog started (deadline {self.deadline / 60:.0f} min)")
+
+    def stop(self):
+        """Stop watching (e.g. on shutdown)"""
+        sd_notify("STOPPING=1")
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def cycle_started(self):
+        """Record that a monitoring cycle started on the calling thread"""
+        with self._lock:
+            self._cycle_started = time.monotonic()
+            self._cycle_thread = threading.get_ident()
+            self._reported = False
+
+    def cycle_finished(self):
+        """Record that the running monitoring cycle finished"""
+        with self._lock:
+            now = time.monotonic()
+            duration = now - self._cycle_started if self._cycle_started is not None else 0.0
+            overdue = self._reported
+            self._cycle_started = None
+            self._cycle_thread = None
+            self._last_finished = now
+        metrics.observe("cycle_seconds", duration)
+        if overdue:
+            logger.warning(f"Overdue monitoring cycle finished after {duration:.0f}s")
+        sd_notify(f"STATUS=Last cycle finished at {time.strftime('%H:%M:%S')} ({duration:.0f}s)")
+
+    def check(self) -> Tuple[bool, str]:
+        """
+        Whether the agent is healthy
+
+        Returns:
+            (healthy, reason) where reason describes the problem if unhealthy
+        """
+        now = time.monotonic()
+        with self._lock:
+            started = self._cycle_started
+            last_finished = self._last_finished
+        if started is not None and now - started > self.deadline:
+            return False, f"monitoring cycle running for {now - started:.0f}s (deadline {self.deadline:.0f}s)"
+        if started is None and now - last_finished > self.idle_limit:
+            return False, f"no monitoring cycle for {now - last_finished:.0f}s"
+        return True, ""
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"Error in cycle watchdog: {str(e)}")
+
+    def _tick(self):
+        healthy, reason = self.check()
+        if healthy:
+            if not self._healthy:
+                logger.info("Monitoring cycles are back on time")
+            sd_notify("WATCHDOG=1")
+        else:
+            # Without pings systemd restarts the service after WatchdogSec
+            with self._lock:
+                report = not self._reported
+                self._reported = True
+            if report:
+                logger.error(f"Agent is stuck: {reason}")
+                metrics.increment("cycles_overdue")
+                self._dump_stacks()
+                sd_notify(f"STATUS=Stuck: {reason}")
+        self._healthy = healthy
+
+        if self.periodic is not None:
+            try:
+                self.periodic()
+            except Exception as e:
+                logger.error(f"Error in watchdog periodic task: {str(e)}")
+
+    def _dump_stacks(self):
+        """Log the stack of every thread, the cycle's thread first"""
+        with self._lock:
+            cycle_thread = self._cycle_thread
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sorted(sys._current_frames().items(), key=lambda item: item[0] != cycle_thread)
+        for ident, frame in frames:
+            if ident == threading.get_ident():
+                continue
+            label = "monitoring cycle" if ident == cycle_thread else names.get(ident, ident)
+            stack = "".join(traceback.format_stack(frame))
+            logger.error(f"Stack of thread {label}:\n{stack}")
@@ -3,15 +3,31 @@ IMAP Client Module
 Monitors email inbox for new messages from specific clients
 Detects PDF attachments and processes them
 """
+import asyncio
+import hashlib
 import imaplib
 import email
+import json
+import shutil
+import threading
+import time
 from email.header import decode_header
+from email.utils import parsedate_to_datetime
 import logging
+from pathlib import Path
 from typing import List, Dict, Optional, Set
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import config
 from pdf_processor import PDFProcessor
 from claude_analyzer import ClaudeAnalyzer
+from metrics import metrics
+from notification_channels import build_channels, fan_out
+from notification_digest import NotificationCoalescer, build_digest
+from notification_dispatcher import NotificationDispatcher
+from notification_outbox import NotificationOutbox
+from notification_router import NotificationRouter
+from twilio_reconciler import TwilioReconciler
+from usage_ledger import set_usage_context
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +35,9 @@ logger = logging.getLogger(__name__)
 class IMAPClient:
     """Monitors IMAP inbox for purchase order emails"""
 
+    # Wait before checking again after a heartbeat attempt (sent or failed)
+    HEARTBEAT_RETRY_SECONDS = 15 * 60
+
     def __init__(self):
         """Initialize IMAP client and dependencies"""
         self.server = config.IMAP_SERVER
@@ -31,21 +50,54 @@ class IMAPClient:
         self.pdf_processor = PDFProcessor()
         self.claude_analyzer = ClaudeAnalyzer()
 
-        # Initialize notification provider based on config
-        if config.NOTIFICATION_PROVIDER == "telegram":
-            from telegram_notifier import TelegramNotifier
-            self.notifier = TelegramNotifier()
-            logger.info("Using Telegram for notifications")
-        elif config.NOTIFICATION_PROVIDER == "twilio":
-            from whatsapp_notifier import WhatsAppNotifier
-            self.notifier = WhatsAppNotifier()
-            logger.info("Using Twilio WhatsApp for notifications")
-        else:
-            raise ValueError(f"Invalid notification provider: {config.NOTIFICATION_PROVIDER}")
+        # Notification channels: the default ones (NOTIFICATION_PROVIDER may list
+        # several) plus every destination of the routing rules
+        self.router = NotificationRouter.from_file()
+        self.channels = build_channels(self.router.destinations)
+
+        # Rendered notifications are stored in a persistent outbox and delivered
+        # in the background, so a delivery failure never re-runs the analysis.
+        # Every channel has its own dispatcher and digest window, so a slow or
+        # dead provider never delays the others
+        self.outbox = NotificationOutbox()
+        unconfirmed = self.outbox.recover()
+        self.dispatchers = {name: NotificationDispatcher() for name in self.channels}
+
+        # Twilio's delivery statuses are reconciled in the background, so
+        # undelivered WhatsApp messages are resent or escalated
+        self.reconciler = None
+        whatsapp_channels = [c for c in self.channels.values() if c.provider == "twilio"]
+        # All WhatsApp destinations share the sender (and its notifier)
+        self.whatsapp = whatsapp_channels[0].notifier if whatsapp_channels else None
+        if self.whatsapp is not None and config.TWILIO_RECONCILE_INTERVAL_MINUTES > 0:
+            self.reconciler = TwilioReconciler(
+                self.whatsapp.client, self.outbox, self.whatsapp.from_number, self._handle_undelivered
+            )
+            self.reconciler.start()
+        self._next_heartbeat_check = 0.0
+
+        # Non-urgent notifications to the same channel are coalesced into digests
+        self.coalescers = {}
+        if config.NOTIFICATION_DIGEST_ENABLED:
+            self.coalescers = {
+                name: NotificationCoalescer(
+                    config.NOTIFICATION_DIGEST_MAX_DELAY_SECONDS,
+                    channel.MAX_MESSAGE_LENGTH,
+                    lambda channel_name, entries: self._submit_delivery(channel_name, entries, digest=True),
+                )
+                for name, channel in self.channels.items()
+            }
 
         # Track processed emails
+        self._processed_lock = threading.Lock()
         self.processed_emails = self._load_processed_emails()
 
+        # Emails waiting for Message Batch results (see CLAUDE_BATCH_MODE)
+        self.batch_pending = self._load_batch_pending()
+
+        # Notifications interrupted by the last stop may never have arrived
+        self._alert_unconfirmed(unconfirmed)
+
         logger.info(f"IMAP Client initialized for {self.username}")
         logger.info(f"Monitoring {len(self.monitored_clients)} clients")
 
@@ -69,13 +121,37 @@ class IMAPClient:
     def _save_processed_email(self, email_id: str):
         """Save email ID as processed"""
         try:
-            self.processed_emails.add(email_id)
-            with open(config.PROCESSED_EMAILS_FILE, "a") as f:
-                f.write(f"{email_id}\n")
+            # Also called from the notification dispatcher's thread
+            with self._processed_lock:
+                self.processed_emails.add(email_id)
+                with open(config.PROCESSED_EMAILS_FILE, "a") as f:
+                    f.write(f"{email_id}\n")
             logger.info(f"Saved processed email: {email_id}")
         except Exception as e:
             logger.error(f"Error saving processed email: {str(e)}")
 
+    def _load_batch_pending(self) -> Dict[str, Dict]:
+        """Load emails whose analysis was submitted in a Message Batch"""
+        try:
+            if config.BATCH_PENDING_EMAILS_FILE.exists():
+                with open(config.BATCH_PENDING_EMAILS_FILE, "r") as f:
+                    pending = json.load(f)
+                if pending:
+                    logger.info(f"Loaded {len(pending)} email(s) waiting for batch results")
+                return pending
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading batch pending emails: {str(e)}")
+            return {}
+
+    def _save_batch_pending(self):
+        """Persist emails whose analysis was submitted in a Message Batch"""
+        try:
+            with open(config.BATCH_PENDING_EMAILS_FILE, "w") as f:
+                json.dump(self.batch_pending, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving batch pending emails: {str(e)}")
+
     def connect(self) -> Optional[imaplib.IMAP4_SSL]:
         """
         Connect to IMAP server with SSL
@@ -219,7 +295,16 @@ class IMAPClient:
         """
         Check inbox for new emails from monitored clients
         Process any PDF attachments found
+
+        New emails are fetched sequentially and analyzed in groups of
+        config.MAX_PARALLEL_EMAILS, with all Claude calls of a group running
+        concurrently. In batch mode, backlog emails are queued for a Message
+        Batch instead and notified once its results arrive.
         """
+        # Collected even with batch mode off, so emails batched before it was
+        # turned off are still notified (or released to be fetched again)
+        self._collect_batch_results()
+
         mail = self.connect()
         if not mail:
             logger.error("Cannot check emails - connection failed")
@@ -232,6 +317,10 @@ class IMAPClient:
                 logger.error("Failed to select INBOX")
                 return
 
+            pending = []
+            queued_ids = set()
+            batch_emails = {}
+
             # Check each monitored client
             for client_email in self.monitored_clients:
                 logger.info(f"Checking emails from: {client_email}")
@@ -254,9 +343,29 @@ class IMAPClient:
                 email_ids = message_ids[0].split()
                 logger.info(f"Found {len(email_ids)} new emails from {client_email}")
 
-                # Process each email
+                # Fetch each email and analyze them in parallel groups
                 for email_id in email_ids:
-                    self._process_email(mail, email_id, client_email)
+                    email_data = self._fetch_email(mail, email_id)
+                    if not email_data or email_data["message_id"] in queued_ids:
+                        continue
+
+                    if config.CLAUDE_BATCH_MODE and self._is_backlog(email_data):
+                        self._queue_for_batch(email_data, batch_emails)
+                        queued_ids.add(email_data["message_id"])
+                        continue
+
+                    pending.append(email_data)
+                    queued_ids.add(email_data["message_id"])
+
+                    if len(pending) >= config.MAX_PARALLEL_EMAILS:
+                        self._process_emails(pending)
+                        pending = []
+
+            if pending:
+                self._process_emails(pending)
+
+            if batch_emails:
+                self._submit_batch(batch_emails)
 
         except Exception as e:
             logger.error(f"Error checking emails: {str(e)}")
@@ -268,14 +377,19 @@ class IMAPClient:
             except:
                 pass
 
-    def _process_email(self, mail, email_id: bytes, expected_sender: str):
-        """Process a single email"""
+    def _fetch_email(self, mail, email_id: bytes) -> Optional[Dict]:
+        """Fetch and parse a single email
+
+        Returns:
+            Dict with message metadata, body and PDF attachments,
+            or None if the email was already processed or could not be fetched
+        """
         try:
             # Fetch email first to get Message-ID
             status, msg_data = mail.fetch(email_id, "(RFC822)")
             if status != "OK":
                 logger.error(f"Failed to fetch email {email_id.decode()}")
-                return
+                return None
 
             # Parse email
             msg = email.message_from_bytes(msg_data[0][1])
@@ -293,7 +407,11 @@ class IMAPClient:
             # Skip if already processed
             if message_id in self.processed_emails:
                 logger.info(f"Email already processed (Message-ID: {message_id[:50]}...), skipping")
-                return
+                return None
+
+            if message_id in self.batch_pending:
+                logger.info(f"Email waiting for batch results (Message-ID: {message_id[:50]}...), skipping")
+                return None
 
             # Extract metadata
             subject = self._decode_header(msg["Subject"])
@@ -314,86 +432,649 @@ class IMAPClient:
             # Get PDF attachments FIRST before marking as processed
             pdf_attachments = self._get_pdf_attachments(msg)
 
-            if not pdf_attachments:
+            return {
+                "message_id": message_id,
+                "subject": subject,
+                "sender_email": sender_email,
+                "date": date,
+                "email_body": email_body,
+                "pdf_attachments": pdf_attachments,
+            }
+
+        except Exception as e:
+            logger.error(f"Error fetching email: {str(e)}")
+            return None
+
+    def _is_backlog(self, email_data: Dict) -> bool:
+        """Return True if the email is old enough to be analyzed through a Message Batch"""
+        try:
+            received = parsedate_to_datetime(email_data["date"])
+        except (TypeError, ValueError):
+            return False
+
+        if received.tzinfo is None:
+            received = received.astimezone()
+
+        age = datetime.now(timezone.utc) - received
+        return age > timedelta(hours=config.BATCH_BACKLOG_AGE_HOURS)
+
+    def _queue_for_batch(self, email_data: Dict, batch_emails: Dict[str, Dict]):
+        """Queue the analyses of a backlog email for the next Message Batch"""
+        message_id = email_data["message_id"]
+        sender_email = email_data["sender_email"]
+        key = hashlib.sha1(message_id.encode()).hexdigest()[:16]
+
+        logger.info(f"Queueing backlog email for batch analysis: {message_id[:50]}")
+
+        # The PDF bytes are not kept with the pending email, only their spooled copies
+        attachments = self._spool_attachments(message_id, email_data["pdf_attachments"])
+
+        pdfs = []
+        for i, pdf_info in enumerate(attachments):
+            filename = pdf_info["filename"]
+            spooled = {"path": pdf_info["path"]} if pdf_info.get("path") else {}
+            pdf_text = self.pdf_processor.extract_text(pdf_info["data"], filename)
+            if pdf_text:
+                custom_id = f"{key}-pdf{i}"
+                self.claude_analyzer.queue_purchase_order(
+                    custom_id, pdf_text, sender_email, filename
+                )
+                pdfs.append({"filename": filename, "custom_id": custom_id, **spooled})
+            else:
+                logger.warning(f"Could not extract text from {filename} - likely scanned image")
+                pdfs.append({"filename": filename, "unreadable": True, **spooled})
+
+        body_custom_id = None
+        if email_data["email_body"]:
+            body_custom_id = f"{key}-body"
+            self.claude_analyzer.queue_email_content(
+                body_custom_id, email_data["email_body"], sender_email, email_data["subject"]
+            )
+
+        entry = {
+            "message_id": message_id,
+            "subject": email_data["subject"],
+            "sender_email": sender_email,
+            "date": email_data["date"],
+            "pdfs": pdfs,
+            "body_custom_id": body_custom_id,
+        }
+
+        if not body_custom_id and not any("custom_id" in pdf for pdf in pdfs):
+            # Nothing to analyze, notify right away
+            self._process_email(
+                {**entry, "pdf_attachments": pdfs}, self._batch_pdf_results(entry, {}), None
+            )
+            return
+
+        batch_emails[message_id] = entry
+
+    def _submit_batch(self, batch_emails: Dict[str, Dict]):
+        """Submit queued backlog analyses and remember which emails are waiting"""
+        batch_id = self.claude_analyzer.submit_batch()
+        if not batch_id:
+            logger.warning(
+                f"Batch submission failed, {len(batch_emails)} email(s) will be retried next cycle"
+            )
+            return
+
+        queued_at = datetime.now().isoformat()
+        for message_id, entry in batch_emails.items():
+            entry["batch_id"] = batch_id
+            entry["queued_at"] = queued_at
+            self.batch_pending[message_id] = entry
+        self._save_batch_pending()
+
+    def _collect_batch_results(self):
+        """Notify emails whose Message Batch results are available"""
+        if not self.batch_pending and not self.claude_analyzer.has_pending_batches():
+            return
+
+        results = self.claude_analyzer.poll_batches()
+
+        for message_id, entry in list(self.batch_pending.items()):
+            custom_ids = [pdf["custom_id"] for pdf in entry["pdfs"] if "custom_id" in pdf]
+            if entry["body_custom_id"]:
+                custom_ids.append(entry["body_custom_id"])
+
+            if not all(custom_id in results for custom_id in custom_ids):
+                # Batches expire after 24 hours; give up and let the email be re-fetched
+                queued_at = datetime.fromisoformat(entry["queued_at"])
+                if datetime.now() - queued_at > timedelta(hours=config.BATCH_RESULTS_MAX_AGE_HOURS):
+                    logger.warning(f"Batch results never arrived, re-queueing: {message_id[:50]}")
+                    del self.batch_pending[message_id]
+                continue
+
+            logger.info(f"Batch results ready for: {message_id[:50]}")
+            del self.batch_pending[message_id]
+            self._process_email(
+                {**entry, "pdf_attachments": entry["pdfs"]},
+                self._batch_pdf_results(entry, results),
+                results.get(entry["body_custom_id"]),
+            )
+
+        self._save_batch_pending()
+
+    def _batch_pdf_results(self, entry: Dict, results: Dict[str, Optional[Dict]]) -> List[Optional[Dict]]:
+        """Rebuild the per-PDF results of a batched email in attachment order"""
+        pdf_results = []
+        for pdf in entry["pdfs"]:
+            if pdf.get("unreadable"):
+                pdf_results.append({
+                    "unreadable": True,
+                    "filename": pdf["filename"],
+                    "sender_email": entry["sender_email"]
+                })
+            else:
+                pdf_results.append(results.get(pdf["custom_id"]))
+        return pdf_results
+
+    def _process_emails(self, emails: List[Dict]):
+        """Analyze a group of emails concurrently, then send their notifications"""
+        logger.info(f"Analyzing {len(emails)} email(s) in parallel...")
+        results = asyncio.run(self._analyze_emails_async(emails))
+
+        for email_data, result in zip(emails, results):
+            if result is None:
+                continue
+            pdf_results, email_analysis = result
+            self._process_email(email_data, pdf_results, email_analysis)
+
+    async def _analyze_emails_async(self, emails: List[Dict]) -> list:
+        """Run the analysis of several emails concurrently"""
+        try:
+            return await asyncio.gather(
+                *(self._analyze_email_async(email_data) for email_data in emails)
+            )
+        finally:
+            await self.claude_analyzer.aclose()
+
+    async def _analyze_email_async(self, email_data: Dict):
+        """Analyze all PDFs and the body of an email concurrently
+
+        Returns:
+            Tuple of (pdf_results, email_analysis), or None if an error occurred
+        """
+        try:
+            sender_email = email_data["sender_email"]
+            email_body = email_data["email_body"]
+            pdf_attachments = email_data["pdf_attachments"]
+
+            # Each email runs in its own task, so the ledger context stays per email
+            set_usage_context(sender_email=sender_email, message_id=email_data["message_id"])
+
+            if pdf_attachments:
+                logger.info(f"Found {len(pdf_attachments)} PDF(s) in email")
+            else:
                 logger.info(f"No PDF attachments found in email from {sender_email}")
 
-                # If no PDFs but we have email body, analyze it
-                if email_body:
-                    logger.info("Analyzing email body without PDF...")
-                    email_analysis = self.claude_analyzer.analyze_email_content(
-                        email_body, sender_email, subject
-                    )
-                    if email_analysis:
-                        # Send notification with email analysis
-                        success = self._send_email_only_notification(
-                            email_analysis, sender_email, subject, date
-                        )
-                        if success:
-                            self._save_processed_email(message_id)
-                            logger.info(f"Email marked as processed: {message_id[:50]}")
-                            return
-
-                # Mark as processed even without PDFs to avoid re-checking emails without attachments
-                self._save_processed_email(message_id)
-                return
+            combined_possible = len(pdf_attachments) + (1 if email_body else 0) > 1
+            if config.CLAUDE_COMBINED_ANALYSIS and combined_possible:
+                result = await self._analyze_email_combined_async(email_data)
+                if result is not None:
+                    return result
 
-            logger.info(f"Found {len(pdf_attachments)} PDF(s) in email")
-
-            # Process all PDFs and separate readable from unreadable
-            readable_pdfs = []
-            unreadable_pdfs = []
-            for pdf_info in pdf_attachments:
-                analysis_result = self._analyze_pdf(pdf_info, sender_email)
-                if analysis_result:
-                    if analysis_result.get("unreadable"):
-                        unreadable_pdfs.append(analysis_result)
-                    else:
-                        readable_pdfs.append(analysis_result)
-
-            # Analyze email body if available
-            email_analysis = None
+            tasks = [
+                self._analyze_pdf_async(pdf_info, sender_email)
+                for pdf_info in pdf_attachments
+            ]
             if email_body:
                 logger.info("Analyzing email body content...")
-                email_analysis = self.claude_analyzer.analyze_email_content(
-                    email_body, sender_email, subject
+                tasks.append(
+                    self.claude_analyzer.analyze_email_content_async(
+                        email_body, sender_email, email_data["subject"]
+                    )
                 )
 
-            # Send notifications
-            notification_sent = False
+            results = await asyncio.gather(*tasks)
 
-            # Send notification for readable PDFs (normal analysis) + email context
-            if readable_pdfs:
-                success = self._send_grouped_notification(
-                    readable_pdfs, sender_email, subject, date, email_analysis
+            pdf_results = results[:len(pdf_attachments)]
+            email_analysis = results[len(pdf_attachments)] if email_body else None
+            return pdf_results, email_analysis
+
+        except Exception as e:
+            logger.error(f"Error analyzing email: {str(e)}")
+            return None
+
+    async def _analyze_email_combined_async(self, email_data: Dict):
+        """Analyze the body and all readable PDFs of an email in a single Claude call
+
+        Returns:
+            Tuple of (pdf_results, email_analysis), or None if the combined
+            request exceeded the token budget or failed
+        """
+        sender_email = email_data["sender_email"]
+        pdf_attachments = email_data["pdf_attachments"]
+
+        # Extracted text is kept on pdf_info so a fallback doesn't extract twice
+        texts = await asyncio.gather(
+            *(self._extract_pdf_text_async(pdf_info) for pdf_info in pdf_attachments)
+        )
+        documents = [
+            {"filename": pdf_info["filename"], "text": text}
+            for pdf_info, text in zip(pdf_attachments, texts) if text
+        ]
+        if not documents and not email_data["email_body"]:
+            return None
+
+        result = await self.claude_analyzer.analyze_email_with_attachments_async(
+            email_data["email_body"], documents, sender_email, email_data["subject"]
+        )
+        if result is None:
+            return None
+
+        document_analyses, email_analysis = result
+        document_analyses = iter(document_analyses)
+
+        pdf_results = []
+        for pdf_info, text in zip(pdf_attachments, texts):
+            if text:
+                pdf_results.append(next(document_analyses))
+            else:
+                logger.warning(
+                    f"Could not extract text from {pdf_info['filename']} - likely scanned image"
                 )
-                if success:
-                    notification_sent = True
+                pdf_results.append({
+                    "unreadable": True,
+                    "filename": pdf_info["filename"],
+                    "sender_email": sender_email
+                })
+
+        return pdf_results, email_analysis
+
+    async def _extract_pdf_text_async(self, pdf_info: Dict) -> Optional[str]:
+        """Extract PDF text in a worker thread, reusing a previous extraction if present"""
+        if "text" not in pdf_info:
+            pdf_info["text"] = await asyncio.to_thread(
+                self.pdf_processor.extract_text, pdf_info["data"], pdf_info["filename"]
+            )
+        return pdf_info["text"]
+
+    def _process_email(
+        self, email_data: Dict, pdf_results: List[Optional[Dict]],
+        email_analysis: Optional[Dict]
+    ):
+        """Store the notifications of an analyzed email in the outbox and mark it as processed
+
+        Delivery happens in the background from the outbox. If the process stops
+        before the email is marked, it is analyzed again but its notifications,
+        already stored under the same keys, are not queued twice.
+        """
+        try:
+            message_id = email_data["message_id"]
+            email_data = {
+                **email_data,
+                "pdf_attachments": self._spool_attachments(message_id, email_data["pdf_attachments"]),
+            }
+
+            # Routed by sender, domain or client; one outbox entry per channel,
+            # so each channel is confirmed on its own
+            destinations = self.router.route(
+                email_data["sender_email"],
+                [result.get("client_name") for result in pdf_results if result],
+            )
+            for kind, payload in self._render_notifications(email_data, pdf_results, email_analysis):
+                for channel in destinations:
+                    key = NotificationOutbox.make_key(message_id, kind, channel)
+                    channel_payload = {**payload, "channel": channel}
+                    if self.outbox.add(key, message_id, kind, channel_payload):
+                        self._queue_delivery(key, channel_payload)
+
+            self._save_processed_email(message_id)
+            logger.info(f"Email marked as processed: {message_id[:50]}")
+
+        except Exception as e:
+            logger.error(f"Error processing email, NOT marked as processed: {str(e)}")
+
+    def _render_notifications(
+        self, email_data: Dict, pdf_results: List[Optional[Dict]],
+        email_analysis: Optional[Dict]
+    ) -> List[tuple]:
+        """Render the notifications of an analyzed email
 
-            # Send notification for unreadable PDFs (scanned images) + email analysis
-            if unreadable_pdfs:
-                success = self._send_unreadable_pdf_notification(
+        Returns:
+            List of (kind, payload) tuples; a payload holds the message text and,
+            for purchase orders, the values of the WhatsApp template
+        """
+        subject = email_data["subject"]
+        sender_email = email_data["sender_email"]
+        date = email_data["date"]
+        # Urgent emails skip the digest window
+        urgent = bool(email_analysis and email_analysis.get("urgencia") == "urgente")
+
+        if not email_data["pdf_attachments"]:
+            # Emails without PDFs are only notified if their body was analyzed
+            if not email_analysis:
+                return []
+            return [("email", {
+                "text": self._build_email_only_notification(
+                    email_analysis, sender_email, subject, date
+                ),
+                "urgent": urgent,
+            })]
+
+        # Separate readable from unreadable PDFs (failed analyses are not notified)
+        readable_pdfs = []
+        unreadable_pdfs = []
+        for analysis_result in pdf_results:
+            if analysis_result:
+                if analysis_result.get("unreadable"):
+                    unreadable_pdfs.append(analysis_result)
+                else:
+                    readable_pdfs.append(analysis_result)
+
+        notifications = []
+
+        # Readable PDFs (normal analysis) + email context
+        if readable_pdfs:
+            payload = {
+                "text": self._build_grouped_notification(
+                    readable_pdfs, sender_email, subject, date, email_analysis
+                ),
+                "attachments": self._attachments_for(email_data, readable_pdfs),
+                "urgent": urgent,
+            }
+            # The purchase order template is not used when no analysis could be interpreted
+            if not all(result.get("analysis_failed") for result in readable_pdfs):
+                payload["template"] = {
+                    "client_name": readable_pdfs[0].get("client_name") or sender_email,
+                    "po_number": f"{len(readable_pdfs)} PDF(s)",
+                }
+            notifications.append(("purchase_orders", payload))
+
+        # Unreadable PDFs (scanned images) + email analysis
+        if unreadable_pdfs:
+            notifications.append(("unreadable_pdfs", {
+                "text": self._build_unreadable_pdf_notification(
                     unreadable_pdfs, sender_email, subject, date, email_analysis
+                ),
+                "attachments": self._attachments_for(email_data, unreadable_pdfs),
+                "urgent": urgent,
+            }))
+
+        return notifications
+
+    def _spool_attachments(self, message_id: str, pdf_attachments: List[Dict]) -> List[Dict]:
+        """Write the decoded PDFs to the attachment spool, so notifications can send them
+
+        Only done when a channel attaches PDFs (Telegram with TELEGRAM_ATTACH_PDFS).
+
+        Returns:
+            The attachments, with the 'path' of their spooled copy
+        """
+        if not (
+            config.TELEGRAM_ATTACH_PDFS
+            and any(channel.provider == "telegram" for channel in self.channels.values())
+        ):
+            return pdf_attachments
+
+        spool_dir = config.ATTACHMENT_SPOOL_DIR / hashlib.sha256(message_id.encode("utf-8")).hexdigest()[:32]
+        spooled = []
+        for i, pdf_info in enumerate(pdf_attachments):
+            if pdf_info.get("path") or not pdf_info.get("data"):
+                spooled.append(pdf_info)
+                continue
+            try:
+                spool_dir.mkdir(parents=True, exist_ok=True)
+                # Prefixed with its position, so attachments with the same name don't collide
+                path = spool_dir / f"{i}_{Path(pdf_info['filename']).name}"
+                path.write_bytes(pdf_info["data"])
+                spooled.append({**pdf_info, "path": str(path)})
+            except OSError as e:
+                logger.error(f"Could not spool attachment {pdf_info['filename']}: {str(e)}")
+                spooled.append(pdf_info)
+        return spooled
+
+    @staticmethod
+    def _attachments_for(email_data: Dict, pdf_results: List[Dict]) -> List[Dict]:
+        """Spooled attachments of the PDFs a notification is about"""
+        filenames = {result.get("filename") for result in pdf_results}
+        return [
+            {"filename": pdf_info["filename"], "path": pdf_info["path"]}
+            for pdf_info in email_data["pdf_attachments"]
+            if pdf_info.get("path") and pdf_info["filename"] in filenames
+        ]
+
+    def _purge_attachment_spool(self):
+        """Delete spooled attachments older than the outbox keeps retrying"""
+        if not config.ATTACHMENT_SPOOL_DIR.exists():
+            return
+        cutoff = time.time() - (config.NOTIFICATION_OUTBOX_MAX_AGE_HOURS + 1) * 3600
+        for spool_dir in config.ATTACHMENT_SPOOL_DIR.iterdir():
+            try:
+                if spool_dir.stat().st_mtime < cutoff:
+                    shutil.rmtree(spool_dir)
+            except OSError as e:
+                logger.error(f"Could not delete spooled attachments {spool_dir}: {str(e)}")
+
+    def _queue_delivery(self, key: str, payload: Dict):
+        """Hold an outbox entry for its channel's next digest, or hand it to the dispatcher"""
+        channel = self._channel_of(payload)
+        if channel is None:
+            logger.warning(f"Notification {key} is for a channel that is not enabled, skipping it")
+            return
+        coalescer = self.coalescers.get(channel)
+        if coalescer is not None and not self._sends_alone(channel, payload):
+            coalescer.add(channel, key, payload)
+            return
+        self._submit_delivery(channel, [{"key": key, "payload": payload}])
+
+    def _channel_of(self, payload: Dict) -> Optional[str]:
+        """Channel an outbox payload is for (entries stored before channels existed use the first one)"""
+        channel = payload.get("channel") or next(iter(self.channels))
+        return channel if channel in self.channels else None
+
+    def _sends_alone(self, channel: str, payload: Dict) -> bool:
+        """Urgent notifications and, e.g., WhatsApp template messages are never coalesced"""
+        return payload.get("urgent", False) or self.channels[channel].sends_alone(payload)
+
+    def _submit_delivery(self, channel: str, entries: List[Dict], digest: bool = False):
+        """Hand outbox entries, sent as one message, to the channel's dispatcher
+
+        Args:
+            channel: Channel name
+            entries: Dicts with the 'key' and 'payload' of each outbox entry
+            digest: Whether the entries come from the coalescer (released when done)
+        """
+        keys = [entry["key"] for entry in entries]
+        on_done = (lambda: self.coalescers[channel].done(keys)) if digest else None
+
+        def exhausted():
+            # Once the dispatcher gives up, the entries wait for a later cycle
+            for key in keys:
+                self.outbox.release(
+                    key, "Delivery attempts exhausted", config.NOTIFICATION_RETRY_MAX_SECONDS
                 )
-                if success:
-                    notification_sent = True
-
-            # Mark email as processed ONLY after successful notification or if no valid PDFs were found
-            total_processed = len(readable_pdfs) + len(unreadable_pdfs)
-            if notification_sent or total_processed == 0:
-                self._save_processed_email(message_id)
-                logger.info(f"Email marked as processed: {message_id[:50]}")
+            if on_done:
+                on_done()
+
+        queued = self.dispatchers[channel].submit(
+            keys[0] if len(keys) == 1 else f"digest:{keys[0]}",
+            lambda: self._deliver_outbox_entries(channel, entries),
+            on_delivered=on_done,
+            on_failed=exhausted,
+        )
+        if not queued:
+            # Neither callback will run; the entries are still pending in the
+            # outbox, so releasing them lets a later cycle queue them again
+            logger.warning(
+                f"{channel} queue full, {len(keys)} notification(s) left for a later cycle"
+            )
+            if on_done:
+                on_done()
+
+    def _deliver_outbox_entries(self, channel: str, entries: List[Dict]) -> bool:
+        """Deliver outbox entries in one message (runs on the channel's dispatcher thread)
+
+        Entries are claimed before sending and confirmed right after, so a
+        crash in between leaves them unconfirmed instead of sending them twice.
+        Several entries are sent as a digest.
+        """
+        # Entries already delivered, given up or being sent are left out
+        claimed = [entry for entry in entries if self.outbox.claim(entry["key"])]
+        if not claimed:
+            return True
+
+        if len(claimed) == 1:
+            payload = claimed[0]["payload"]
+        else:
+            logger.info(f"Sending digest of {len(claimed)} notifications through {channel}")
+            metrics.increment("notification_digests")
+            payload = {
+                "text": build_digest([entry["payload"]["text"] for entry in claimed]),
+                "channel": channel,
+            }
+
+        # Channels catch their own errors and feed their circuit breaker
+        success = self.channels[channel].send(payload)
+        if success:
+            logger.info(f"Successfully sent notification through {channel}")
+        else:
+            logger.error(f"Failed to send notification through {channel}")
+
+        reference = self.channels[channel].last_reference() if success else None
+        for entry in claimed:
+            if success:
+                self.outbox.mark_sent(entry["key"], reference)
             else:
-                logger.warning(f"Email NOT marked as processed due to processing failure: {message_id[:50]}")
+                self.outbox.release(entry["key"], f"{channel} rejected or failed the message")
+        return success
 
-            # Mark as read in inbox (optional)
-            # mail.store(email_id, '+FLAGS', '\\Seen')
+    def _is_queued(self, key: str, payload: Dict) -> bool:
+        """True while an outbox entry is held for a digest or waiting in a dispatcher"""
+        channel = self._channel_of(payload)
+        if channel is None:
+            return False
+        coalescer = self.coalescers.get(channel)
+        return self.dispatchers[channel].is_pending(key) or (
+            coalescer is not None and coalescer.holds(key)
+        )
+
+    def _handle_undelivered(self, entries: List[Dict], status: str, error: str):
+        """Escalate a WhatsApp message Twilio could not deliver, or resend it
+
+        Runs on the reconciler's thread. entries are the notifications the
+        message carried (several for a digest). With TWILIO_ESCALATION_CHANNEL
+        enabled they are sent there (once, as a single message); otherwise they
+        are returned to the outbox for another attempt, up to NOTIFICATION_MAX_ATTEMPTS.
+        """
+        entries = [entry for entry in entries if entry]
+        if not entries:
+            return
+        first = entries[0]
+
+        escalation = config.TWILIO_ESCALATION_CHANNEL
+        if escalation in self.channels and self.channels[escalation].provider != "twilio":
+            key = f"{first['key']}>{escalation}"
+            if len(entries) == 1:
+                payload = dict(first["payload"])
+                text = first["payload"]["text"]
+            else:
+                payload = {}
+                text = build_digest([entry["payload"]["text"] for entry in entries])
+            payload.update({
+                "text": f"⚠️ No entregado por WhatsApp ({error})\n\n{text}",
+                "channel": escalation,
+                "urgent": True,
+            })
+            if self.outbox.add(key, first["message_id"], first["kind"], payload):
+                logger.info(
+                    f"Escalating undelivered WhatsApp message ({len(entries)} notification(s)) to {escalation}"
+                )
+                metrics.increment("whatsapp_escalated")
+                self._queue_delivery(key, payload)
+            return
 
-        except Exception as e:
-            logger.error(f"Error processing email: {str(e)}")
+        for entry in entries:
+            if entry["attempts"] < config.NOTIFICATION_MAX_ATTEMPTS:
+                logger.info(f"Resending undelivered WhatsApp notification {entry['key']}")
+                self.outbox.release(entry["key"], error, config.NOTIFICATION_RETRY_BASE_SECONDS)
+            else:
+                logger.error(f"WhatsApp notification {entry['key']} undelivered after {entry['attempts']} attempts")
 
-    def _analyze_pdf(self, pdf_info: Dict, sender_email: str) -> Optional[Dict]:
+    def _alert_unconfirmed(self, entries: List[Dict]):
+        """Tell the default channels about notifications that may have been lost
+
+        Entries interrupted while being sent (e.g. by a watchdog restart) are
+        not resent, since they may have been delivered; an operator has to check them.
+        """
+        entries = [entry for entry in entries if entry]
+        if not entries:
+            return
+
+        lines = [
+            "⚠️ POSIBLE NOTIFICACIÓN PERDIDA",
+            "",
+            f"El agente se detuvo mientras enviaba {len(entries)} notificación(es); "
+            f"es posible que no hayan llegado. Revisa estos correos manualmente:",
+        ]
+        for entry in entries:
+            first_line = next((line for line in entry["payload"]["text"].splitlines() if line.strip()), "")
+            lines.append(
+                f"\n• {entry['payload'].get('channel', '')} ({entry['kind']}): {first_line[:80]}"
+                f"\n  Message-ID: {entry['message_id'][:80]}"
+            )
+        text = "\n".join(lines)
+
+        message_id = "unconfirmed:" + ",".join(entry["key"] for entry in entries)
+        for channel in self.router.default:
+            if channel not in self.channels:
+                continue
+            key = NotificationOutbox.make_key(message_id, "unconfirmed", channel)
+            payload = {"text": text, "channel": channel, "urgent": True}
+            if self.outbox.add(key, message_id, "unconfirmed", payload):
+                self._queue_delivery(key, payload)
+        logger.warning(f"Alerted about {len(entries)} possibly lost notification(s)")
+
+    def send_startup_notification(self) -> Dict[str, bool]:
+        """Announce the start on the default channels in parallel
+
+        Returns:
+            Dict of channel name -> whether the announcement was delivered
+        """
+        default = {name: self.channels[name] for name in self.router.default if name in self.channels}
+        return fan_out(default, lambda channel: channel.send_startup_notification())
+
+    def send_heartbeat_if_due(self):
+        """Send the WhatsApp heartbeat once the session has been idle too long
+
+        Called by the cycle watchdog on every check: deciding only reads the
+        in-memory time of the last message, and the heartbeat is sent on its
+        own thread, so the watchdog never waits on Twilio.
+        """
+        if self.whatsapp is None or config.WHATSAPP_HEARTBEAT_HOURS <= 0:
+            return
+        if time.monotonic() < self._next_heartbeat_check:
+            return
+        if not self.whatsapp.should_send_heartbeat(hours_threshold=config.WHATSAPP_HEARTBEAT_HOURS):
+            return
+        self._next_heartbeat_check = time.monotonic() + self.HEARTBEAT_RETRY_SECONDS
+        threading.Thread(target=self.whatsapp.send_heartbeat, name="whatsapp-heartbeat", daemon=True).start()
+
+    def stop_notifications(self, timeout: float = 30.0):
+        """Release held digests and wait (up to timeout) for pending deliveries"""
+        if self.reconciler is not None:
+            self.reconciler.stop()
+        for coalescer in self.coalescers.values():
+            coalescer.flush()
+        # The dispatchers drain in parallel, so the total wait stays within timeout
+        fan_out(self.dispatchers, lambda dispatcher: dispatcher.stop(timeout) or True)
+
+    def _deliver_outbox(self):
+        """Queue outbox entries that are due for another delivery attempt"""
+        for entry in self.outbox.due():
+            if not self._is_queued(entry["key"], entry["payload"]):
+                logger.info(f"Retrying delivery of {entry['kind']} notification: {entry['message_id'][:50]}")
+                self._queue_delivery(entry["key"], entry["payload"])
+        self.outbox.counts()
+        self._purge_attachment_spool()
+
+    async def _analyze_pdf_async(self, pdf_info: Dict, sender_email: str) -> Optional[Dict]:
         """Analyze a single PDF and return the analysis result
 
+        Text extraction runs in a worker thread so it overlaps with
+        Claude requests already in flight.
+
         Returns:
             Dict with analysis if successful
             Dict with 'unreadable': True if PDF has no extractable text
@@ -401,12 +1082,11 @@ class IMAPClient:
         """
         try:
             filename = pdf_info["filename"]
-            pdf_data = pdf_info["data"]
 
             logger.info(f"Processing PDF: {filename}")
 
             # Step 1: Extract text from PDF
-            pdf_text = self.pdf_processor.extract_text(pdf_data, filename)
+            pdf_text = await self._extract_pdf_text_async(pdf_info)
 
             if not pdf_text:
                 logger.warning(f"Could not extract text from {filename} - likely scanned image")
@@ -419,7 +1099,7 @@ class IMAPClient:
 
             # Step 2: Analyze with Claude
             logger.info(f"Analyzing {filename} with Claude...")
-            analysis = self.claude_analyzer.analyze_purchase_order(
+            analysis = await self.claude_analyzer.analyze_purchase_order_async(
                 pdf_text, sender_email, filename
             )
 
@@ -434,11 +1114,11 @@ class IMAPClient:
             logger.error(f"Error analyzing PDF: {str(e)}")
             return None
 
-    def _send_grouped_notification(
+    def _build_grouped_notification(
         self, pdf_analyses: List[Dict], sender_email: str, subject: str, date: str,
         email_analysis: Optional[Dict] = None
-    ) -> bool:
-        """Send a single notification for all PDFs in an email
+    ) -> str:
+        """Build a single notification for all PDFs in an email
 
         Args:
             pdf_analyses: List of PDF analysis results
@@ -448,85 +1128,50 @@ class IMAPClient:
             email_analysis: Optional email body analysis
 
         Returns:
-            bool: True if notification was sent successfully, False otherwise
+            str: Notification text
         """
-        try:
-            # Build header
-            num_pdfs = len(pdf_analyses)
-            message_parts = [
-                f"{'🔔 NUEVA ORDEN DE COMPRA' if num_pdfs == 1 else '🔔 NUEVAS ÓRDENES DE COMPRA'}",
-                f"\n📧 De: {sender_email}",
-                f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f"📎 {num_pdfs} PDF(s) adjunto(s)",
-                f"\n{'='*40}\n"
-            ]
-
-            # Add each PDF analysis
-            for i, analysis in enumerate(pdf_analyses, 1):
-                if num_pdfs > 1:
-                    message_parts.append(f"\n📄 PDF #{i}: {analysis.get('filename', 'Unknown')}")
-
-                # Format this PDF's info
-                pdf_msg = self.claude_analyzer.format_for_whatsapp(analysis)
-                message_parts.append(pdf_msg)
-
-                if i < num_pdfs:
-                    message_parts.append(f"\n{'-'*40}")
-
-            # Add email analysis if available
-            if email_analysis:
-                message_parts.append(f"\n\n{'='*40}")
-                message_parts.append(f"\n📧 CONTEXTO DEL CORREO:\n")
-                message_parts.append(self._format_email_analysis(email_analysis))
-
-            # Add email metadata at the end
-            message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
-
-            # Join all parts
-            full_message = "\n".join(message_parts)
-
-            # Send notification
-            logger.info(f"Sending notification for {num_pdfs} PDF(s)...")
-
-            # For Telegram, send the full detailed message
-            if config.NOTIFICATION_PROVIDER == "telegram":
-                success = self.notifier.send_message(full_message)
-
-            # For Twilio WhatsApp, use template if configured, otherwise freeform
-            elif config.NOTIFICATION_PROVIDER == "twilio":
-                template_sid = config.TWILIO_WHATSAPP_TEMPLATE_SID
-
-                if template_sid:
-                    logger.info("Using WhatsApp template for notification")
-                    client_name = pdf_analyses[0].get('client_name', sender_email)
-                    success = self.notifier.send_purchase_order_notification(
-                        client_name=client_name,
-                        po_number=f"{num_pdfs} PDF(s)",
-                        template_sid=template_sid
-                    )
-                else:
-                    logger.info("Using freeform WhatsApp message")
-                    success = self.notifier.send_message(full_message)
-            else:
-                logger.error(f"Unknown notification provider: {config.NOTIFICATION_PROVIDER}")
-                success = False
+        # Build header
+        num_pdfs = len(pdf_analyses)
+        if all(analysis.get("analysis_failed") for analysis in pdf_analyses):
+            header = "🔍 DOCUMENTO POR REVISAR MANUALMENTE" if num_pdfs == 1 else "🔍 DOCUMENTOS POR REVISAR MANUALMENTE"
+        else:
+            header = "🔔 NUEVA ORDEN DE COMPRA" if num_pdfs == 1 else "🔔 NUEVAS ÓRDENES DE COMPRA"
+        message_parts = [
+            header,
+            f"\n📧 De: {sender_email}",
+            f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            f"📎 {num_pdfs} PDF(s) adjunto(s)",
+            f"\n{'='*40}\n"
+        ]
+
+        # Add each PDF analysis
+        for i, analysis in enumerate(pdf_analyses, 1):
+            if num_pdfs > 1:
+                message_parts.append(f"\n📄 PDF #{i}: {analysis.get('filename', 'Unknown')}")
+
+            # Format this PDF's info
+            pdf_msg = self.claude_analyzer.format_for_whatsapp(analysis)
+            message_parts.append(pdf_msg)
+
+            if i < num_pdfs:
+                message_parts.append(f"\n{'-'*40}")
+
+        # Add email analysis if available
+        if email_analysis:
+            message_parts.append(f"\n\n{'='*40}")
+            message_parts.append(f"\n📧 CONTEXTO DEL CORREO:\n")
+            message_parts.append(self._format_email_analysis(email_analysis))
 
-            if success:
-                logger.info(f"Successfully sent notification for {num_pdfs} PDF(s)")
-                return True
-            else:
-                logger.error(f"Failed to send notification")
-                return False
+        # Add email metadata at the end
+        message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
 
-        except Exception as e:
-            logger.error(f"Error sending grouped notification: {str(e)}")
-            return False
+        return "\n".join(message_parts)
 
-    def _send_unreadable_pdf_notification(
+    def _build_unreadable_pdf_notification(
         self, unreadable_pdfs: List[Dict], sender_email: str, subject: str, date: str,
         email_analysis: Optional[Dict] = None
-    ) -> bool:
-        """Send notification for PDFs that couldn't be read (scanned images)
+    ) -> str:
+        """Build the notification for PDFs that couldn't be read (scanned images)
 
         Args:
             unreadable_pdfs: List of dicts with 'filename' and 'sender_email'
@@ -536,67 +1181,43 @@ class IMAPClient:
             email_analysis: Optional email body analysis
 
         Returns:
-            bool: True if notification was sent successfully, False otherwise
+            str: Notification text
         """
-        try:
-            num_pdfs = len(unreadable_pdfs)
-
-            # Build message
-            message_parts = [
-                f"{'⚠️ NUEVA ORDEN DE COMPRA (PDF NO LEGIBLE)' if num_pdfs == 1 else '⚠️ NUEVAS ÓRDENES DE COMPRA (PDFs NO LEGIBLES)'}",
-                f"\n📧 De: {sender_email}",
-                f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f"📎 {num_pdfs} PDF(s) adjunto(s)",
-                f"\n{'='*40}\n"
-            ]
-
-            # Add info about each unreadable PDF
-            message_parts.append("⚠️ No se pudo extraer texto del PDF")
-            message_parts.append("Es probable que sea una imagen escaneada.\n")
-
-            for i, pdf_info in enumerate(unreadable_pdfs, 1):
-                filename = pdf_info.get('filename', 'Unknown')
-                if num_pdfs > 1:
-                    message_parts.append(f"\n📄 PDF #{i}: {filename}")
-                else:
-                    message_parts.append(f"📄 Archivo: {filename}")
-
-            # Add email analysis if available (VERY useful when PDF is unreadable)
-            if email_analysis:
-                message_parts.append(f"\n\n{'='*40}")
-                message_parts.append(f"\n📧 ANÁLISIS DEL CORREO:\n")
-                message_parts.append(self._format_email_analysis(email_analysis))
-                message_parts.append("\n💡 Como el PDF no se pudo leer, revísalo manualmente.")
+        num_pdfs = len(unreadable_pdfs)
+
+        # Build message
+        message_parts = [
+            f"{'⚠️ NUEVA ORDEN DE COMPRA (PDF NO LEGIBLE)' if num_pdfs == 1 else '⚠️ NUEVAS ÓRDENES DE COMPRA (PDFs NO LEGIBLES)'}",
+            f"\n📧 De: {sender_email}",
+            f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            f"📎 {num_pdfs} PDF(s) adjunto(s)",
+            f"\n{'='*40}\n"
+        ]
+
+        # Add info about each unreadable PDF
+        message_parts.append("⚠️ No se pudo extraer texto del PDF")
+        message_parts.append("Es probable que sea una imagen escaneada.\n")
+
+        for i, pdf_info in enumerate(unreadable_pdfs, 1):
+            filename = pdf_info.get('filename', 'Unknown')
+            if num_pdfs > 1:
+                message_parts.append(f"\n📄 PDF #{i}: {filename}")
             else:
-                message_parts.append("\n💡 Revisa el correo manualmente para ver el contenido del PDF.")
-
-            # Add email subject
-            message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
-
-            # Join all parts
-            full_message = "\n".join(message_parts)
+                message_parts.append(f"📄 Archivo: {filename}")
 
-            # Send notification
-            logger.info(f"Sending notification for {num_pdfs} unreadable PDF(s)...")
-
-            if config.NOTIFICATION_PROVIDER == "telegram":
-                success = self.notifier.send_message(full_message)
-            elif config.NOTIFICATION_PROVIDER == "twilio":
-                success = self.notifier.send_message(full_message)
-            else:
-                logger.error(f"Unknown notification provider: {config.NOTIFICATION_PROVIDER}")
-                success = False
+        # Add email analysis if available (VERY useful when PDF is unreadable)
+        if email_analysis:
+            message_parts.append(f"\n\n{'='*40}")
+            message_parts.append(f"\n📧 ANÁLISIS DEL CORREO:\n")
+            message_parts.append(self._format_email_analysis(email_analysis))
+            message_parts.append("\n💡 Como el PDF no se pudo leer, revísalo manualmente.")
+        else:
+            message_parts.append("\n💡 Revisa el correo manualmente para ver el contenido del PDF.")
 
-            if success:
-                logger.info(f"Successfully sent unreadable PDF notification for {num_pdfs} PDF(s)")
-                return True
-            else:
-                logger.error(f"Failed to send unreadable PDF notification")
-                return False
+        # Add email subject
+        message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
 
-        except Exception as e:
-            logger.error(f"Error sending unreadable PDF notification: {str(e)}")
-            return False
+        return "\n".join(message_parts)
 
     def _format_email_analysis(self, email_analysis: Dict) -> str:
         """Format email analysis for notification message
@@ -664,10 +1285,10 @@ class IMAPClient:
 
         return "\n".join(parts)
 
-    def _send_email_only_notification(
+    def _build_email_only_notification(
         self, email_analysis: Dict, sender_email: str, subject: str, date: str
-    ) -> bool:
-        """Send notification for emails without PDF attachments
+    ) -> str:
+        """Build the notification for emails without PDF attachments
 
         Args:
             email_analysis: Email body analysis from Claude
@@ -676,57 +1297,33 @@ class IMAPClient:
             date: Email date
 
         Returns:
-            bool: True if notification was sent successfully, False otherwise
+            str: Notification text
         """
-        try:
-            # Build message
-            tipo = email_analysis.get('tipo_mensaje', 'otro')
-            tipo_emoji = {
-                'orden_compra': '📝',
-                'cotizacion': '💰',
-                'consulta': '❓',
-                'reclamo': '⚠️',
-                'otro': '📧'
-            }
-
-            message_parts = [
-                f"{tipo_emoji.get(tipo, '📧')} NUEVO CORREO DE CLIENTE",
-                f"\n📧 De: {sender_email}",
-                f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f"\n{'='*40}\n"
-            ]
-
-            # Add email analysis
-            message_parts.append("📧 ANÁLISIS DEL CORREO:\n")
-            message_parts.append(self._format_email_analysis(email_analysis))
-
-            # Add email subject
-            message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
-
-            # Join all parts
-            full_message = "\n".join(message_parts)
+        # Build message
+        tipo = email_analysis.get('tipo_mensaje', 'otro')
+        tipo_emoji = {
+            'orden_compra': '📝',
+            'cotizacion': '💰',
+            'consulta': '❓',
+            'reclamo': '⚠️',
+            'otro': '📧'
+        }
 
-            # Send notification
-            logger.info(f"Sending notification for email without PDF from {sender_email}")
+        message_parts = [
+            f"{tipo_emoji.get(tipo, '📧')} NUEVO CORREO DE CLIENTE",
+            f"\n📧 De: {sender_email}",
+            f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            f"\n{'='*40}\n"
+        ]
 
-            if config.NOTIFICATION_PROVIDER == "telegram":
-                success = self.notifier.send_message(full_message)
-            elif config.NOTIFICATION_PROVIDER == "twilio":
-                success = self.notifier.send_message(full_message)
-            else:
-                logger.error(f"Unknown notification provider: {config.NOTIFICATION_PROVIDER}")
-                success = False
+        # Add email analysis
+        message_parts.append("📧 ANÁLISIS DEL CORREO:\n")
+        message_parts.append(self._format_email_analysis(email_analysis))
 
-            if success:
-                logger.info(f"Successfully sent email-only notification")
-                return True
-            else:
-                logger.error(f"Failed to send email-only notification")
-                return False
+        # Add email subject
+        message_parts.append(f"\n\n📧 Asunto: {subject[:100]}")
 
-        except Exception as e:
-            logger.error(f"Error sending email-only notification: {str(e)}")
-            return False
+        return "\n".join(message_parts)
 
     def run_monitoring_cycle(self):
         """Run one complete monitoring cycle"""
@@ -737,6 +1334,7 @@ class IMAPClient:
         logger.info("=" * 70)
 
         try:
+            self._deliver_outbox()
             self.check_emails()
             logger.info("Monitoring cycle completed successfully")
         except Exception as e:
@@ -744,4 +1342,7 @@ class IMAPClient:
             # Optionally send error notification
             # self.whatsapp.send_error_notification(str(e))
 
+        metrics.log_summary()
+        metrics.write_snapshot()
+
         logger.info("=" * 70 + "\n")
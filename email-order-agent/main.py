@@ -13,6 +13,7 @@ import schedule
 from datetime import datetime
 
 import config
+from cycle_watchdog import CycleWatchdog
 from imap_client import IMAPClient
 
 
@@ -86,14 +87,18 @@ def display_config():
     logger.info(f"IMAP Server: {cfg['imap_server']}:{cfg['imap_port']}")
     logger.info(f"IMAP User: {cfg['imap_user']}")
     logger.info(f"Check Interval: {cfg['check_interval_minutes']} minutes")
-    logger.info(f"Notification Provider: {cfg['notification_provider'].upper()}")
+    logger.info(f"Notification Providers: {', '.join(cfg['notification_providers']).upper()}")
 
-    if cfg['notification_provider'] == 'telegram':
+    if 'telegram' in cfg['notification_providers']:
         logger.info(f"Telegram Chat ID: {cfg.get('telegram_chat_id', 'Not configured')}")
         logger.info(f"Telegram API: {'✓ Configured' if cfg.get('telegram_configured') else '✗ Not configured'}")
-    elif cfg['notification_provider'] == 'twilio':
+    if 'twilio' in cfg['notification_providers']:
         logger.info(f"WhatsApp Recipient: {cfg.get('whatsapp_to', 'Not configured')}")
         logger.info(f"Twilio API: {'✓ Configured' if cfg.get('twilio_configured') else '✗ Not configured'}")
+    if 'webhook' in cfg['notification_providers']:
+        logger.info(f"Webhook: {cfg.get('webhook_url') or '✗ Not configured'}")
+    if 'file' in cfg['notification_providers']:
+        logger.info(f"Notification file: {cfg.get('notification_file')}")
 
     logger.info(f"Anthropic API: {'✓ Configured' if cfg['anthropic_configured'] else '✗ Not configured'}")
     logger.info("\nMonitored Clients:")
@@ -102,14 +107,18 @@ def display_config():
     logger.info("=" * 70 + "\n")
 
 
-def job_check_emails(imap_client: IMAPClient):
+def job_check_emails(imap_client: IMAPClient, watchdog: CycleWatchdog):
     """Scheduled job to check emails"""
+    watchdog.cycle_started()
     try:
         imap_client.run_monitoring_cycle()
 
     except Exception as e:
         logging.error(f"Error in scheduled job: {str(e)}")
 
+    finally:
+        watchdog.cycle_finished()
+
 
 def main():
     """Main application entry point"""
@@ -142,28 +151,30 @@ def main():
     # Send startup notification
     logger.info("\nSending startup notification...")
     try:
-        if imap_client.notifier.send_startup_notification():
-            logger.info("✓ Startup notification sent")
-        else:
-            logger.warning("⚠ Failed to send startup notification")
+        for channel, sent in imap_client.send_startup_notification().items():
+            if sent:
+                logger.info(f"✓ Startup notification sent ({channel})")
+            else:
+                logger.warning(f"⚠ Failed to send startup notification ({channel})")
     except Exception as e:
         logger.error(f"✗ Error sending startup notification: {str(e)}")
 
+    # Watch the cycles (and tell systemd we are ready); heartbeats are sent from its thread
+    watchdog = CycleWatchdog(periodic=imap_client.send_heartbeat_if_due)
+    watchdog.start()
+
     # Run first check immediately
     logger.info("\n" + "=" * 70)
     logger.info("Running initial email check...")
     logger.info("=" * 70 + "\n")
 
-    try:
-        imap_client.run_monitoring_cycle()
-    except Exception as e:
-        logger.error(f"Error in initial check: {str(e)}")
+    job_check_emails(imap_client, watchdog)
 
     # Schedule periodic checks
     interval_minutes = config.CHECK_INTERVAL_MINUTES
     logger.info(f"\nScheduling checks every {interval_minutes} minutes...")
 
-    schedule.every(interval_minutes).minutes.do(job_check_emails, imap_client)
+    schedule.every(interval_minutes).minutes.do(job_check_emails, imap_client, watchdog)
 
     logger.info("\n" + "=" * 70)
     logger.info("SYSTEM ACTIVE - Monitoring for purchase orders")
@@ -179,6 +190,9 @@ def main():
     except KeyboardInterrupt:
         logger.info("\n\nShutdown signal received...")
         logger.info("Stopping email monitoring agent")
+        watchdog.stop()
+        # Give queued notifications a chance to be delivered
+        imap_client.stop_notifications()
         logger.info("Goodbye!")
         sys.exit(0)
 
@@ -0,0 +1,90 @@
+"""
+Metrics Module
+In-process counters, gauges and timing summaries shared by all components.
+A snapshot is logged and written to logs/metrics.json after every monitoring cycle
+"""
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and timing summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1):
+        """Add value to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record an observation (e.g. a latency in seconds) in a summary"""
+        with self._lock:
+            summary = self.timings.get(name)
+            if summary is None:
+                summary = {"count": 0, "total": 0.0, "min": value, "max": value}
+                self.timings[name] = summary
+            summary["count"] += 1
+            summary["total"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+
+    def get_counter(self, name: str) -> float:
+        """Return the current value of a counter (0 if never incremented)"""
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def snapshot(self) -> Dict:
+        """Return a copy of all metrics, with averages for timing summaries"""
+        with self._lock:
+            timings = {
+                name: {
+                    **summary,
+                    "avg": summary["total"] / summary["count"] if summary["count"] else 0.0,
+                }
+                for name, summary in self.timings.items()
+            }
+            return {
+                "timestamp": datetime.now().isoformat(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": timings,
+            }
+
+    def write_snapshot(self):
+        """Write the current snapshot to config.METRICS_FILE"""
+        try:
+            with open(config.METRICS_FILE, "w") as f:
+                json.dump(self.snapshot(), f, indent=2)
+        except Exception as e:
+            logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+    def log_summary(self):
+        """Log counters and gauges in a single line"""
+        snapshot = self.snapshot()
+        values = {**snapshot["counters"], **snapshot["gauges"]}
+        if values:
+            summary = ", ".join(
+                f"{name}={value:.3g}" if isinstance(value, float) else f"{name}={value}"
+                for name, value in sorted(values.items())
+            )
+            logger.info(f"Metrics: {summary}")
+
+
+# Shared registry used by every module
+metrics = Metrics()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Mock Anthropic API Server
+Local stand-in for the Messages and Message Batches APIs, used to test the
+analyzer without spending tokens
+
+Usage:
+    python mock_anthropic_server.py --port 8765 --batch-delay 5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_PURCHASE_ORDER = {
+    "is_purchase_order": True,
+    "special_notes": None,
+    "confidence": "high",
+    "client_name": "Cliente de Prueba",
+    "order_number": "OC-0001",
+    "order_date": "2024-01-15",
+    "products": [
+        {"name": "Producto de prueba", "quantity": "10 kg", "unit_price": "$100.00"}
+    ],
+    "total_amount": "$1,000.00",
+}
+
+# Returned for documents mentioning an invoice ("factura" / "invoice")
+SAMPLE_NOT_PURCHASE_ORDER = {
+    "is_purchase_order": False,
+    "special_notes": "Factura de venta, no es una orden de compra",
+    "confidence": "high",
+    "client_name": "Cliente de Prueba",
+    "order_number": None,
+    "order_date": "2024-01-15",
+    "products": [
+        {"name": f"Producto facturado {i}", "quantity": f"{i} kg", "unit_price": "$10.00"}
+        for i in range(1, 21)
+    ],
+    "total_amount": "$2,100.00",
+}
+
+SAMPLE_EMAIL_ANALYSIS = {
+    "tipo_mensaje": "orden_compra",
+    "productos_mencionados": [],
+    "fecha_entrega": None,
+    "numero_orden": "OC-0001",
+    "urgencia": "normal",
+    "notas_importantes": "Correo de prueba",
+    "requiere_respuesta": False,
+    "confianza": "high",
+}
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+# Line items of a chunked document: "<line> <name> <quantity> <unit> $<price>"
+PART_LINE_ITEM = re.compile(r"^\d+\s+(.+?)\s+(\d+\s+\w+)\s+(\$[\d,.]+)$", re.MULTILINE)
+
+
+def build_part_input(params: Dict) -> Dict:
+    """Tool input for one part of a chunked document, with the line items it contains"""
+    content = params["messages"][0]["content"]
+    part = {
+        **SAMPLE_PURCHASE_ORDER,
+        "client_name": None,
+        "order_number": None,
+        "order_date": None,
+        "total_amount": None,
+        "products": [
+            {"name": name, "quantity": quantity, "unit_price": price}
+            for name, quantity, price in PART_LINE_ITEM.findall(content)
+        ],
+    }
+    # Header fields only where the part shows them
+    if SAMPLE_PURCHASE_ORDER["order_number"] in content:
+        for field in ("client_name", "order_number", "order_date"):
+            part[field] = SAMPLE_PURCHASE_ORDER[field]
+    if re.search(r"\btotal\b", content, re.IGNORECASE):
+        part["total_amount"] = SAMPLE_PURCHASE_ORDER["total_amount"]
+    return part
+
+
+def compact_tool_input(tool_input: Dict) -> Dict:
+    """Convert a canned purchase order or email tool input to the compact format"""
+    codes = {"high": "h", "medium": "m", "low": "l"}
+    if "tipo_mensaje" in tool_input:
+        return {
+            "tm": {"orden_compra": "oc", "cotizacion": "cot", "consulta": "con",
+                   "reclamo": "rec"}.get(tool_input["tipo_mensaje"], "otro"),
+            "p": [
+                [item["nombre"], item.get("cantidad"), item.get("especificaciones")]
+                for item in tool_input["productos_mencionados"]
+            ],
+            "fe": tool_input["fecha_entrega"],
+            "no": tool_input["numero_orden"],
+            "u": tool_input["urgencia"][0],
+            "nt": tool_input["notas_importantes"],
+            "r": tool_input["requiere_respuesta"],
+            "c": codes[tool_input["confianza"]],
+        }
+    return {
+        "po": tool_input["is_purchase_order"],
+        "n": tool_input["special_notes"],
+        "c": codes[tool_input["confidence"]],
+        "cl": tool_input["client_name"],
+        "no": tool_input["order_number"],
+        "d": tool_input["order_date"],
+        "it": [
+            [item["name"], item.get("quantity"), item.get("unit_price")]
+            for item in tool_input["products"]
+        ],
+        "t": tool_input["total_amount"],
+    }
+
+
+def build_tool_input(params: Dict) -> Dict:
+    """Build a canned tool input that matches the prompt that was sent"""
+    prompt = json.dumps(params.get("messages", []), ensure_ascii=False)
+    tool_name = (params.get("tool_choice") or {}).get("name", "")
+
+    if tool_name == "record_combined_analysis":
+        filenames = re.findall(r"--- Attachment \d+: (.+?) ---", prompt)
+        return {
+            "attachments": [
+                {"filename": filename, **SAMPLE_PURCHASE_ORDER} for filename in filenames
+            ],
+            "email_context": SAMPLE_EMAIL_ANALYSIS,
+        }
+    if tool_name.endswith("_compact"):
+        return compact_tool_input(
+            build_tool_input({**params, "tool_choice": {"name": tool_name[:-len("_compact")]}})
+        )
+    if tool_name == "record_email_analysis":
+        return dict(SAMPLE_EMAIL_ANALYSIS)
+    if tool_name == "record_purchase_order_part":
+        return build_part_input(params)
+    if re.search(r"factura|invoice", prompt, re.IGNORECASE):
+        return dict(SAMPLE_NOT_PURCHASE_ORDER)
+    return dict(SAMPLE_PURCHASE_ORDER)
+
+
+def build_message(
+    params: Dict, cached_prefixes: Optional[set] = None, invalid: bool = False
+) -> Dict:
+    """Build a Messages API response for the given request parameters
+
+    Args:
+        params: Messages API request body
+        cached_prefixes: System prompts already written to the simulated prompt
+            cache; a system prompt with cache_control is counted as a cache write
+            the first time and as a cache read afterwards
+        invalid: Return a tool input that fails validation (missing confidence fields)
+    """
+    tool_input = build_tool_input(params)
+    if invalid:
+        tool_input.pop("confidence", None)
+        tool_input.pop("confianza", None)
+        tool_input.pop("c", None)
+        tool_input.pop("attachments", None)
+    text = json.dumps(tool_input)
+    system = params.get("system") or []
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    system_text = "".join(block.get("text", "") for block in system)
+    prompt_length = len(json.dumps(params.get("messages", [])))
+
+    usage = {
+        "input_tokens": prompt_length // 4,
+        "output_tokens": len(text) // 4,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+    }
+    if cached_prefixes is not None and any("cache_control" in block for block in system):
+        if system_text in cached_prefixes:
+            usage["cache_read_input_tokens"] = len(system_text) // 4
+        else:
+            cached_prefixes.add(system_text)
+            usage["cache_creation_input_tokens"] = len(system_text) // 4
+    else:
+        usage["input_tokens"] += len(system_text) // 4
+
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "mock-model"),
+        "content": [{
+            "type": "tool_use",
+            "id": f"toolu_{uuid.uuid4().hex[:24]}",
+            "name": (params.get("tool_choice") or {}).get("name", "record_purchase_order"),
+            "input": tool_input,
+        }],
+        "stop_reason": "tool_use",
+        "stop_sequence": None,
+        "usage": usage,
+    }
+
+
+class MockAnthropicServer:
+    """In-memory Messages / Message Batches API served over HTTP"""
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 8765, batch_delay: float = 2.0,
+        invalid_responses: int = 0, errors: Optional[List[int]] = None,
+        stream_chunk_delay: float = 0.01,
+    ):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            batch_delay: Seconds before a submitted batch reports 'ended'
+            invalid_responses: Number of Messages API responses (not counting repair
+                requests) that return tool input failing validation
+            errors: HTTP status codes returned, in order, by the next Messages API
+                requests (429 responses include a 1 second retry-after header)
+            stream_chunk_delay: Seconds between streamed tool input chunks
+        """
+        self.batch_delay = batch_delay
+        self.invalid_responses = invalid_responses
+        self.errors = list(errors or [])
+        self.stream_chunk_delay = stream_chunk_delay
+        self.streams_completed = 0
+        self.streams_aborted = 0
+        self.batches: Dict[str, Dict] = {}
+        self.request_count = 0
+        self.cached_prefixes = set()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Mock Anthropic API listening on {self.base_url}")
+
+    def stop(self):
+        """Stop serving requests"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _batch_view(self, batch: Dict) -> Dict:
+        """Return the public representation of a batch"""
+        ended = time.time() - batch["created"] >= self.batch_delay
+        created_at = datetime.fromtimestamp(batch["created"], timezone.utc)
+        count = len(batch["requests"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(created_at),
+            "expires_at": _iso(created_at + timedelta(hours=24)),
+            "ended_at": _iso(datetime.now(timezone.utc)) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results"
+            if ended else None,
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send_json(self, payload, status: int = 200, headers: Optional[Dict] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, message: Dict):
+                """Send a message as server-sent events, streaming the tool input in chunks"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                tool_use = message["content"][0]
+                partial_json = json.dumps(tool_use["input"])
+                output_tokens = message["usage"]["output_tokens"]
+                events = [
+                    {"type": "message_start", "message": {
+                        **message, "content": [], "stop_reason": None,
+                        "usage": {**message["usage"], "output_tokens": 1},
+                    }},
+                    {"type": "content_block_start", "index": 0,
+                     "content_block": {**tool_use, "input": {}}},
+                ]
+                events += [
+                    {"type": "content_block_delta", "index": 0,
+                     "delta": {"type": "input_json_delta", "partial_json": partial_json[i:i + 16]}}
+                    for i in range(0, len(partial_json), 16)
+                ]
+                events += [
+                    {"type": "content_block_stop", "index": 0},
+                    {"type": "message_delta",
+                     "delta": {"stop_reason": "tool_use", "stop_sequence": None},
+                     "usage": {"output_tokens": output_tokens}},
+                    {"type": "message_stop"},
+                ]
+
+                try:
+                    for event in events:
+                        self.wfile.write(
+                            f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+                        )
+                        self.wfile.flush()
+                        if event["type"] == "content_block_delta":
+                            time.sleep(server.stream_chunk_delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.streams_aborted += 1
+                    return
+
+                with server._lock:
+                    server.streams_completed += 1
+
+            def _read_json(self) -> Dict:
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _not_found(self):
+                self._send_json(
+                    {"type": "error", "error": {"type": "not_found_error", "message": self.path}},
+                    404,
+                )
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                with server._lock:
+                    server.request_count += 1
+
+                if path == "/v1/messages":
+                    params = self._read_json()
+                    with server._lock:
+                        status = server.errors.pop(0) if server.errors else None
+                    if status is not None:
+                        error_type = {429: "rate_limit_error", 529: "overloaded_error"}.get(
+                            status, "api_error"
+                        )
+                        self._send_json(
+                            {"type": "error", "error": {"type": error_type, "message": "mock"}},
+                            status,
+                            {"retry-after": "1"} if status == 429 else None,
+                        )
+                        return
+
+                    is_repair = "had invalid input" in json.dumps(params.get("messages", []))
+                    with server._lock:
+                        invalid = server.invalid_responses > 0 and not is_repair
+                        if invalid:
+                            server.invalid_responses -= 1
+                        message = build_message(params, server.cached_prefixes, invalid)
+                    if params.get("stream"):
+                        self._send_stream(message)
+                    else:
+                        self._send_json(message)
+                elif path == "/v1/messages/batches":
+                    payload = self._read_json()
+                    batch = {
+                        "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+                        "created": time.time(),
+                        "requests": payload.get("requests", []),
+                    }
+                    with server._lock:
+                        server.batches[batch["id"]] = batch
+                    self._send_json(server._batch_view(batch))
+                else:
+                    self._not_found()
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                with server._lock:
+                    server.request_count += 1
+
+                match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+                batch = server.batches.get(match.group(1)) if match else None
+                if batch is None:
+                    self._not_found()
+                    return
+
+                if not match.group(2):
+                    self._send_json(server._batch_view(batch))
+                    return
+
+                lines = [
+                    json.dumps({
+                        "custom_id": request["custom_id"],
+                        "result": {
+                            "type": "succeeded",
+                            "message": build_message(request["params"], server.cached_prefixes),
+                        },
+                    })
+                    for request in batch["requests"]
+                ]
+                body = "\n".join(lines).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/binary")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Anthropic API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=2.0,
+                        help="Seconds before a batch reports 'ended'")
+    parser.add_argument("--invalid-responses", type=int, default=0,
+                        help="Number of responses with invalid tool input")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockAnthropicServer(args.host, args.port, args.batch_delay, args.invalid_responses)
+    print(f"Mock Anthropic API: {server.base_url}")
+    print(f"Usa: ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Multipart Stream Module
+multipart/form-data request body that reads attached files while it is being
+sent, instead of building the whole body in memory like requests' files=.
+The body has a known length (so Content-Length is set) and can be rewound,
+so the HTTP adapter can retry the request.
+"""
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+CRLF = b"\r\n"
+
+
+class MultipartStream:
+    """File-like multipart/form-data body for requests' data= argument"""
+
+    def __init__(self, fields: Dict[str, str], files: List[Tuple[str, str, Path, str]]):
+        """
+        Args:
+            fields: Form fields (name -> value)
+            files: (field name, filename, path, content type) of each file part
+        """
+        self.boundary = uuid.uuid4().hex
+        # Each part is either bytes or the path of a file streamed from disk
+        self._parts: List[Union[bytes, Path]] = []
+
+        for name, value in fields.items():
+            self._parts.append(
+                self._header(f'form-data; name="{name}"') + str(value).encode("utf-8") + CRLF
+            )
+        for name, filename, path, content_type in files:
+            safe_name = filename.replace('"', "'")
+            self._parts.append(
+                self._header(f'form-data; name="{name}"; filename="{safe_name}"', content_type)
+            )
+            self._parts.append(Path(path))
+            self._parts.append(CRLF)
+        self._parts.append(f"--{self.boundary}--".encode() + CRLF)
+
+        self.length = sum(
+            part.stat().st_size if isinstance(part, Path) else len(part) for part in self._parts
+        )
+        self._index = 0
+        self._offset = 0
+        self._file = None
+        self._position = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _header(self, disposition: str, content_type: str = None) -> bytes:
+        lines = [f"--{self.boundary}", f"Content-Disposition: {disposition}"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+    def read(self, size: int = -1) -> bytes:
+        """Return up to size bytes of the body (everything left if size < 0)"""
+        chunks = []
+        remaining = size if size is not None and size >= 0 else self.length
+        while remaining > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, Path):
+                if self._file is None:
+                    self._file = open(part, "rb")
+                chunk = self._file.read(remaining)
+                if not chunk:
+                    self._file.close()
+                    self._file = None
+                    self._index += 1
+                    continue
+            else:
+                chunk = part[self._offset:self._offset + remaining]
+                self._offset += len(chunk)
+                if self._offset >= len(part):
+                    self._index += 1
+                    self._offset = 0
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = b"".join(chunks)
+        self._position += len(data)
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        """Rewind to the start (the only position retries need)"""
+        if offset != 0 or whence != 0:
+            raise ValueError("MultipartStream can only be rewound to the start")
+        self.close()
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        return 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,357 @@
+"""
+Notification Channels Module
+Every place notifications are delivered to (a Telegram chat, a WhatsApp number,
+a webhook or a local file) is a channel with the same interface. Channels are
+named by destination: "telegram" is the configured default chat and
+"telegram:<chat id>" another chat; likewise "twilio:<number>",
+"webhook:<url>" and "file:<path>". Channels of the same provider share its
+notifier (connection pool and rate limits).
+
+Each channel is guarded by a circuit breaker: after repeated failures it stops
+calling the endpoint, and probes it again once the breaker's reset time has passed.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import requests
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed     calls go through
+    open       calls are refused until reset_timeout has passed
+    half_open  a single probe call goes through; its outcome closes or reopens it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        """
+        Args:
+            name: Channel name (used in logs and metrics)
+            failure_threshold: Consecutive failures that open the breaker
+                (defaults to config.NOTIFICATION_CIRCUIT_FAILURE_THRESHOLD)
+            reset_timeout: Seconds before an open breaker lets a probe through
+                (defaults to config.NOTIFICATION_CIRCUIT_RESET_SECONDS)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or config.NOTIFICATION_CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = (
+            reset_timeout if reset_timeout is not None else config.NOTIFICATION_CIRCUIT_RESET_SECONDS
+        )
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if a call may be made now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                logger.info(f"Circuit for {self.name} half-open, probing the endpoint")
+                self.state = "half_open"
+                return True
+            # Open, or a probe is already in flight
+            return False
+
+    def record_success(self):
+        """A call succeeded: close the breaker"""
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit for {self.name} closed, endpoint is back")
+            self.state = "closed"
+            self.failures = 0
+        metrics.set_gauge(f"circuit_{self.name}_open", 0)
+
+    def record_failure(self):
+        """A call failed: open the breaker after too many failures in a row"""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        f"Circuit for {self.name} opened after {self.failures} failure(s), "
+                        f"next probe in {self.reset_timeout:.0f}s"
+                    )
+                    metrics.increment("circuit_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                metrics.set_gauge(f"circuit_{self.name}_open", 1)
+
+
+class NotificationChannel:
+    """Base class of notification channels"""
+
+    provider = "channel"
+    # Longest message the channel delivers as is (used to size digests)
+    MAX_MESSAGE_LENGTH = 4000
+
+    def __init__(self, target: str = None, shared: Dict = None):
+        """
+        Args:
+            target: Chat, number, URL or path (defaults to the provider's configured one)
+            shared: Objects shared by the channels of a provider, by provider name
+        """
+        self.target = target
+        self.name = f"{self.provider}:{target}" if target else self.provider
+        self.breaker = CircuitBreaker(self.name)
+
+    @property
+    def destination(self) -> str:
+        """Identifies where the channel delivers (chat, number, URL or file)"""
+        return self.name
+
+    def send(self, payload: Dict) -> bool:
+        """
+        Deliver a rendered notification through the circuit breaker
+
+        Args:
+            payload: Outbox payload ('text', optionally 'template' and 'urgent')
+
+        Returns:
+            True if delivered; False if it failed or the circuit is open
+        """
+        return self._guarded(lambda: self._send(payload))
+
+    def send_startup_notification(self) -> bool:
+        """Announce that the agent started"""
+        return self.send({"text": "🚀 SISTEMA INICIADO - Agente de monitoreo de órdenes de compra activo"})
+
+    def sends_alone(self, payload: Dict) -> bool:
+        """True if the payload must not be merged into a digest on this channel"""
+        return False
+
+    def last_reference(self) -> Optional[str]:
+        """Provider's id of the last message sent by the calling thread, if it tracks delivery"""
+        return None
+
+    def _send(self, payload: Dict) -> bool:
+        raise NotImplementedError
+
+    def _guarded(self, call: Callable[[], bool]) -> bool:
+        """Run a delivery call unless the circuit is open, recording its outcome"""
+        if not self.breaker.allow():
+            logger.warning(f"Circuit for {self.name} is open, not calling it")
+            metrics.increment(f"notifications_{self.name}_short_circuited")
+            return False
+        try:
+            success = call()
+        except Exception as e:
+            logger.error(f"Error sending through {self.name}: {str(e)}")
+            success = False
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return success
+
+
+class TelegramChannel(NotificationChannel):
+    """Telegram chat through the Bot API"""
+
+    provider = "telegram"
+
+    def __init__(self, target: str = None, shared: Dict = None):
+        super().__init__(target, shared)
+        from telegram_notifier import TelegramNotifier
+
+        shared = shared if shared is not None else {}
+        if self.provider not in shared:
+            # Failed deliveries are retried by the dispatcher, so a single attempt here
+            shared[self.provider] = TelegramNotifier(max_retries=1)
+        self.notifier = shared[self.provider]
+        self.chat_id = target or self.notifier.chat_id
+        self.MAX_MESSAGE_LENGTH = self.notifier.MAX_MESSAGE_LENGTH
+
+    @property
+    def destination(self) -> str:
+        return str(self.chat_id)
+
+    def sends_alone(self, payload: Dict) -> bool:
+        # Messages with attached PDFs are sent as their caption, not in a digest
+        return bool(config.TELEGRAM_ATTACH_PDFS and payload.get("attachments"))
+
+    def send_startup_notification(self) -> bool:
+        if self.target:
+            return super().send_startup_notification()
+        return self._guarded(self.notifier.send_startup_notification)
+
+    def _send(self, payload: Dict) -> bool:
+        if config.TELEGRAM_ATTACH_PDFS and payload.get("attachments"):
+            return self.notifier.send_documents(
+                payload["attachments"], payload["text"], chat_id=self.chat_id
+            )
+        return self.notifier.send_message(payload["text"], chat_id=self.chat_id)
+
+
+class WhatsAppChannel(NotificationChannel):
+    """WhatsApp number through Twilio"""
+
+    provider = "twilio"
+
+    def __init__(self, target: str = None, shared: Dict = None):
+        super().__init__(target, shared)
+        from whatsapp_notifier import WhatsAppNotifier
+
+        shared = shared if shared is not None else {}
+        if self.provider not in shared:
+            shared[self.provider] = WhatsAppNotifier(max_retries=1)
+        self.notifier = shared[self.provider]
+        self.to_number = target or self.notifier.to_number
+        self.MAX_MESSAGE_LENGTH = self.notifier.MAX_MESSAGE_LENGTH
+
+    @property
+    def destination(self) -> str:
+        return self.to_number
+
+    def sends_alone(self, payload: Dict) -> bool:
+        # Template messages carry a single purchase order
+        return self._uses_template(payload)
+
+    def last_reference(self) -> Optional[str]:
+        # The SID is joined to Twilio's delivery status by the reconciler
+        return self.notifier.last_sid
+
+    def send_startup_notification(self) -> bool:
+        if self.target:
+            return super().send_startup_notification()
+        return self._guarded(self.notifier.send_startup_notification)
+
+    def _send(self, payload: Dict) -> bool:
+        # Purchase orders use the approved template if configured (works outside the 24h window)
+        if self._uses_template(payload):
+            logger.info("Using WhatsApp template for notification")
+            return self.notifier.send_purchase_order_notification(
+                client_name=payload["template"]["client_name"],
+                po_number=payload["template"]["po_number"],
+                template_sid=config.TWILIO_WHATSAPP_TEMPLATE_SID,
+                to=self.to_number,
+            )
+        return self.notifier.send_message(payload["text"], to=self.to_number)
+
+    @staticmethod
+    def _uses_template(payload: Dict) -> bool:
+        return bool(config.TWILIO_WHATSAPP_TEMPLATE_SID and payload.get("template"))
+
+
+class WebhookChannel(NotificationChannel):
+    """HTTP endpoint receiving each notification as a JSON POST"""
+
+    provider = "webhook"
+    MAX_MESSAGE_LENGTH = 100_000
+
+    def __init__(self, target: str = None, shared: Dict = None):
+        """
+        Args:
+            target: Endpoint (defaults to config.NOTIFICATION_WEBHOOK_URL)
+            shared: Objects shared by the channels of a provider (the HTTP session)
+        """
+        super().__init__(target, shared)
+        shared = shared if shared is not None else {}
+        self.url = target or config.NOTIFICATION_WEBHOOK_URL
+        self.timeout = config.NOTIFICATION_WEBHOOK_TIMEOUT
+        self.session = shared.setdefault(self.provider, requests.Session())
+
+    @property
+    def destination(self) -> str:
+        return self.url
+
+    def _send(self, payload: Dict) -> bool:
+        response = self.session.post(
+            self.url,
+            json={**payload, "sent_at": datetime.now().isoformat()},
+            timeout=self.timeout,
+        )
+        if response.ok:
+            return True
+        logger.error(f"Webhook returned status {response.status_code}: {response.text[:200]}")
+        return False
+
+
+class FileChannel(NotificationChannel):
+    """Local JSON Lines file, one notification per line"""
+
+    provider = "file"
+    MAX_MESSAGE_LENGTH = 100_000
+
+    def __init__(self, target: str = None, shared: Dict = None):
+        """
+        Args:
+            target: File to append to (defaults to config.NOTIFICATION_FILE_SINK)
+            shared: Unused
+        """
+        super().__init__(target, shared)
+        self.path = target or config.NOTIFICATION_FILE_SINK
+        self._lock = threading.Lock()
+
+    @property
+    def destination(self) -> str:
+        return str(self.path)
+
+    def _send(self, payload: Dict) -> bool:
+        line = json.dumps({**payload, "sent_at": datetime.now().isoformat()}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return True
+
+
+CHANNEL_CLASSES = {
+    "telegram": TelegramChannel,
+    "twilio": WhatsAppChannel,
+    "webhook": WebhookChannel,
+    "file": FileChannel,
+}
+
+
+def build_channels(names: List[str]) -> Dict[str, NotificationChannel]:
+    """
+    Create a channel for each destination (e.g. "telegram", "telegram:12345")
+
+    Raises ValueError for an unknown provider.
+
+    Returns:
+        Dict of channel name -> channel, in the given order
+    """
+    channels = {}
+    shared = {}
+    for name in names:
+        provider, _, target = name.partition(":")
+        if provider not in CHANNEL_CLASSES:
+            raise ValueError(f"Invalid notification provider: {provider}")
+        channel = CHANNEL_CLASSES[provider](target or None, shared)
+        channels[channel.name] = channel
+        logger.info(f"Notification channel enabled: {channel.name} -> {channel.destination}")
+    return channels
+
+
+def fan_out(targets: Dict[str, Any], call: Callable[[Any], bool]) -> Dict[str, bool]:
+    """
+    Run call on every target (e.g. every channel) in parallel, so a slow one
+    does not hold up the rest
+
+    Returns:
+        Dict of target name -> result (False if the call raised)
+    """
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="notify") as executor:
+        futures = {name: executor.submit(call, target) for name, target in targets.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = bool(future.result())
+        except Exception as e:
+            logger.error(f"Error in notification fan-out to {name}: {str(e)}")
+            results[name] = False
+    return results
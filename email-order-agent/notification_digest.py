@@ -0,0 +1,121 @@
+"""
+Notification Digest Module
+Coalesces bursts of notifications for the same destination into digest
+messages: notifications are held for up to a maximum delay and released
+together, packed into digests that fit the provider's message length limit
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Set
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SEPARATOR = f"\n\n{'━' * 20}\n\n"
+
+
+def build_digest(texts: List[str]) -> str:
+    """Join several notification texts into one digest message"""
+    header = (
+        f"📬 RESUMEN: {len(texts)} NOTIFICACIONES\n"
+        f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    )
+    return header + DIGEST_SEPARATOR + DIGEST_SEPARATOR.join(texts)
+
+
+def digest_length(texts: List[str]) -> int:
+    """Length of the digest that build_digest would produce for texts"""
+    return len(build_digest(texts))
+
+
+class NotificationCoalescer:
+    """Holds notifications per destination and releases them as digests"""
+
+    def __init__(
+        self,
+        max_delay: float,
+        max_length: int,
+        release: Callable[[str, List[Dict]], None],
+    ):
+        """
+        Args:
+            max_delay: Seconds a notification may be held waiting for others
+            max_length: Longest digest message the provider accepts
+            release: Called with (destination, entries) when a group of held
+                entries is ready; each entry is a dict with 'key' and 'payload'
+        """
+        self.max_delay = max_delay
+        self.max_length = max_length
+        self.release = release
+
+        self._lock = threading.Lock()
+        self._windows: Dict[str, List[Dict]] = {}
+        self._timers: Dict[str, threading.Timer] = {}
+        # Keys held in a window or released in a digest not yet delivered
+        self._held: Set[str] = set()
+
+    def add(self, destination: str, key: str, payload: Dict):
+        """
+        Hold a notification until its destination's window closes
+
+        The window opens with the first held notification and closes after
+        max_delay, or earlier once the next notification would no longer fit
+        in a single digest.
+        """
+        entry = {"key": key, "payload": payload}
+        ready = None
+        with self._lock:
+            if key in self._held:
+                return
+            self._held.add(key)
+
+            window = self._windows.setdefault(destination, [])
+            texts = [held["payload"]["text"] for held in window]
+            if window and digest_length(texts + [payload["text"]]) > self.max_length:
+                ready = self._close(destination)
+                window = self._windows.setdefault(destination, [])
+
+            window.append(entry)
+            if destination not in self._timers:
+                timer = threading.Timer(self.max_delay, self._expire, args=(destination,))
+                timer.daemon = True
+                self._timers[destination] = timer
+                timer.start()
+
+        metrics.increment("notifications_coalesced")
+        if ready:
+            self.release(destination, ready)
+
+    def holds(self, key: str) -> bool:
+        """True while a notification is held or its digest is being delivered"""
+        with self._lock:
+            return key in self._held
+
+    def done(self, keys: List[str]):
+        """Forget released keys once their delivery finished (or was given up)"""
+        with self._lock:
+            self._held.difference_update(keys)
+
+    def flush(self):
+        """Release every open window now (e.g. before shutting down)"""
+        with self._lock:
+            ready = {destination: self._close(destination) for destination in list(self._windows)}
+        for destination, entries in ready.items():
+            if entries:
+                self.release(destination, entries)
+
+    def _expire(self, destination: str):
+        """Timer callback: the destination's window reached max_delay"""
+        with self._lock:
+            entries = self._close(destination)
+        if entries:
+            logger.info(f"Releasing digest of {len(entries)} notification(s) for {destination}")
+            self.release(destination, entries)
+
+    def _close(self, destination: str) -> List[Dict]:
+        """Close a destination's window (lock held); returns its entries"""
+        timer = self._timers.pop(destination, None)
+        if timer is not None:
+            timer.cancel()
+        return self._windows.pop(destination, [])
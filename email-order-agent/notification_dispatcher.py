@@ -0,0 +1,205 @@
+"""
+Notification Dispatcher Module
+Delivers notifications on a background thread, so email processing never waits
+on a slow or failing notification provider. Failed deliveries are rescheduled
+with backoff instead of sleeping inline, and a callback confirms delivery.
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import config
+from metrics import metrics
+from rate_limiter import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Bounded queue of notification jobs, delivered and retried by a worker thread"""
+
+    def __init__(
+        self,
+        queue_size: int = None,
+        max_attempts: int = None,
+        retry_base: float = None,
+        retry_max: float = None,
+    ):
+        """
+        Start the delivery worker
+
+        Args:
+            queue_size: Jobs waiting for their first attempt (defaults to config.NOTIFICATION_QUEUE_SIZE)
+            max_attempts: Attempts per job before giving up (defaults to config.NOTIFICATION_MAX_ATTEMPTS)
+            retry_base: Base backoff between attempts in seconds (defaults to config.NOTIFICATION_RETRY_BASE_SECONDS)
+            retry_max: Maximum backoff in seconds (defaults to config.NOTIFICATION_RETRY_MAX_SECONDS)
+        """
+        self.max_attempts = max_attempts or config.NOTIFICATION_MAX_ATTEMPTS
+        self.retry_base = retry_base if retry_base is not None else config.NOTIFICATION_RETRY_BASE_SECONDS
+        self.retry_max = retry_max if retry_max is not None else config.NOTIFICATION_RETRY_MAX_SECONDS
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size or config.NOTIFICATION_QUEUE_SIZE)
+        # Jobs waiting for a retry: (due time, sequence, job)
+        self._retries: List[Tuple[float, int, Dict]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: Set[str] = set()
+        self._stopping = False
+
+        self._thread = threading.Thread(
+            target=self._run, name="notification-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        key: str,
+        send: Callable[[], bool],
+        on_delivered: Optional[Callable[[], None]] = None,
+        on_failed: Optional[Callable[[], None]] = None,
+        timeout: float = 1.0,
+    ) -> bool:
+        """
+        Queue a notification for delivery
+
+        Args:
+            key: Identifies the notification (e.g. the email's Message-ID); a key
+                already waiting for delivery is not queued twice
+            send: Sends the notification, returning True on success
+            on_delivered: Called from the worker once send succeeds
+            on_failed: Called from the worker after the last failed attempt
+            timeout: Seconds to wait for room in a full queue
+
+        Returns:
+            True if the notification was queued (or already pending), False if the queue is full
+        """
+        with self._lock:
+            if key in self._pending:
+                return True
+            self._pending.add(key)
+
+        job = {
+            "key": key,
+            "send": send,
+            "on_delivered": on_delivered,
+            "on_failed": on_failed,
+            "attempts": 0,
+        }
+        try:
+            self._queue.put(job, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Notification queue full, not queued: {key[:50]}")
+            metrics.increment("notifications_rejected")
+            self._finish(key)
+            return False
+
+        metrics.increment("notifications_queued")
+        metrics.set_gauge("notification_queue_depth", self._queue.qsize())
+        return True
+
+    def is_pending(self, key: str) -> bool:
+        """True while a notification with this key is queued, in flight or waiting for a retry"""
+        with self._lock:
+            return key in self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued notification was delivered or given up
+
+        Returns:
+            True if nothing is pending anymore
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._idle:
+            while self._pending:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def stop(self, timeout: float = 30.0):
+        """Deliver what is pending (up to timeout), then stop the worker"""
+        if not self.flush(timeout):
+            with self._lock:
+                logger.warning(f"Stopping with {len(self._pending)} notification(s) undelivered")
+        self._stopping = True
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        """Worker loop: deliver new jobs and retries as they become due"""
+        while not self._stopping:
+            job = self._next_job()
+            if job is not None:
+                self._deliver(job)
+
+    def _next_job(self) -> Optional[Dict]:
+        """Return a due retry, or wait for a new job until the next retry is due"""
+        with self._lock:
+            if self._retries and self._retries[0][0] <= time.monotonic():
+                return heapq.heappop(self._retries)[2]
+            wait = self._retries[0][0] - time.monotonic() if self._retries else 1.0
+
+        try:
+            return self._queue.get(timeout=min(max(wait, 0.01), 1.0))
+        except queue.Empty:
+            return None
+
+    def _deliver(self, job: Dict):
+        """Attempt a job once, then confirm it, reschedule it or give up"""
+        job["attempts"] += 1
+        started = time.monotonic()
+        try:
+            delivered = job["send"]()
+        except Exception as e:
+            logger.error(f"Error delivering notification {job['key'][:50]}: {str(e)}")
+            delivered = False
+        metrics.observe("notification_delivery_seconds", time.monotonic() - started)
+        metrics.set_gauge("notification_queue_depth", self._queue.qsize())
+
+        if delivered:
+            metrics.increment("notifications_delivered")
+            self._callback(job, "on_delivered")
+            self._finish(job["key"])
+            return
+
+        if job["attempts"] < self.max_attempts:
+            delay = backoff_delay(job["attempts"], self.retry_base, self.retry_max)
+            logger.warning(
+                f"Notification attempt {job['attempts']}/{self.max_attempts} failed, "
+                f"retrying in {delay:.1f}s: {job['key'][:50]}"
+            )
+            metrics.increment("notification_retries")
+            with self._lock:
+                heapq.heappush(
+                    self._retries, (time.monotonic() + delay, next(self._sequence), job)
+                )
+            return
+
+        logger.error(
+            f"Notification failed after {job['attempts']} attempts: {job['key'][:50]}"
+        )
+        metrics.increment("notifications_failed")
+        self._callback(job, "on_failed")
+        self._finish(job["key"])
+
+    @staticmethod
+    def _callback(job: Dict, name: str):
+        """Run a job callback, logging its errors"""
+        if job[name] is None:
+            return
+        try:
+            job[name]()
+        except Exception as e:
+            logger.error(f"Error in notification {name} callback: {str(e)}")
+
+    def _finish(self, key: str):
+        """Forget a key and wake up flush() callers when nothing is pending"""
+        with self._idle:
+            self._pending.discard(key)
+            if not self._pending:
+                self._idle.notify_all()
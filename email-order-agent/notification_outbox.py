@@ -0,0 +1,264 @@
+"""
+Notification Outbox Module
+Persistent outbox of rendered notifications. Each notification is stored once
+under an idempotency key derived from the email's Message-ID, so an email is
+never re-analyzed just to retry its delivery, and storing it again (e.g. after
+a crash before the email was marked as processed) does not send it twice.
+
+Status of an entry:
+    pending      waiting for (another) delivery attempt
+    sending      a delivery attempt is in progress
+    sent         delivered
+    failed       given up after NOTIFICATION_OUTBOX_MAX_AGE_HOURS
+    unconfirmed  the process stopped during an attempt; it may or may not have
+                 been delivered, so it is not resent automatically
+
+Sent entries whose provider returned a message reference (a Twilio SID) keep
+it, with a delivery status ('awaiting' until a reconciler records the
+provider's final status, see twilio_reconciler.py).
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("pending", "sending", "sent", "failed", "unconfirmed")
+
+
+class NotificationOutbox:
+    """SQLite outbox of notifications waiting for delivery"""
+
+    def __init__(self, path=None, max_age_hours: float = None):
+        """
+        Open (or create) the outbox database
+
+        Args:
+            path: SQLite file (defaults to config.NOTIFICATION_OUTBOX_FILE)
+            max_age_hours: Give up on entries older than this (defaults to
+                config.NOTIFICATION_OUTBOX_MAX_AGE_HOURS)
+        """
+        self.path = path or config.NOTIFICATION_OUTBOX_FILE
+        self.max_age_seconds = (
+            max_age_hours if max_age_hours is not None else config.NOTIFICATION_OUTBOX_MAX_AGE_HOURS
+        ) * 3600
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                message_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT
+            )"""
+        )
+        # Columns added after the first release of the outbox
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column in ("provider_ref TEXT", "delivery_status TEXT", "sent_at REAL"):
+            if column.split()[0] not in columns:
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column}")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_delivery ON outbox (delivery_status)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(message_id: str, kind: str, channel: str = None) -> str:
+        """Idempotency key of one notification of an email (on one channel)"""
+        digest = hashlib.sha256(message_id.encode("utf-8")).hexdigest()[:32]
+        key = f"{digest}:{kind}"
+        return f"{key}@{channel}" if channel else key
+
+    def add(self, key: str, message_id: str, kind: str, payload: Dict) -> bool:
+        """
+        Store a rendered notification, unless its key is already in the outbox
+
+        Raises sqlite3.Error if the notification could not be stored.
+
+        Returns:
+            True if the notification was added, False if it was already stored
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, message_id, kind, payload, status, "
+                "created_at, updated_at, next_attempt_at) VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (key, message_id, kind, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+            self._conn.commit()
+        added = cursor.rowcount == 1
+        if not added:
+            logger.info(f"Notification {key} already in the outbox, not stored again")
+        return added
+
+    def claim(self, key: str) -> bool:
+        """
+        Mark a pending entry as being sent
+
+        Returns:
+            True if the caller may send it (False if it was sent, claimed or given up)
+        """
+        return self._update(
+            key, "status = 'sending', attempts = attempts + 1", "status = 'pending'"
+        )
+
+    def mark_sent(self, key: str, reference: str = None):
+        """
+        Record a confirmed delivery
+
+        Args:
+            key: Entry key
+            reference: Provider's message id (e.g. Twilio SID); its final
+                delivery status is then awaited
+        """
+        self._update(
+            key,
+            "status = 'sent', last_error = NULL, provider_ref = ?, delivery_status = ?, sent_at = ?",
+            params=(reference, "awaiting" if reference else None, time.time()),
+        )
+        metrics.increment("outbox_sent")
+
+    def awaiting_delivery(self, channel: str) -> List[Dict]:
+        """Sent entries of a provider's channels whose final delivery status is still unknown"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, provider_ref, sent_at FROM outbox "
+                "WHERE delivery_status = 'awaiting' AND (key LIKE ? OR key LIKE ?) ORDER BY sent_at",
+                (f"%@{channel}", f"%@{channel}:%"),
+            ).fetchall()
+        return [{"key": row[0], "provider_ref": row[1], "sent_at": row[2]} for row in rows]
+
+    def record_delivery(self, key: str, delivery_status: str, error: str = None):
+        """Record the provider's final delivery status of a sent entry"""
+        self._update(
+            key, "delivery_status = ?, last_error = COALESCE(?, last_error)",
+            params=(delivery_status, error),
+        )
+
+    def release(self, key: str, error: str = None, delay: float = 0):
+        """
+        Return an entry whose attempt failed (without being delivered) to pending
+
+        Entries older than the maximum age are marked as failed instead.
+
+        Args:
+            key: Entry key
+            error: Description of the failure
+            delay: Seconds before the entry is due again
+        """
+        entry = self.get(key)
+        if entry is None:
+            return
+        if time.time() - entry["created_at"] > self.max_age_seconds:
+            logger.error(f"Giving up on notification {key} after {entry['attempts']} attempts")
+            self._update(key, "status = 'failed', last_error = ?", params=(error,))
+            metrics.increment("outbox_failed")
+            return
+        self._update(
+            key, "status = 'pending', last_error = ?, next_attempt_at = ?",
+            params=(error, time.time() + delay),
+        )
+
+    def due(self, limit: int = 100) -> List[Dict]:
+        """Pending entries whose next attempt is due, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [entry for entry in (self.get(row[0]) for row in rows) if entry]
+
+    def recover(self) -> List[Dict]:
+        """
+        Handle entries left in 'sending' by a previous run (call at startup)
+
+        The process stopped between claiming and confirming them, so they may
+        already have been delivered. They are marked as unconfirmed instead of
+        being sent again.
+
+        Returns:
+            The unconfirmed entries
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM outbox WHERE status = 'sending'").fetchall()
+        entries = []
+        for (key,) in rows:
+            self._update(
+                key, "status = 'unconfirmed', last_error = ?",
+                params=("Interrupted during delivery",),
+            )
+            entries.append(self.get(key))
+            logger.warning(
+                f"Notification {key} was being sent when the agent stopped; "
+                f"not resending it (it may have been delivered)"
+            )
+        if entries:
+            metrics.increment("outbox_unconfirmed", len(entries))
+        return entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return an entry with its decoded payload, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, message_id, kind, payload, status, attempts, created_at, "
+                "last_error, provider_ref, delivery_status, sent_at FROM outbox WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "key": row[0],
+            "message_id": row[1],
+            "kind": row[2],
+            "payload": json.loads(row[3]),
+            "status": row[4],
+            "attempts": row[5],
+            "created_at": row[6],
+            "last_error": row[7],
+            "provider_ref": row[8],
+            "delivery_status": row[9],
+            "sent_at": row[10],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """Number of entries per status (also published as gauges)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+            ).fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update(dict(rows))
+        for status, count in counts.items():
+            metrics.set_gauge(f"outbox_{status}", count)
+        return counts
+
+    def _update(self, key: str, assignments: str, condition: str = None, params=()) -> bool:
+        """Update an entry; returns True if it matched the condition"""
+        query = f"UPDATE outbox SET {assignments}, updated_at = ? WHERE key = ?"
+        if condition:
+            query += f" AND {condition}"
+        try:
+            with self._lock:
+                cursor = self._conn.execute(query, (*params, time.time(), key))
+                self._conn.commit()
+            return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Error updating outbox entry {key}: {str(e)}")
+            return False
@@ -0,0 +1,126 @@
+"""
+Notification Router Module
+Decides which destinations receive an email's notifications, so each account
+manager gets only their own customers' orders. Rules are read from a JSON
+file and compiled into dictionaries keyed by sender address, sender domain
+and client name, so routing an email is a few dictionary lookups.
+
+Example notification_routes.json:
+
+    {
+        "routes": [
+            {"sender": "compras@acme.com.mx", "destinations": ["telegram:111111"]},
+            {"domain": "acme.com.mx", "destinations": ["telegram:111111"]},
+            {"client": "Industrias Químicas del Norte", "destinations": ["telegram:222222", "twilio:whatsapp:+5215550000000"]}
+        ],
+        "copy_default": false
+    }
+
+Emails matching no rule go to the default destinations (NOTIFICATION_PROVIDER);
+with copy_default they also receive every routed email.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import config
+
+logger = logging.getLogger(__name__)
+
+RULE_KEYS = ("sender", "domain", "client")
+
+
+def normalize_client(name: str) -> str:
+    """Client names are matched case and whitespace insensitively"""
+    return " ".join(name.lower().split())
+
+
+class NotificationRouter:
+    """Precompiled routing rules: sender, domain and client -> destinations"""
+
+    def __init__(self, routes: List[Dict], default: List[str], copy_default: bool = False):
+        """
+        Args:
+            routes: Rules, each with one of 'sender', 'domain' or 'client' and a
+                list of 'destinations'
+            default: Destinations of emails no rule matches
+            copy_default: Also send routed emails to the default destinations
+
+        Raises ValueError for a rule without a match key or destinations.
+        """
+        self.default = list(default)
+        self.copy_default = copy_default
+        self._tables: Dict[str, Dict[str, List[str]]] = {key: {} for key in RULE_KEYS}
+
+        for rule in routes:
+            keys = [key for key in RULE_KEYS if rule.get(key)]
+            destinations = rule.get("destinations") or []
+            if len(keys) != 1 or not destinations:
+                raise ValueError(f"Invalid notification route: {rule}")
+            key = keys[0]
+            value = rule[key]
+            value = normalize_client(value) if key == "client" else value.lower().strip()
+            table = self._tables[key].setdefault(value, [])
+            table.extend(d for d in destinations if d not in table)
+
+        logger.info(
+            f"Notification routes: {len(self._tables['sender'])} sender(s), "
+            f"{len(self._tables['domain'])} domain(s), {len(self._tables['client'])} client(s)"
+        )
+
+    @classmethod
+    def from_file(cls, path: Optional[Path] = None, default: List[str] = None) -> "NotificationRouter":
+        """
+        Load the rules from NOTIFICATION_ROUTES_FILE (no file means no rules)
+
+        Raises ValueError if the file is not valid.
+        """
+        path = Path(path or config.NOTIFICATION_ROUTES_FILE)
+        default = default if default is not None else config.NOTIFICATION_PROVIDERS
+        if not path.exists():
+            return cls([], default)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Could not read notification routes {path}: {str(e)}")
+        return cls(data.get("routes", []), default, data.get("copy_default", False))
+
+    @property
+    def destinations(self) -> List[str]:
+        """Every destination a notification may be routed to (default ones first)"""
+        destinations = list(self.default)
+        for table in self._tables.values():
+            for targets in table.values():
+                destinations.extend(d for d in targets if d not in destinations)
+        return destinations
+
+    def route(self, sender_email: str, client_names: Iterable[str] = ()) -> List[str]:
+        """
+        Destinations of an email
+
+        Args:
+            sender_email: Sender address
+            client_names: Client names found by the analysis (e.g. of each PDF)
+
+        Returns:
+            Destinations matched by sender, domain or client, or the defaults
+        """
+        sender = (sender_email or "").lower().strip()
+        matches = [
+            self._tables["sender"].get(sender),
+            self._tables["domain"].get(sender.rpartition("@")[2]),
+            *(self._tables["client"].get(normalize_client(name)) for name in client_names if name),
+        ]
+
+        destinations = []
+        for targets in matches:
+            for destination in targets or ():
+                if destination not in destinations:
+                    destinations.append(destination)
+
+        if not destinations:
+            return list(self.default)
+        if self.copy_default:
+            destinations.extend(d for d in self.default if d not in destinations)
+        return destinations
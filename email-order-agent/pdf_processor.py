@@ -4,8 +4,11 @@ Extracts text content from PDF files using pdfplumber
 """
 import logging
 import pdfplumber
+from pdfplumber.page import Page
+from pdfminer.pdfpage import PDFPage
 from io import BytesIO
-from typing import Optional
+from typing import Iterator, Optional, Tuple
+import config
 
 logger = logging.getLogger(__name__)
 
@@ -14,13 +17,91 @@ class PDFProcessor:
     """Handles PDF text extraction"""
 
     @staticmethod
-    def extract_text(pdf_data: bytes, filename: str = "unknown.pdf") -> Optional[str]:
+    def iter_pages(
+        pdf_data: bytes, filename: str = "unknown.pdf", max_pages: Optional[int] = None
+    ) -> Iterator[Tuple[int, Page]]:
+        """
+        Stream the pages of PDF binary data one at a time
+
+        Pages are built lazily from the pdfminer page tree instead of through
+        pdf.pages, which keeps every Page object (and its parsed layout cache)
+        alive until the document is closed. Each page is flushed as soon as
+        the caller moves on to the next one, so memory stays flat regardless
+        of page count.
+
+        Args:
+            pdf_data: Binary PDF data
+            filename: Name of the PDF file (for logging)
+            max_pages: Maximum number of pages to read (defaults to config.PDF_MAX_PAGES)
+
+        Yields:
+            Tuples of (page_number, page)
+        """
+        if max_pages is None:
+            max_pages = config.PDF_MAX_PAGES
+
+        with pdfplumber.open(BytesIO(pdf_data)) as pdf:
+            doctop = 0
+            for page_num, page_obj in enumerate(PDFPage.create_pages(pdf.doc), 1):
+                if max_pages and page_num > max_pages:
+                    logger.warning(
+                        f"{filename} exceeds the page limit ({max_pages}), "
+                        f"remaining pages skipped"
+                    )
+                    break
+
+                page = Page(pdf, page_obj, page_number=page_num, initial_doctop=doctop)
+                doctop += page.height
+                try:
+                    yield page_num, page
+                finally:
+                    # Release parsed layout objects before moving to the next page
+                    page.close()
+
+    @staticmethod
+    def _page_text(page: Page, page_num: int) -> Optional[str]:
+        """Text of a page, or None if it has none or extraction fails"""
+        try:
+            page_text = page.extract_text()
+            if page_text:
+                logger.debug(f"Extracted text from page {page_num}")
+                return page_text
+            logger.warning(f"No text found on page {page_num}")
+        except Exception as e:
+            logger.error(f"Error extracting page {page_num}: {str(e)}")
+        return None
+
+    @staticmethod
+    def iter_page_text(
+        pdf_data: bytes, filename: str = "unknown.pdf", max_pages: Optional[int] = None
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Stream text from PDF binary data one page at a time (see iter_pages)
+
+        Args:
+            pdf_data: Binary PDF data
+            filename: Name of the PDF file (for logging)
+            max_pages: Maximum number of pages to read (defaults to config.PDF_MAX_PAGES)
+
+        Yields:
+            Tuples of (page_number, page_text) for pages that contain text
+        """
+        for page_num, page in PDFProcessor.iter_pages(pdf_data, filename, max_pages):
+            page_text = PDFProcessor._page_text(page, page_num)
+            if page_text:
+                yield page_num, page_text
+
+    @staticmethod
+    def extract_text(
+        pdf_data: bytes, filename: str = "unknown.pdf", max_pages: Optional[int] = None
+    ) -> Optional[str]:
         """
         Extract text from PDF binary data
 
         Args:
             pdf_data: Binary PDF data
             filename: Name of the PDF file (for logging)
+            max_pages: Maximum number of pages to read (defaults to config.PDF_MAX_PAGES)
 
         Returns:
             Extracted text or None if extraction fails
@@ -29,22 +110,13 @@ class PDFProcessor:
             logger.info(f"Processing PDF: {filename}")
 
             text_content = []
+            pages_read = 0
 
-            with pdfplumber.open(BytesIO(pdf_data)) as pdf:
-                num_pages = len(pdf.pages)
-                logger.info(f"PDF has {num_pages} pages")
-
-                for page_num, page in enumerate(pdf.pages, 1):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_content.append(f"--- Page {page_num} ---\n{page_text}")
-                            logger.debug(f"Extracted text from page {page_num}")
-                        else:
-                            logger.warning(f"No text found on page {page_num}")
-                    except Exception as e:
-                        logger.error(f"Error extracting page {page_num}: {str(e)}")
-                        continue
+            for page_num, page in PDFProcessor.iter_pages(pdf_data, filename, max_pages):
+                pages_read += 1
+                page_text = PDFProcessor._page_text(page, page_num)
+                if page_text:
+                    text_content.append(f"--- Page {page_num} ---\n{page_text}")
 
             if not text_content:
                 logger.warning(f"No text could be extracted from {filename}")
@@ -52,7 +124,8 @@ class PDFProcessor:
 
             full_text = "\n\n".join(text_content)
             logger.info(
-                f"Successfully extracted {len(full_text)} characters from {filename}"
+                f"Successfully extracted {len(full_text)} characters from {filename} "
+                f"({pages_read} pages read, {len(text_content)} with text)"
             )
 
             return full_text
@@ -62,13 +135,18 @@ class PDFProcessor:
             return None
 
     @staticmethod
-    def extract_tables(pdf_data: bytes, filename: str = "unknown.pdf") -> list:
+    def extract_tables(
+        pdf_data: bytes, filename: str = "unknown.pdf", max_pages: Optional[int] = None
+    ) -> list:
         """
         Extract tables from PDF (optional advanced feature)
 
+        Pages are streamed like extract_text's, up to the same page limit.
+
         Args:
             pdf_data: Binary PDF data
             filename: Name of the PDF file
+            max_pages: Maximum number of pages to read (defaults to config.PDF_MAX_PAGES)
 
         Returns:
             List of tables found in the PDF
@@ -76,18 +154,17 @@ class PDFProcessor:
         try:
             tables = []
 
-            with pdfplumber.open(BytesIO(pdf_data)) as pdf:
-                for page_num, page in enumerate(pdf.pages, 1):
-                    try:
-                        page_tables = page.extract_tables()
-                        if page_tables:
-                            tables.extend(page_tables)
-                            logger.debug(
-                                f"Found {len(page_tables)} tables on page {page_num}"
-                            )
-                    except Exception as e:
-                        logger.error(f"Error extracting tables from page {page_num}: {str(e)}")
-                        continue
+            for page_num, page in PDFProcessor.iter_pages(pdf_data, filename, max_pages):
+                try:
+                    page_tables = page.extract_tables()
+                    if page_tables:
+                        tables.extend(page_tables)
+                        logger.debug(
+                            f"Found {len(page_tables)} tables on page {page_num}"
+                        )
+                except Exception as e:
+                    logger.error(f"Error extracting tables from page {page_num}: {str(e)}")
+                    continue
 
             logger.info(f"Extracted {len(tables)} tables from {filename}")
             return tables
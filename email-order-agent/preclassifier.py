@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Pre-classifier Module
+Fast local classifier in front of the Claude analyses. Keyword/regex features
+feed a logistic model (trained from the labels of previous Claude analyses)
+that routes obvious non-orders (CFDI invoices, statements, certificates,
+delivery receipts, out of office replies, newsletters) to a cheap path.
+
+Nothing is skipped until a model has been trained on MIN_TRAINING_SAMPLES
+labeled documents; until then every document is scored and sent to Claude,
+and its label recorded. Afterwards a sample of the skipped documents is still
+sent to Claude to measure the false negative rate (real orders wrongly
+skipped). Those audited documents are the only labels from below the skip
+threshold, so they are weighted by 1 / PRECLASSIFIER_AUDIT_RATE in training.
+
+Usage:
+    python preclassifier.py            # Show model and sample stats
+    python preclassifier.py --train    # Retrain from stored samples
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List
+import config
+from metrics import metrics
+from text_selector import SIGNALS
+
+logger = logging.getLogger(__name__)
+
+# Document kinds, each with its own model: PDF attachments and email bodies
+DOCUMENT = "document"
+EMAIL = "email"
+
+# Keyword groups; each becomes a log-count feature
+KEYWORD_FEATURES = {
+    "kw_order": r"orden\s+de\s+compra|purchase\s+order|orden\s+de\s+pedido|pedido|\bo\.?c\.?\b|\bp\.?o\.?\b|surtir|cotizaci[oó]n",
+    "kw_invoice": r"\bfactura\b|invoice|\bcfdi\b|comprobante\s+fiscal|timbre\s+fiscal|sello\s+digital|folio\s+fiscal|r[eé]gimen\s+fiscal",
+    "kw_statement": r"estado\s+de\s+cuenta|account\s+statement|\bstatement\b|saldo\s+vencido|antig[uü]edad\s+de\s+saldos",
+    "kw_certificate": r"certificado\s+de\s+an[aá]lisis|certificate\s+of\s+analysis|hoja\s+de\s+(datos\s+de\s+)?seguridad|safety\s+data\s+sheet|\bm?sds\b|ficha\s+t[eé]cnica",
+    "kw_receipt": r"acuse\s+de\s+recibo|delivery\s+(status\s+)?notification|read\s+receipt|undeliverable|no\s+se\s+pudo\s+entregar|mail\s+delivery|confirmaci[oó]n\s+de\s+lectura",
+    "kw_autoreply": r"fuera\s+de\s+(la\s+)?oficina|out\s+of\s+(the\s+)?office|respuesta\s+autom[aá]tica|auto(matic)?[\s-]?reply|de\s+vacaciones",
+    "kw_newsletter": r"unsubscribe|darse\s+de\s+baja|newsletter|bolet[ií]n|webinar|promoci[oó]n",
+}
+KEYWORD_PATTERNS = {
+    name: re.compile(pattern, re.IGNORECASE) for name, pattern in KEYWORD_FEATURES.items()
+}
+
+# Hand-set starting weights, used to score documents (never to skip them)
+# until enough labeled samples exist to train
+DEFAULT_BIAS = 0.5
+DEFAULT_WEIGHTS = {
+    "kw_order": 2.5,
+    "po_number": 2.0,
+    "quantities": 1.0,
+    "prices": 0.5,
+    "kw_invoice": -2.5,
+    "kw_statement": -2.0,
+    "kw_certificate": -2.5,
+    "kw_receipt": -3.0,
+    "kw_autoreply": -3.0,
+    "kw_newsletter": -2.5,
+    "length": 0.0,
+}
+
+# Spanish description of why a document was skipped, for the notification
+REASON_LABELS = {
+    "invoice": "factura / CFDI",
+    "statement": "estado de cuenta",
+    "certificate": "certificado o hoja de seguridad",
+    "receipt": "acuse de entrega",
+    "autoreply": "respuesta automática",
+    "newsletter": "boletín o publicidad",
+    "no_order_signals": "documento sin datos de pedido",
+}
+
+MIN_TRAINING_SAMPLES = 30
+MAX_TRAINING_SAMPLES = 2000  # Most recent samples kept per kind, keeps retraining fast
+RETRAIN_EVERY = 20
+
+# Both kinds append to the same samples file
+_samples_lock = threading.Lock()
+
+
+def extract_features(text: str, subject: str = "") -> Dict[str, float]:
+    """
+    Extract keyword/regex features from a document
+
+    Counts are log-scaled so a long document does not dominate the score.
+
+    Args:
+        text: Document or email body text
+        subject: Email subject (for email bodies)
+
+    Returns:
+        Dictionary of feature name to value
+    """
+    content = f"{subject}\n{text}" if subject else text
+    po_number, _, quantities, prices = (pattern for pattern, _ in SIGNALS[:4])
+
+    features = {
+        name: math.log1p(len(pattern.findall(content)))
+        for name, pattern in KEYWORD_PATTERNS.items()
+    }
+    features["po_number"] = math.log1p(len(po_number.findall(content)))
+    features["quantities"] = math.log1p(len(quantities.findall(content)))
+    features["prices"] = math.log1p(len(prices.findall(content)))
+    features["length"] = math.log1p(len(content)) / 10
+    return features
+
+
+def sigmoid(value: float) -> float:
+    """Logistic function, safe for large negative values"""
+    if value < -35:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+class PreClassifier:
+    """Logistic classifier deciding whether a document needs Claude"""
+
+    def __init__(self, kind: str):
+        """
+        Load the trained model for a kind of document, or the default weights
+
+        Args:
+            kind: DOCUMENT (PDF attachments) or EMAIL (email bodies)
+        """
+        self.kind = kind
+        self.samples_file = config.PRECLASSIFIER_SAMPLES_FILE
+        self.model_file = config.PRECLASSIFIER_MODEL_FILE
+        self.skip_threshold = config.PRECLASSIFIER_SKIP_THRESHOLD
+        self.audit_rate = config.PRECLASSIFIER_AUDIT_RATE
+
+        self._lock = threading.Lock()
+        self.bias = DEFAULT_BIAS
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.trained_samples = 0
+        self._new_samples = 0
+        self._training = False
+        self._load_model()
+
+    def classify(self, text: str, subject: str = "") -> Dict:
+        """
+        Score a document and decide whether it can skip Claude
+
+        Untrained classifiers (fewer than MIN_TRAINING_SAMPLES) never skip: the
+        hand-set weights are not backed by labeled data.
+
+        Returns:
+            Decision dict with 'features', 'probability' (of being an order),
+            'skip' (route to the cheap path), 'audit' (skipped, but sent to
+            Claude anyway to measure false negatives) and 'reason'
+        """
+        features = extract_features(text, subject)
+        probability = self.score(features)
+        with self._lock:
+            trained = self.trained_samples >= MIN_TRAINING_SAMPLES
+        below_threshold = probability < self.skip_threshold
+        audit = trained and below_threshold and random.random() < self.audit_rate
+
+        # The negative feature that pushed the score down the most
+        contributions = {
+            name[3:]: -self.weights.get(name, 0.0) * features[name]
+            for name in KEYWORD_FEATURES if name != "kw_order"
+        }
+        reason = max(contributions, key=contributions.get)
+        if contributions[reason] <= 0:
+            reason = "no_order_signals"
+
+        if not trained:
+            # Scored and labeled by Claude, to train the model
+            metrics.increment(f"preclassifier_{self.kind}_untrained")
+        elif not below_threshold:
+            metrics.increment(f"preclassifier_{self.kind}_sent")
+        elif audit:
+            metrics.increment(f"preclassifier_{self.kind}_audited")
+        else:
+            metrics.increment(f"preclassifier_{self.kind}_skipped")
+
+        return {
+            "features": features,
+            "probability": probability,
+            "skip": trained and below_threshold and not audit,
+            "audit": audit,
+            "reason": reason,
+        }
+
+    def score(self, features: Dict[str, float]) -> float:
+        """Probability that a document is an order (or a relevant email)"""
+        with self._lock:
+            bias, weights = self.bias, self.weights
+        value = bias + sum(
+            weights.get(name, 0.0) * feature for name, feature in features.items()
+        )
+        return sigmoid(value)
+
+    def record_outcome(self, decision: Dict, is_order: bool):
+        """
+        Store the label Claude assigned to a classified document
+
+        Audited documents that turn out to be orders are false negatives; their
+        rate is reported as preclassifier_<kind>_false_negative_rate. Once the
+        classifier is trained, skipped documents are only labeled when audited,
+        so audited samples are the only unbiased negatives (and positives) from
+        below the threshold; they are stored with weight 1 / audit_rate to stand
+        for the skipped documents. The model is retrained on a background thread
+        every RETRAIN_EVERY new samples, so the analyses (and their event loop)
+        never wait for it.
+        """
+        if decision["audit"]:
+            if is_order:
+                metrics.increment(f"preclassifier_{self.kind}_false_negatives")
+                logger.warning(
+                    f"Pre-classifier would have skipped a real order "
+                    f"(p={decision['probability']:.3f}, looked like {decision['reason']})"
+                )
+            audited = metrics.get_counter(f"preclassifier_{self.kind}_audited")
+            false_negatives = metrics.get_counter(f"preclassifier_{self.kind}_false_negatives")
+            metrics.set_gauge(
+                f"preclassifier_{self.kind}_false_negative_rate",
+                false_negatives / audited if audited else 0.0,
+            )
+
+        sample = {
+            "kind": self.kind,
+            "features": decision["features"],
+            "label": 1 if is_order else 0,
+            "weight": 1.0 / self.audit_rate if decision["audit"] and self.audit_rate else 1.0,
+            "timestamp": datetime.now().isoformat(),
+        }
+        with _samples_lock:
+            try:
+                with open(self.samples_file, "a") as f:
+                    f.write(json.dumps(sample) + "\n")
+            except Exception as e:
+                logger.error(f"Error saving pre-classifier sample: {str(e)}")
+                return
+        with self._lock:
+            self._new_samples += 1
+            retrain = self._new_samples >= RETRAIN_EVERY and not self._training
+            if retrain:
+                self._training = True
+
+        if retrain:
+            threading.Thread(
+                target=self._train_in_background, name=f"preclassifier-{self.kind}", daemon=True
+            ).start()
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error(f"Error retraining the {self.kind} pre-classifier: {str(e)}")
+        finally:
+            with self._lock:
+                self._training = False
+
+    def train(self, epochs: int = 300, learning_rate: float = 0.1, l2: float = 0.01) -> bool:
+        """
+        Fit the logistic model to the stored samples with gradient descent
+
+        Samples are weighted by their 'weight' (audited skips stand for all the
+        skipped documents they were drawn from).
+
+        The fit runs on local copies; the new weights replace the current ones
+        at once when it finishes, so documents classified meanwhile use the old model.
+
+        Returns:
+            True if a new model was trained and saved
+        """
+        self._rotate_samples()
+        samples = self._load_samples()[-MAX_TRAINING_SAMPLES:]
+        with self._lock:
+            self._new_samples = 0
+
+        labels = {sample["label"] for sample in samples}
+        if len(samples) < MIN_TRAINING_SAMPLES or len(labels) < 2:
+            logger.info(
+                f"Not enough {self.kind} samples to train the pre-classifier "
+                f"({len(samples)}, need {MIN_TRAINING_SAMPLES} with both labels)"
+            )
+            return False
+
+        names = list(DEFAULT_WEIGHTS)
+        bias, weights = DEFAULT_BIAS, dict(DEFAULT_WEIGHTS)
+        count = len(samples)
+        total_weight = sum(sample.get("weight", 1.0) for sample in samples)
+
+        for _ in range(epochs):
+            bias_gradient = 0.0
+            gradients = {name: 0.0 for name in names}
+            for sample in samples:
+                features = sample["features"]
+                error = sigmoid(
+                    bias + sum(weights[name] * features.get(name, 0.0) for name in names)
+                ) - sample["label"]
+                error *= sample.get("weight", 1.0)
+                bias_gradient += error
+                for name in names:
+                    gradients[name] += error * features.get(name, 0.0)
+
+            bias -= learning_rate * bias_gradient / total_weight
+            for name in names:
+                weights[name] -= learning_rate * (gradients[name] / total_weight + l2 * weights[name])
+
+        with self._lock:
+            self.bias, self.weights, self.trained_samples = bias, weights, count
+        self._save_model()
+
+        logger.info(f"Pre-classifier for {self.kind} retrained on {count} samples")
+        return True
+
+    def evaluate(self) -> Dict:
+        """Return sample counts and how the current model would route the stored samples"""
+        samples = self._load_samples()
+        orders = [s for s in samples if s["label"] == 1]
+        others = [s for s in samples if s["label"] == 0]
+        skipped_orders = sum(1 for s in orders if self.score(s["features"]) < self.skip_threshold)
+        skipped_others = sum(1 for s in others if self.score(s["features"]) < self.skip_threshold)
+
+        return {
+            "kind": self.kind,
+            "samples": len(samples),
+            "orders": len(orders),
+            "non_orders": len(others),
+            "trained_samples": self.trained_samples,
+            "skip_threshold": self.skip_threshold,
+            "non_orders_skipped": skipped_others,
+            "orders_skipped": skipped_orders,
+            "false_negative_rate": skipped_orders / len(orders) if orders else 0.0,
+        }
+
+    def _rotate_samples(self):
+        """Keep only the MAX_TRAINING_SAMPLES most recent samples of each kind in the file"""
+        with _samples_lock:
+            try:
+                if not self.samples_file.exists():
+                    return
+                with open(self.samples_file, "r") as f:
+                    lines = [line for line in f if line.strip()]
+                kept, counts = [], {}
+                for line in reversed(lines):
+                    kind = json.loads(line).get("kind")
+                    counts[kind] = counts.get(kind, 0) + 1
+                    if counts[kind] <= MAX_TRAINING_SAMPLES:
+                        kept.append(line)
+                if len(kept) == len(lines):
+                    return
+                temp_file = self.samples_file.with_suffix(".tmp")
+                with open(temp_file, "w") as f:
+                    f.writelines(reversed(kept))
+                os.replace(temp_file, self.samples_file)
+                logger.info(f"Pre-classifier samples rotated: kept {len(kept)} of {len(lines)}")
+            except Exception as e:
+                logger.error(f"Error rotating pre-classifier samples: {str(e)}")
+
+    def _load_samples(self) -> List[Dict]:
+        """Load the stored samples for this kind of document"""
+        samples = []
+        try:
+            with _samples_lock:
+                if self.samples_file.exists():
+                    with open(self.samples_file, "r") as f:
+                        for line in f:
+                            if line.strip():
+                                sample = json.loads(line)
+                                if sample.get("kind") == self.kind:
+                                    samples.append(sample)
+        except Exception as e:
+            logger.error(f"Error loading pre-classifier samples: {str(e)}")
+        return samples
+
+    def _load_model(self):
+        """Load trained weights for this kind, keeping the defaults if there are none"""
+        try:
+            if self.model_file.exists():
+                with open(self.model_file, "r") as f:
+                    model = json.load(f).get(self.kind)
+                if model:
+                    self.bias = model["bias"]
+                    self.weights.update(model["weights"])
+                    self.trained_samples = model.get("samples", 0)
+                    logger.info(
+                        f"Loaded {self.kind} pre-classifier trained on {self.trained_samples} samples"
+                    )
+        except Exception as e:
+            logger.error(f"Error loading pre-classifier model: {str(e)}")
+
+    def _save_model(self):
+        """Save this kind's weights, keeping the models of other kinds"""
+        with self._lock:
+            try:
+                models = {}
+                if self.model_file.exists():
+                    with open(self.model_file, "r") as f:
+                        models = json.load(f)
+                models[self.kind] = {
+                    "bias": self.bias,
+                    "weights": self.weights,
+                    "samples": self.trained_samples,
+                    "trained_at": datetime.now().isoformat(),
+                }
+                with open(self.model_file, "w") as f:
+                    json.dump(models, f, indent=2)
+            except Exception as e:
+                logger.error(f"Error saving pre-classifier model: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local pre-classifier for the Claude analyses")
+    parser.add_argument("--train", action="store_true", help="Retrain from stored samples")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for kind in (DOCUMENT, EMAIL):
+        classifier = PreClassifier(kind)
+        if args.train:
+            classifier.train()
+        print(json.dumps(classifier.evaluate(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
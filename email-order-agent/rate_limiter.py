@@ -0,0 +1,189 @@
+"""
+Rate Limiter Module
+Client-side token buckets for API rate limits (requests and tokens per minute)
+and notification message limits per destination, plus the retry policy used for rate limit and overload errors
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server/overload errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most capacity
+
+    Callers reserve their cost up front; the balance may go negative, and the
+    returned delay is how long the caller must wait for its reservation to be
+    covered. This keeps waiting callers in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Args:
+            rate_per_minute: Refill rate
+            capacity: Maximum burst (defaults to one minute worth of tokens)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1) -> float:
+        """
+        Reserve cost tokens
+
+        Returns:
+            Seconds to wait before the reservation may be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+            # A single request larger than the bucket would otherwise never fit
+            self.level -= min(cost, self.capacity)
+
+            delay = -self.level / self.rate if self.level < 0 else 0.0
+            return max(delay, self.blocked_until - now)
+
+    def pause(self, seconds: float):
+        """Block new reservations for the given time (e.g. after a retry-after header)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by all callers"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """
+        Args:
+            requests_per_minute: Request limit (0 disables it)
+            tokens_per_minute: Input token limit (0 disables it)
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request and the given tokens, returning the delay before sending"""
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+    def acquire(self, tokens: int) -> float:
+        """Wait (blocking) until a request with the given tokens may be sent
+
+        Returns:
+            Seconds waited
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: int) -> float:
+        """Async version of acquire"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds: float):
+        """Stop all callers for the given time after the server rate limited us"""
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.pause(seconds)
+
+
+class DestinationRateLimiter:
+    """
+    Message rate limits per destination (a chat or a sender number), plus an
+    optional limit shared by all destinations
+
+    Buckets are created on first use, so one limiter serves any number of
+    destinations. Waiting callers queue in arrival order instead of failing.
+    """
+
+    def __init__(self, per_destination_per_minute: float, burst: float = 1, global_per_minute: float = 0):
+        """
+        Args:
+            per_destination_per_minute: Messages per minute to a single destination (0 disables it)
+            burst: Messages a destination may receive back to back
+            global_per_minute: Messages per minute across destinations (0 disables it)
+        """
+        self.per_destination_per_minute = per_destination_per_minute
+        self.burst = burst
+        self.shared = TokenBucket(global_per_minute, global_per_minute / 60) if global_per_minute > 0 else None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, destination: str) -> Optional[TokenBucket]:
+        """Return the destination's bucket, creating it on first use"""
+        if self.per_destination_per_minute <= 0:
+            return None
+        with self._lock:
+            if destination not in self._buckets:
+                self._buckets[destination] = TokenBucket(self.per_destination_per_minute, self.burst)
+            return self._buckets[destination]
+
+    def acquire(self, destination: str) -> float:
+        """Wait (blocking) until a message may be sent to destination
+
+        Returns:
+            Seconds waited
+        """
+        delay = 0.0
+        for bucket in (self._bucket(destination), self.shared):
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(1))
+        if delay > 0:
+            logger.debug(f"Rate limit: waiting {delay:.1f}s before messaging {destination}")
+            time.sleep(delay)
+        return delay
+
+    def pause(self, destination: str, seconds: float):
+        """Stop messages to destination for the given time (e.g. after a 429 response)"""
+        bucket = self._bucket(destination)
+        if bucket is None:
+            # Without per-destination limits the pause applies to everything
+            bucket = self.shared
+        if bucket is not None:
+            bucket.pause(seconds)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the retry-after delay requested by the server, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    return retry_after_header(response.headers)
+
+
+def retry_after_header(headers) -> Optional[float]:
+    """Parse the retry-after(-ms) response headers, if present"""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter for the given attempt (0-based)"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
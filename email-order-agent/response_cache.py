@@ -0,0 +1,211 @@
+"""
+Response Cache Module
+Persistent cache of Claude responses keyed by a hash of the request, with TTL
+expiry, size-based LRU eviction and single-flight coalescing of identical
+requests that are in flight at the same time
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and LRU eviction"""
+
+    def __init__(self, path=None, ttl_hours: float = None, max_mb: float = None):
+        """
+        Initialize the cache database
+
+        Args:
+            path: SQLite file (defaults to config.LLM_CACHE_FILE)
+            ttl_hours: Entry lifetime (defaults to config.LLM_CACHE_TTL_HOURS)
+            max_mb: Maximum total size of cached values (defaults to config.LLM_CACHE_MAX_MB)
+        """
+        self.path = path or config.LLM_CACHE_FILE
+        self.ttl_seconds = (ttl_hours if ttl_hours is not None else config.LLM_CACHE_TTL_HOURS) * 3600
+        self.max_bytes = int((max_mb if max_mb is not None else config.LLM_CACHE_MAX_MB) * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+
+        # Requests currently being computed, for single-flight coalescing
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_async: Dict[str, asyncio.Future] = {}
+
+        self._evict()
+        logger.info(
+            f"Response cache ready: {self.path.name} "
+            f"(TTL {self.ttl_seconds / 3600:.0f}h, max {self.max_bytes // (1024 * 1024)} MB)"
+        )
+
+    @staticmethod
+    def make_key(request: Dict, version: str) -> str:
+        """Hash a request (model, prompts, parameters) together with the prompt version"""
+        payload = json.dumps({"version": version, "request": request}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Return a cached value, or None if missing or expired
+
+        A hit refreshes the entry's LRU position and counts its tokens as saved.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, tokens, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self._record_lookup(hit=False)
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        self._record_lookup(hit=True, saved_tokens=row[1])
+        logger.info(f"Response cache hit ({row[1]} tokens saved)")
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict, tokens: int = 0):
+        """Store a value and evict least recently used entries if over the size limit"""
+        data = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, tokens, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, len(data), tokens, now, now),
+            )
+            self._conn.commit()
+        self._evict()
+
+    def single_flight(self, key: str, compute: Callable[[], Dict]) -> Tuple[Dict, bool]:
+        """
+        Run compute() unless an identical request is already running in another
+        thread, in which case wait for it and share its value
+
+        Returns:
+            Tuple of (value, is_leader); followers get the leader's value (or None on failure)
+        """
+        with self._lock:
+            event = self._inflight.get(key)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                event.value = None
+                self._inflight[key] = event
+
+        if not is_leader:
+            metrics.increment("llm_cache_coalesced")
+            event.wait()
+            return event.value, False
+
+        try:
+            event.value = compute()
+            return event.value, True
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    async def single_flight_async(
+        self, key: str, compute: Callable[[], Awaitable[Dict]]
+    ) -> Tuple[Optional[Dict], bool]:
+        """
+        Async version of single_flight: concurrent identical requests share one call
+
+        Returns:
+            Tuple of (value, is_leader); followers get the leader's value (or None on failure)
+        """
+        future = self._inflight_async.get(key)
+        if future is not None:
+            metrics.increment("llm_cache_coalesced")
+            return await asyncio.shield(future), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_async[key] = future
+        try:
+            value = await compute()
+            future.set_result(value)
+            return value, True
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            del self._inflight_async[key]
+
+    def stats(self) -> Dict:
+        """Return the number of entries and total size of the cache"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def _record_lookup(self, hit: bool, saved_tokens: int = 0):
+        """Update hit/miss counters and the hit ratio gauge"""
+        if hit:
+            metrics.increment("llm_cache_hits")
+            metrics.increment("llm_cache_saved_tokens", saved_tokens)
+        else:
+            metrics.increment("llm_cache_misses")
+
+        hits = metrics.get_counter("llm_cache_hits")
+        total = hits + metrics.get_counter("llm_cache_misses")
+        metrics.set_gauge("llm_cache_hit_ratio", hits / total if total else 0.0)
+
+    def _evict(self):
+        """Delete expired entries, then least recently used ones until under max size"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                rows = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access ASC"
+                ).fetchall()
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+                logger.info(f"Response cache evicted {evicted} least recently used entries")
+
+            self._conn.commit()
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        metrics.set_gauge("llm_cache_entries", entries)
+        metrics.set_gauge("llm_cache_bytes", total)
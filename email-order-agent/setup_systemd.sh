@@ -60,7 +60,12 @@ After=network.target
 Wants=network-online.target
 
 [Service]
-Type=simple
+# El agente avisa a systemd cuando está listo y envía pings de watchdog;
+# si un ciclo de monitoreo se cuelga deja de enviarlos y systemd lo reinicia
+Type=notify
+NotifyAccess=main
+WatchdogSec=120
+TimeoutStartSec=300
 User=$USER_NAME
 WorkingDirectory=$APP_DIR
 Environment="PATH=$APP_DIR/venv/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
@@ -3,12 +3,19 @@ Telegram Notifier Module
 Sends Telegram messages using Telegram Bot API
 Much simpler and more reliable than WhatsApp/Twilio
 """
+import json
 import logging
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from pathlib import Path
+from typing import Dict, List, Optional
 from datetime import datetime
 import time
+from urllib3.util.retry import Retry
 import config
+from metrics import metrics
+from multipart_stream import MultipartStream
+from rate_limiter import DestinationRateLimiter, retry_after_header
 
 logger = logging.getLogger(__name__)
 
@@ -16,13 +23,23 @@ logger = logging.getLogger(__name__)
 class TelegramNotifier:
     """Sends Telegram notifications using Bot API"""
 
-    def __init__(self, max_retries: int = 3, timeout: int = 30):
+    # Longest message sent as is (Telegram allows 4096 characters)
+    MAX_MESSAGE_LENGTH = 4000
+    # Messages a chat may receive back to back before its per-minute limit applies
+    CHAT_BURST = 3
+    # Bot API limits for documents: caption length, files per media group, upload size
+    MAX_CAPTION_LENGTH = 1024
+    MAX_MEDIA_GROUP_SIZE = 10
+    MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+    def __init__(self, max_retries: int = 3, timeout: int = 30, pool_size: int = 4):
         """
         Initialize Telegram Bot client
 
         Args:
             max_retries: Maximum number of retry attempts for failed messages
             timeout: Timeout in seconds for API calls
+            pool_size: Keep-alive connections kept open to api.telegram.org
         """
         try:
             self.bot_token = config.TELEGRAM_BOT_TOKEN
@@ -31,6 +48,16 @@ class TelegramNotifier:
             self.max_retries = max_retries
             self.timeout = timeout
 
+            # Shared session, so a burst of notifications reuses one TCP+TLS connection
+            self.session = self._create_session(pool_size)
+
+            # Per-chat and bot-wide message limits; bursts wait instead of failing
+            self.rate_limiter = DestinationRateLimiter(
+                config.TELEGRAM_CHAT_MESSAGES_PER_MINUTE,
+                self.CHAT_BURST,
+                config.TELEGRAM_MESSAGES_PER_SECOND * 60,
+            )
+
             logger.info(
                 f"Telegram notifier initialized. Chat ID: {self.chat_id}, "
                 f"Max retries: {max_retries}, Timeout: {timeout}s"
@@ -43,11 +70,109 @@ class TelegramNotifier:
             logger.error(f"Failed to initialize Telegram client: {str(e)}")
             raise
 
+    def _create_session(self, pool_size: int) -> requests.Session:
+        """
+        Create the HTTP session used for every Bot API call
+
+        Connection failures (the request never reached Telegram) are retried
+        by the adapter with backoff. 5xx responses are only retried for GET:
+        Telegram may have processed a POST that failed with 502/503, so sends
+        are left to the caller's retries (the dispatcher and outbox). Read
+        timeouts are never retried here for the same reason.
+        """
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _request(self, http_method: str, api_method: str, **kwargs) -> requests.Response:
+        """Call a Bot API method through the shared session, recording its latency"""
+        started = time.monotonic()
+        try:
+            return self.session.request(
+                http_method, f"{self.api_base_url}/{api_method}", **kwargs
+            )
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.observe(f"telegram_{api_method}_seconds", elapsed)
+            logger.debug(f"Telegram {api_method} took {elapsed * 1000:.0f} ms")
+
+    def _send(self, api_method: str, payload: dict, files: list = None) -> requests.Response:
+        """
+        POST a message to the chat within its rate limits
+
+        A 429 response pauses the chat for the retry_after Telegram asks for,
+        and the message is sent again once it is over, up to
+        NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS in total.
+
+        Args:
+            api_method: Bot API method
+            payload: Method parameters
+            files: (field name, filename, path, content type) of files to upload;
+                they are streamed from disk as multipart/form-data
+        """
+        chat_id = str(payload["chat_id"])
+        waited = 0.0
+        while True:
+            waited += self.rate_limiter.acquire(chat_id)
+            if files:
+                body = MultipartStream(payload, files)
+                try:
+                    response = self._request(
+                        "POST", api_method, data=body,
+                        headers={"Content-Type": body.content_type}, timeout=self.timeout,
+                    )
+                finally:
+                    body.close()
+            else:
+                response = self._request("POST", api_method, json=payload, timeout=self.timeout)
+            if response.status_code != 429:
+                return response
+
+            retry_after = self._retry_after(response)
+            metrics.increment("telegram_rate_limited")
+            if waited + retry_after > config.NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS:
+                logger.error(
+                    f"Telegram rate limit: would wait {retry_after:.0f}s more after "
+                    f"{waited:.0f}s, giving up on this attempt"
+                )
+                return response
+
+            logger.warning(f"Telegram rate limit reached, retrying in {retry_after:.0f}s")
+            self.rate_limiter.pause(chat_id, retry_after)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float:
+        """Seconds to wait after a 429 (parameters.retry_after, then the Retry-After header)"""
+        try:
+            retry_after = response.json().get("parameters", {}).get("retry_after")
+            if retry_after is not None:
+                return float(retry_after)
+        except (ValueError, AttributeError):
+            pass
+        retry_after = retry_after_header(response.headers)
+        return retry_after if retry_after is not None else 1.0
+
+    def close(self):
+        """Close the pooled connections"""
+        self.session.close()
+
     def _test_connection(self) -> bool:
         """Test Telegram bot connection"""
         try:
-            url = f"{self.api_base_url}/getMe"
-            response = requests.get(url, timeout=10)
+            response = self._request("GET", "getMe", timeout=10)
 
             if response.status_code == 200:
                 bot_info = response.json()
@@ -63,19 +188,20 @@ class TelegramNotifier:
             logger.error(f"Error testing Telegram connection: {str(e)}")
             return False
 
-    def send_message(self, message: str, parse_mode: str = "HTML") -> bool:
+    def send_message(self, message: str, parse_mode: str = "HTML", chat_id: str = None) -> bool:
         """
         Send Telegram message with automatic retry on network errors
 
         Args:
             message: Message text to send
             parse_mode: Message formatting (HTML, Markdown, or None)
+            chat_id: Chat to send to (defaults to TELEGRAM_CHAT_ID)
 
         Returns:
             True if message sent successfully, False otherwise
         """
         # Telegram has a message limit of 4096 characters
-        max_length = 4000
+        max_length = self.MAX_MESSAGE_LENGTH
         if len(message) > max_length:
             logger.warning(
                 f"Message too long ({len(message)} chars). Truncating to {max_length}"
@@ -87,15 +213,13 @@ class TelegramNotifier:
         # Retry loop with exponential backoff
         for attempt in range(self.max_retries):
             try:
-                url = f"{self.api_base_url}/sendMessage"
-
                 payload = {
-                    "chat_id": self.chat_id,
+                    "chat_id": chat_id or self.chat_id,
                     "text": message,
                     "parse_mode": parse_mode
                 }
 
-                response = requests.post(url, json=payload, timeout=self.timeout)
+                response = self._send("sendMessage", payload)
 
                 if response.status_code == 200:
                     result = response.json()
@@ -113,7 +237,7 @@ class TelegramNotifier:
                         f"Telegram API returned status {response.status_code}: {response.text}"
                     )
 
-                    # Don't retry on client errors (4xx)
+                    # Don't retry on client errors (4xx); rate limits were already waited out
                     if 400 <= response.status_code < 500:
                         return False
 
@@ -151,6 +275,117 @@ class TelegramNotifier:
 
         return False
 
+    def send_documents(
+        self, documents: List[Dict], caption: str, parse_mode: str = "HTML", chat_id: str = None
+    ) -> bool:
+        """
+        Send files (e.g. the original PDFs) with a message as their caption
+
+        Up to 10 files go in a single sendMediaGroup call (a single file uses
+        sendDocument). Files are streamed from disk. Files over the Bot API
+        upload limit are skipped and listed in the message. A message longer
+        than the caption limit is sent first on its own, and the files follow
+        without a caption.
+
+        Once the message is delivered, files that fail to upload are only
+        reported in a follow-up notice: failing the whole delivery would make
+        the retry send the message (and the groups already uploaded) again. If
+        the message itself was to go as a caption that failed, it is sent as
+        text without the files.
+
+        Args:
+            documents: Dicts with the 'filename' and 'path' of each file
+            caption: Message text
+            parse_mode: Message formatting (HTML, Markdown, or None)
+            chat_id: Chat to send to (defaults to TELEGRAM_CHAT_ID)
+
+        Returns:
+            True if the message was delivered
+        """
+        files = []
+        skipped = []
+        for document in documents:
+            path = Path(document["path"])
+            if not path.exists():
+                logger.warning(f"Attachment {document['filename']} no longer exists, not sending it")
+                continue
+            if path.stat().st_size > self.MAX_UPLOAD_BYTES:
+                logger.warning(
+                    f"Attachment {document['filename']} exceeds the "
+                    f"{self.MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit, not sending it"
+                )
+                skipped.append(document["filename"])
+                continue
+            files.append((document["filename"], path))
+
+        if skipped:
+            caption += "\n\n⚠️ Archivos demasiado grandes para adjuntar: " + ", ".join(skipped)
+        if not files:
+            return self.send_message(caption, parse_mode, chat_id)
+
+        text = caption
+        text_sent = False
+        if len(caption) > self.MAX_CAPTION_LENGTH:
+            if not self.send_message(caption, parse_mode, chat_id):
+                return False
+            text_sent = True
+            caption = None
+
+        logger.info(f"Sending {len(files)} document(s) to Telegram")
+        failed = []
+        for start in range(0, len(files), self.MAX_MEDIA_GROUP_SIZE):
+            group = files[start:start + self.MAX_MEDIA_GROUP_SIZE]
+            # Only the first group carries the caption
+            group_caption = caption if start == 0 else None
+            if self._send_document_group(group, group_caption, parse_mode, chat_id or self.chat_id):
+                text_sent = text_sent or bool(group_caption)
+            else:
+                failed.extend(filename for filename, _ in group)
+
+        if not failed:
+            return True
+        notice = "⚠️ No se pudieron adjuntar: " + ", ".join(failed)
+        logger.warning(f"Could not upload {len(failed)} document(s) to Telegram")
+        metrics.increment("telegram_attachments_failed", len(failed))
+        if not text_sent:
+            return self.send_message(f"{text}\n\n{notice}", parse_mode, chat_id)
+        # Best effort: the message was delivered, so the entry is not retried
+        self.send_message(notice, parse_mode, chat_id)
+        return True
+
+    def _send_document_group(
+        self, files: List[tuple], caption: Optional[str], parse_mode: str, chat_id: str
+    ) -> bool:
+        """Upload up to 10 files in one API call"""
+        uploads = [
+            (f"file{i}", filename, path, "application/pdf")
+            for i, (filename, path) in enumerate(files)
+        ]
+        payload = {"chat_id": chat_id}
+        if len(files) == 1:
+            api_method = "sendDocument"
+            uploads = [("document", *uploads[0][1:])]
+            if caption:
+                payload.update(caption=caption, parse_mode=parse_mode)
+        else:
+            api_method = "sendMediaGroup"
+            media = [{"type": "document", "media": f"attach://file{i}"} for i in range(len(files))]
+            if caption:
+                media[0].update(caption=caption, parse_mode=parse_mode)
+            payload["media"] = json.dumps(media, ensure_ascii=False)
+
+        try:
+            response = self._send(api_method, payload, uploads)
+            if response.status_code == 200 and response.json().get("ok"):
+                logger.info(f"Telegram {api_method} sent ({len(files)} file(s))")
+                metrics.increment("telegram_documents_sent", len(files))
+                return True
+            logger.error(f"Telegram {api_method} failed with status {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            logger.error(f"Error sending Telegram documents: {type(e).__name__} - {str(e)}")
+            return False
+
     def send_test_message(self) -> bool:
         """
         Send a test message to verify configuration
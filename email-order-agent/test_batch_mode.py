@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Script para probar el modo Message Batches contra el servidor mock local
+(no consume tokens de la API real)
+"""
+import os
+import time
+
+from mock_anthropic_server import MockAnthropicServer
+
+print("=" * 70)
+print("PRUEBA DE MESSAGE BATCHES - Servidor mock local")
+print("=" * 70)
+
+server = MockAnthropicServer(port=0, batch_delay=3)
+server.start()
+
+# El cliente de Anthropic toma la URL base de esta variable
+os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+from claude_analyzer import ClaudeAnalyzer
+
+analyzer = ClaudeAnalyzer()
+
+print(f"\n🖥️  Servidor mock: {server.base_url}")
+print("\n📥 Encolando análisis...")
+analyzer.queue_purchase_order("prueba-pdf0", "ORDEN DE COMPRA OC-0001 ...", "cliente@ejemplo.com", "oc1.pdf")
+analyzer.queue_purchase_order("prueba-pdf1", "ORDEN DE COMPRA OC-0002 ...", "cliente@ejemplo.com", "oc2.pdf")
+analyzer.queue_email_content("prueba-body", "Favor de surtir la OC adjunta", "cliente@ejemplo.com", "OC")
+
+batch_id = analyzer.submit_batch()
+print(f"   Batch enviado: {batch_id}")
+
+results = {}
+while analyzer.has_pending_batches():
+    print("   ⏳ Esperando resultados...")
+    time.sleep(1)
+    results.update(analyzer.poll_batches())
+
+print(f"\n📤 Resultados recibidos: {len(results)}")
+for custom_id, analysis in results.items():
+    status = "✅" if analysis else "❌"
+    summary = analysis.get("order_number") or analysis.get("tipo_mensaje") if analysis else "sin resultado"
+    print(f"   {status} {custom_id}: {summary}")
+
+print(f"\n🔢 Peticiones HTTP al servidor: {server.request_count}")
+server.stop()
+
+print("\n" + "=" * 70)
+print("PRUEBA COMPLETADA" if len(results) == 3 and all(results.values()) else "PRUEBA FALLIDA")
+print("=" * 70)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Script para probar que un digest que no cabe en la cola del dispatcher
+vuelve al outbox (no se queda retenido en el coalescer)
+No envía mensajes reales ni requiere conexión IMAP
+"""
+import threading
+
+from imap_client import IMAPClient
+from notification_digest import NotificationCoalescer
+from notification_dispatcher import NotificationDispatcher
+
+print("=" * 70)
+print("PRUEBA DE COLA DE NOTIFICACIONES LLENA")
+print("=" * 70)
+
+CHANNEL = "whatsapp"
+
+# Dispatcher con lugar para un solo trabajo y un worker bloqueado
+dispatcher = NotificationDispatcher(queue_size=1)
+unblock = threading.Event()
+started = threading.Event()
+
+
+def blocked_send():
+    started.set()
+    unblock.wait(10)
+    return True
+
+
+dispatcher.submit("ocupado-1", blocked_send)
+started.wait(5)
+dispatcher.submit("ocupado-2", lambda: True)
+
+# Cliente sin conexión: solo lo necesario para entregar notificaciones
+client = IMAPClient.__new__(IMAPClient)
+client.dispatchers = {CHANNEL: dispatcher}
+client.coalescers = {
+    CHANNEL: NotificationCoalescer(
+        60, 1600, lambda channel, entries: client._submit_delivery(channel, entries, digest=True)
+    )
+}
+
+keys = ["msg-1:order@whatsapp", "msg-2:order@whatsapp"]
+for key in keys:
+    client.coalescers[CHANNEL].add(CHANNEL, key, {"text": f"Orden {key}", "channel": CHANNEL})
+
+print("\n📥 Liberando digest con la cola llena...")
+client.coalescers[CHANNEL].flush()
+
+held = [key for key in keys if client.coalescers[CHANNEL].holds(key)]
+print(f"   Claves retenidas en el coalescer: {len(held)}")
+
+unblock.set()
+dispatcher.stop()
+
+print("\n" + "=" * 70)
+print("PRUEBA COMPLETADA" if not held else "PRUEBA FALLIDA")
+print("=" * 70)
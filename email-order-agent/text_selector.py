@@ -0,0 +1,256 @@
+"""
+Text Selector Module
+Picks the most relevant lines of a document for analysis instead of blindly
+truncating it: whitespace and page markers are normalized, every line is
+scored by purchase order signals and the best lines are packed into a token budget.
+Documents too long for one budget can instead be split into page-aligned chunks
+"""
+import logging
+import re
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimate used across the analyzer (~4 characters per token)
+CHARS_PER_TOKEN = 4
+
+# Lines at the top of a document usually carry the client name, PO number and date
+HEADER_LINES = 12
+HEADER_BONUS = 2.0
+
+# Share of the neighbours' score added to a line, so descriptions next to
+# quantities and prices are kept together with them
+NEIGHBOUR_WEIGHT = 0.5
+
+# Skipped runs are replaced by this line
+GAP_MARKER = "..."
+GAP_MARKER_COST = len(GAP_MARKER) + 1
+
+PAGE_MARKER = re.compile(r"^-{2,}\s*Page\s+\d+\s*-{2,}$", re.IGNORECASE)
+
+# Lines repeated at the start of the next chunk when a page has to be split,
+# so a line item broken across the cut is seen whole by one of the chunks
+CHUNK_OVERLAP_LINES = 2
+
+# (pattern, weight) pairs; a line gets the weight of every pattern it matches
+SIGNALS = [
+    # PO / OC numbers
+    (re.compile(
+        r"\b(p\.?\s?o\.?|o\.?\s?c\.?|orden\s+de\s+compra|purchase\s+order|pedido|order)"
+        r"\s*(#|no\.?|n[uú]m(ero)?\.?|number)?\s*[:\-]?\s*[A-Z0-9][A-Z0-9\-/]{2,}",
+        re.IGNORECASE,
+    ), 5.0),
+    # Totals and taxes
+    (re.compile(
+        r"\b(total|subtotal|sub-total|iva|i\.v\.a\.|tax|importe|amount|monto|grand\s+total)\b",
+        re.IGNORECASE,
+    ), 3.0),
+    # Quantities with units
+    (re.compile(
+        r"\b\d+([.,]\d+)?\s*(kg|kgs|kilos?|lt|lts|litros?|l|gal|galones|pza|pzas|piezas?|pcs|pc|ea|"
+        r"each|unidades|uds?|cubetas?|tambor(es)?|totes?|ton|lb|lbs|ml|g|m3|cajas?|sacos?|bolsas?)\b",
+        re.IGNORECASE,
+    ), 3.0),
+    # Prices
+    (re.compile(r"(\$\s?\d)|(\b\d{1,3}(,\d{3})*\.\d{2}\b)|\b(usd|mxn|mn)\b", re.IGNORECASE), 2.0),
+    # SKU / part numbers
+    (re.compile(r"\b[A-Z]{2,}[-_]?\d{3,}\b|\b\d{5,}\b"), 1.5),
+    # Dates
+    (re.compile(r"\b\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b"), 1.0),
+    # Header and line item keywords
+    (re.compile(
+        r"\b(fecha|date|entrega|delivery|ship\s+to|bill\s+to|embarcar|facturar|proveedor|vendor|"
+        r"supplier|cliente|customer|cantidad|qty|quantity|descripci[oó]n|description|"
+        r"precio|price|unit|c[oó]digo|item|partida)\b",
+        re.IGNORECASE,
+    ), 1.0),
+]
+
+# Legal boilerplate and disclaimers push the useful content out of the window
+BOILERPLATE = re.compile(
+    r"\b(t[eé]rminos\s+y\s+condiciones|terms\s+and\s+conditions|liability|warrant(y|ies)|"
+    r"garant[ií]a|indemnif|confidencial|confidential|aviso\s+de\s+privacidad|privacy|"
+    r"disclaimer|jurisdic|arbitra|governing\s+law|unsubscribe)",
+    re.IGNORECASE,
+)
+BOILERPLATE_PENALTY = 3.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def normalize_text(text: str) -> List[str]:
+    """
+    Collapse whitespace and drop empty lines and page markers
+
+    Returns:
+        List of non-empty normalized lines
+    """
+    lines = []
+    for raw_line in text.splitlines():
+        line = " ".join(raw_line.split())
+        if line and not PAGE_MARKER.match(line):
+            lines.append(line)
+    return lines
+
+
+def score_line(line: str) -> float:
+    """Score a line by the purchase order signals it contains"""
+    score = sum(weight for pattern, weight in SIGNALS if pattern.search(line))
+
+    if BOILERPLATE.search(line):
+        score -= BOILERPLATE_PENALTY
+    elif len(line) > 150 and not any(char.isdigit() for char in line):
+        # Long prose without numbers is rarely order data
+        score -= 1.0
+
+    return score
+
+
+def select_relevant_text(text: str, token_budget: int) -> str:
+    """
+    Select the highest value lines of a document within a token budget
+
+    Lines keep their original order; skipped runs are replaced by "...",
+    which counts against the budget like the lines.
+
+    Args:
+        text: Full document text
+        token_budget: Maximum estimated tokens of the returned text
+
+    Returns:
+        Normalized text that fits in the token budget
+    """
+    lines = normalize_text(text)
+    normalized = "\n".join(lines)
+
+    if estimate_tokens(normalized) <= token_budget:
+        return normalized
+
+    base_scores = [score_line(line) for line in lines]
+    scores = []
+    for i, base in enumerate(base_scores):
+        neighbours = [base_scores[j] for j in (i - 1, i + 1) if 0 <= j < len(lines)]
+        score = base + NEIGHBOUR_WEIGHT * max(max(neighbours, default=0.0), 0.0)
+        if i < HEADER_LINES:
+            score += HEADER_BONUS
+        scores.append(score)
+
+    # Highest score first; earlier lines win ties
+    ranking = sorted(range(len(lines)), key=lambda i: (-scores[i], i))
+
+    char_budget = token_budget * CHARS_PER_TOKEN
+    used = 0
+    selected = set()
+    for i in ranking:
+        if scores[i] < 0:
+            break
+        # A "..." marker precedes every selected run that does not start the document
+        left, right = i - 1 in selected, i + 1 in selected
+        if left and right:
+            markers = -1
+        elif left:
+            markers = 0
+        elif right:
+            markers = -1 if i == 0 else 0
+        else:
+            markers = 0 if i == 0 else 1
+        cost = len(lines[i]) + 1 + markers * GAP_MARKER_COST
+        if used + cost > char_budget:
+            continue
+        selected.add(i)
+        used += cost
+
+    output = []
+    previous = -1
+    for i in sorted(selected):
+        if i != previous + 1:
+            output.append(GAP_MARKER)
+        output.append(lines[i])
+        previous = i
+
+    result = "\n".join(output)
+    logger.debug(
+        f"Selected {len(selected)}/{len(lines)} lines "
+        f"(~{estimate_tokens(result)} of ~{estimate_tokens(normalized)} tokens)"
+    )
+    return result
+
+
+def split_pages(text: str) -> List[List[str]]:
+    """
+    Split extracted text into pages at the page markers
+
+    Returns:
+        One list of normalized lines per non-empty page
+    """
+    pages = [[]]
+    for raw_line in text.splitlines():
+        line = " ".join(raw_line.split())
+        if PAGE_MARKER.match(line):
+            pages.append([])
+        elif line:
+            pages[-1].append(line)
+    return [page for page in pages if page]
+
+
+def split_into_chunks(text: str, token_budget: int) -> List[str]:
+    """
+    Split a document into chunks of whole pages that fit in a token budget
+
+    Consecutive pages are packed together; a page larger than the budget is
+    cut at line boundaries, repeating CHUNK_OVERLAP_LINES lines after each cut.
+
+    Args:
+        text: Full document text
+        token_budget: Maximum estimated tokens per chunk
+
+    Returns:
+        List of normalized chunk texts, in document order
+    """
+    char_budget = token_budget * CHARS_PER_TOKEN
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+
+    for page in split_pages(text):
+        page_size = sum(len(line) + 1 for line in page)
+        if current and used + page_size > char_budget:
+            chunks.append(current)
+            current, used = [], 0
+
+        if page_size <= char_budget:
+            current.extend(page)
+            used += page_size
+            continue
+
+        for i, line in enumerate(page):
+            if current and used + len(line) + 1 > char_budget:
+                chunks.append(current)
+                current = page[max(0, i - CHUNK_OVERLAP_LINES):i]
+                used = sum(len(overlap) + 1 for overlap in current)
+            current.append(line)
+            used += len(line) + 1
+
+    if current:
+        chunks.append(current)
+
+    logger.debug(f"Split document into {len(chunks)} chunk(s) of ~{token_budget} tokens")
+    return ["\n".join(chunk) for chunk in chunks]
+
+
+def chunk_overlap(previous: str, chunk: str) -> str:
+    """
+    Lines repeated at the start of a chunk from the end of the previous one
+
+    Returns:
+        The shared lines (empty if the chunks were cut between pages)
+    """
+    previous_lines = previous.splitlines()
+    lines = chunk.splitlines()
+    for size in range(min(CHUNK_OVERLAP_LINES, len(previous_lines), len(lines)), 0, -1):
+        if previous_lines[-size:] == lines[:size]:
+            return "\n".join(lines[:size])
+    return ""
@@ -0,0 +1,155 @@
+"""
+Twilio Reconciler Module
+Twilio accepting a message does not mean WhatsApp delivered it (e.g. error
+63016, outside the 24-hour window). The reconciler periodically lists the
+sender's recent messages in bulk pages, joins them by SID to the outbox
+entries sent through Twilio, records their final status and hands failures
+to a callback (which resends or escalates them). A digest is one message
+shared by several entries, which are resolved together. It makes one API
+call per page of messages, never one per message.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+import config
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Final Twilio message statuses
+DELIVERED_STATUSES = {"delivered", "read"}
+FAILED_STATUSES = {"failed", "undelivered", "canceled"}
+
+
+class TwilioReconciler:
+    """Background thread joining Twilio delivery statuses to the outbox"""
+
+    def __init__(
+        self,
+        client,
+        outbox,
+        from_number: str,
+        on_failed: Callable[[List[Dict], str, str], None],
+        interval_minutes: float = None,
+        page_size: int = 100,
+    ):
+        """
+        Args:
+            client: twilio.rest.Client
+            outbox: NotificationOutbox holding the sent entries
+            from_number: WhatsApp sender whose messages are listed
+            on_failed: Called with (outbox entries, status, error) for each undelivered
+                message; a digest's entries come in a single call
+            interval_minutes: Time between reconciliations (defaults to
+                config.TWILIO_RECONCILE_INTERVAL_MINUTES)
+            page_size: Messages per API page (Twilio allows up to 1000)
+        """
+        self.client = client
+        self.outbox = outbox
+        self.from_number = from_number
+        self.on_failed = on_failed
+        self.interval = (interval_minutes or config.TWILIO_RECONCILE_INTERVAL_MINUTES) * 60
+        self.page_size = page_size
+        # Entries without a final status after this long are given up on
+        self.max_age = config.TWILIO_RECONCILE_MAX_AGE_HOURS * 3600
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start reconciling in the background"""
+        self._thread = threading.Thread(target=self._run, name="twilio-reconciler", daemon=True)
+        self._thread.start()
+        logger.info(f"Twilio reconciler started (every {self.interval / 60:.0f} min)")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"Error reconciling Twilio statuses: {str(e)}")
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Fetch the statuses of messages sent since the oldest unresolved entry
+
+        Returns:
+            Dict with the number of entries delivered, failed, expired and still awaiting
+        """
+        counts = {"delivered": 0, "failed": 0, "expired": 0, "awaiting": 0}
+        # SID -> entries it delivered (several for a digest)
+        awaiting: Dict[str, List[Dict]] = {}
+        for entry in self.outbox.awaiting_delivery("twilio"):
+            awaiting.setdefault(entry["provider_ref"], []).append(entry)
+        if not awaiting:
+            return counts
+
+        # A small margin covers clock differences with Twilio
+        oldest = min(entry["sent_at"] for entries in awaiting.values() for entry in entries)
+        since = datetime.fromtimestamp(oldest, tz=timezone.utc) - timedelta(minutes=5)
+
+        pages = 0
+        started = time.monotonic()
+        page = self.client.messages.page(
+            from_=self.from_number, date_sent_after=since, page_size=self.page_size
+        )
+        while page is not None and awaiting:
+            pages += 1
+            for message in page:
+                entries = awaiting.pop(message.sid, None)
+                if entries is not None:
+                    self._record(entries, message, counts)
+                    if message.status not in DELIVERED_STATUSES | FAILED_STATUSES:
+                        # Not final yet, check again next time
+                        awaiting[message.sid] = entries
+                        counts["awaiting"] += len(entries)
+            page = page.next_page() if awaiting else None
+        metrics.observe("twilio_reconcile_seconds", time.monotonic() - started)
+        metrics.increment("twilio_reconcile_pages", pages)
+
+        # Entries Twilio no longer lists (or never reports on) are given up on
+        now = time.time()
+        for entry in (entry for entries in awaiting.values() for entry in entries):
+            if now - entry["sent_at"] > self.max_age:
+                self.outbox.record_delivery(entry["key"], "unknown", "No final status from Twilio")
+                counts["expired"] += 1
+
+        logger.info(
+            f"Twilio reconciliation ({pages} page(s)): {counts['delivered']} delivered, "
+            f"{counts['failed']} failed, {counts['awaiting']} awaiting, {counts['expired']} expired"
+        )
+        return counts
+
+    def _record(self, entries: List[Dict], message, counts: Dict[str, int]):
+        """Record a message's final status on its entries; undelivered ones go to on_failed"""
+        if message.status in DELIVERED_STATUSES:
+            for entry in entries:
+                self.outbox.record_delivery(entry["key"], message.status)
+            metrics.increment("whatsapp_delivered")
+            if message.date_created and message.date_updated:
+                # date_updated is when Twilio recorded the delivery
+                latency = (message.date_updated - message.date_created).total_seconds()
+                metrics.observe("whatsapp_delivery_seconds", latency)
+            counts["delivered"] += len(entries)
+
+        elif message.status in FAILED_STATUSES:
+            error = f"Twilio {message.status}: {message.error_code} {message.error_message or ''}".strip()
+            logger.warning(f"WhatsApp message {message.sid} was not delivered ({error})")
+            for entry in entries:
+                self.outbox.record_delivery(entry["key"], message.status, error)
+            metrics.increment("whatsapp_undelivered")
+            counts["failed"] += len(entries)
+            try:
+                self.on_failed(
+                    [self.outbox.get(entry["key"]) for entry in entries], message.status, error
+                )
+            except Exception as e:
+                logger.error(f"Error handling undelivered message {message.sid}: {str(e)}")
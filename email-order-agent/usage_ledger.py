@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Usage Ledger Module
+Persistent record of every Claude call (model, tokens, cache usage, latency,
+sender, message ID and outcome) with rollups by client, day and document type
+
+The sender and message ID of the email being analyzed are taken from a context
+variable set by the IMAP client, so they follow each email's async task.
+
+Usage:
+    python usage_ledger.py                      # Daily rollup of the last 30 days
+    python usage_ledger.py --by client --days 7
+    python usage_ledger.py --by type --json
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import config
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens: input, output, cache write, cache read
+MODEL_PRICES = {
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-haiku-20240307": (0.25, 1.25, 0.30, 0.03),
+    "claude-sonnet-4-20250514": (3.00, 15.00, 3.75, 0.30),
+}
+BATCH_DISCOUNT = 0.5
+
+# Rollup dimensions accepted by report()
+GROUP_COLUMNS = {
+    "day": "day",
+    "client": "client",
+    "sender": "sender_email",
+    "type": "request_type",
+    "model": "model",
+    "outcome": "outcome",
+}
+
+_context: ContextVar[Dict] = ContextVar("usage_context", default={})
+
+
+def set_usage_context(**values):
+    """Attach values (sender_email, message_id) to calls made from the current task"""
+    _context.set({**_context.get(), **values})
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int,
+                  cache_write_tokens: int = 0, cache_read_tokens: int = 0,
+                  batch: bool = False) -> float:
+    """Cost in USD of a call (0 for models without a known price)"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, output_price, write_price, read_price = prices
+    cost = (
+        input_tokens * input_price + output_tokens * output_price
+        + cache_write_tokens * write_price + cache_read_tokens * read_price
+    ) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class UsageLedger:
+    """SQLite ledger of Claude calls"""
+
+    def __init__(self, path=None):
+        """
+        Open (or create) the ledger database
+
+        Args:
+            path: SQLite file (defaults to config.USAGE_LEDGER_FILE)
+        """
+        self.path = path or config.USAGE_LEDGER_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                day TEXT NOT NULL,
+                model TEXT NOT NULL,
+                request_type TEXT NOT NULL,
+                purpose TEXT NOT NULL,
+                sender_email TEXT,
+                client TEXT,
+                message_id TEXT,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cache_read_tokens INTEGER NOT NULL,
+                cache_write_tokens INTEGER NOT NULL,
+                latency_ms INTEGER,
+                outcome TEXT NOT NULL,
+                batch INTEGER NOT NULL,
+                cost_usd REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_day ON calls (day)")
+        self._conn.commit()
+
+    def record(self, model: str, request_type: str, outcome: str, usage=None,
+               latency: Optional[float] = None, purpose: str = "analysis",
+               batch: bool = False, sender_email: Optional[str] = None):
+        """
+        Record a call
+
+        Args:
+            model: Model name
+            request_type: purchase_order, email_analysis or combined_analysis
+            outcome: ok, early_stop, error, cache_hit, coalesced or preclassified
+            usage: Usage object of the response (None when no tokens were spent)
+            latency: Seconds the call took
+            purpose: analysis or repair
+            batch: Whether the call was part of a Message Batch (discounted)
+            sender_email: Sender, if not set in the usage context
+        """
+        context = _context.get()
+        sender_email = sender_email or context.get("sender_email")
+        client = sender_email.split("@")[-1].lower() if sender_email else None
+
+        tokens = {"input": 0, "output": 0, "cache_read": 0, "cache_write": 0}
+        if usage is not None:
+            tokens = {
+                "input": usage.input_tokens,
+                "output": usage.output_tokens,
+                "cache_read": getattr(usage, "cache_read_input_tokens", None) or 0,
+                "cache_write": getattr(usage, "cache_creation_input_tokens", None) or 0,
+            }
+        cost = estimate_cost(
+            model, tokens["input"], tokens["output"],
+            tokens["cache_write"], tokens["cache_read"], batch,
+        )
+
+        now = datetime.now()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO calls (timestamp, day, model, request_type, purpose, "
+                    "sender_email, client, message_id, input_tokens, output_tokens, "
+                    "cache_read_tokens, cache_write_tokens, latency_ms, outcome, batch, cost_usd) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        now.isoformat(), now.strftime("%Y-%m-%d"), model, request_type, purpose,
+                        sender_email, client, context.get("message_id"),
+                        tokens["input"], tokens["output"], tokens["cache_read"], tokens["cache_write"],
+                        int(latency * 1000) if latency is not None else None,
+                        outcome, int(batch), cost,
+                    ),
+                )
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"Error recording usage: {str(e)}")
+
+    def report(self, group_by: str = "day", days: Optional[int] = 30) -> List[Dict]:
+        """
+        Roll up calls by a dimension
+
+        Args:
+            group_by: day, client, sender, type, model or outcome
+            days: Only include the last N days (None for all)
+
+        Returns:
+            One dict per group with call counts, tokens, cost and latency
+        """
+        column = GROUP_COLUMNS[group_by]
+        where, params = "", ()
+        if days is not None:
+            where = "WHERE day >= ?"
+            params = ((datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d"),)
+
+        query = f"""
+            SELECT COALESCE({column}, 'unknown') AS grp,
+                   COUNT(*),
+                   SUM(outcome IN ('ok', 'early_stop')),
+                   SUM(outcome IN ('cache_hit', 'coalesced')),
+                   SUM(outcome = 'preclassified'),
+                   SUM(outcome = 'error'),
+                   SUM(input_tokens), SUM(output_tokens),
+                   SUM(cache_read_tokens), SUM(cache_write_tokens),
+                   SUM(cost_usd),
+                   AVG(latency_ms), MAX(latency_ms)
+            FROM calls {where}
+            GROUP BY grp
+            ORDER BY {"grp" if group_by == "day" else "SUM(cost_usd) DESC"}
+        """
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return [
+            {
+                group_by: row[0],
+                "calls": row[1],
+                "api_calls": row[2],
+                "cache_hits": row[3],
+                "preclassified": row[4],
+                "errors": row[5],
+                "input_tokens": row[6],
+                "output_tokens": row[7],
+                "cache_read_tokens": row[8],
+                "cache_write_tokens": row[9],
+                "cost_usd": round(row[10], 6),
+                "avg_latency_ms": round(row[11]) if row[11] is not None else None,
+                "max_latency_ms": row[12],
+            }
+            for row in rows
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Claude usage and cost report")
+    parser.add_argument("--by", choices=sorted(GROUP_COLUMNS), default="day",
+                        help="Rollup dimension")
+    parser.add_argument("--days", type=int, default=30, help="Last N days (0 for all)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    rows = UsageLedger().report(args.by, args.days or None)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{args.by:<32} {'calls':>6} {'api':>5} {'cache':>5} {'skip':>5} "
+          f"{'in_tok':>9} {'out_tok':>8} {'cost_usd':>9} {'avg_ms':>7}")
+    for row in rows:
+        print(f"{str(row[args.by])[:32]:<32} {row['calls']:>6} {row['api_calls']:>5} "
+              f"{row['cache_hits']:>5} {row['preclassified']:>5} {row['input_tokens']:>9} "
+              f"{row['output_tokens']:>8} {row['cost_usd']:>9.4f} {str(row['avg_latency_ms'] or '-'):>7}")
+    print(f"Total cost: ${sum(row['cost_usd'] for row in rows):.4f}")
+
+
+if __name__ == "__main__":
+    main()
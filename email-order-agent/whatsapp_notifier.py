@@ -3,6 +3,7 @@ WhatsApp Notifier Module
 Sends WhatsApp messages using Twilio API
 """
 import logging
+import threading
 from typing import Optional
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -11,6 +12,8 @@ from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 from requests.exceptions import SSLError, ConnectionError, Timeout, RequestException
 import config
+from metrics import metrics
+from rate_limiter import DestinationRateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,11 @@ logger = logging.getLogger(__name__)
 class WhatsAppNotifier:
     """Sends WhatsApp notifications using Twilio"""
 
+    # Twilio limit for WhatsApp message bodies
+    MAX_MESSAGE_LENGTH = 1600
+    # Twilio errors meaning too many requests (HTTP 429, WhatsApp channel rate limit)
+    RATE_LIMIT_ERROR_CODES = {20429, 63018}
+
     def __init__(self, max_retries: int = 3, timeout: int = 30):
         """
         Initialize Twilio client
@@ -34,9 +42,19 @@ class WhatsAppNotifier:
             self.from_number = config.TWILIO_WHATSAPP_FROM
             self.to_number = config.TWILIO_WHATSAPP_TO
             self.last_message_file = config.LOGS_DIR / "last_whatsapp_message.txt"
+            # Kept in memory so heartbeat checks do not re-read the file
+            self._last_message_time = self._load_last_message_time()
             self.max_retries = max_retries
             self.timeout = timeout
 
+            # SID of the last message created by each thread (see last_sid)
+            self._local = threading.local()
+
+            # Twilio queues or rejects messages above the sender's throughput
+            self.rate_limiter = DestinationRateLimiter(
+                config.TWILIO_WHATSAPP_MESSAGES_PER_SECOND * 60
+            )
+
             logger.info(
                 f"WhatsApp notifier initialized. From: {self.from_number}, "
                 f"To: {self.to_number}, Max retries: {max_retries}, Timeout: {timeout}s"
@@ -46,18 +64,19 @@ class WhatsAppNotifier:
             logger.error(f"Failed to initialize Twilio client: {str(e)}")
             raise
 
-    def send_message(self, message: str) -> bool:
+    def send_message(self, message: str, to: str = None) -> bool:
         """
         Send WhatsApp message via Twilio with automatic retry on network errors
 
         Args:
             message: Message text to send
+            to: Recipient (defaults to TWILIO_WHATSAPP_TO)
 
         Returns:
             True if message sent successfully, False otherwise
         """
         # Twilio has a message limit, truncate if needed
-        max_length = 1600  # Twilio limit
+        max_length = self.MAX_MESSAGE_LENGTH
         if len(message) > max_length:
             logger.warning(
                 f"Message too long ({len(message)} chars). Truncating to {max_length}"
@@ -70,10 +89,10 @@ class WhatsAppNotifier:
         for attempt in range(self.max_retries):
             try:
                 # Send via Twilio (timeout is handled by underlying http client)
-                twilio_message = self.client.messages.create(
+                twilio_message = self._create_message(
                     body=message,
                     from_=self.from_number,
-                    to=self.to_number
+                    to=to or self.to_number
                 )
 
                 logger.info(
@@ -144,7 +163,40 @@ class WhatsAppNotifier:
 
         return False
 
-    def send_template_message(self, template_sid: str, content_variables: dict = None) -> bool:
+    @property
+    def last_sid(self) -> Optional[str]:
+        """SID of the last message created by the calling thread"""
+        return getattr(self._local, "sid", None)
+
+    def _create_message(self, **params):
+        """
+        Create a Twilio message within the sender's throughput limit
+
+        Rate limit errors pause the sender with exponential backoff (Twilio
+        does not say how long to wait) and the message is created again, up to
+        NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS in total. Other errors are raised.
+        """
+        waited = 0.0
+        rate_limited = 0
+        while True:
+            waited += self.rate_limiter.acquire(self.from_number)
+            try:
+                message = self.client.messages.create(**params)
+                self._local.sid = message.sid
+                return message
+            except TwilioRestException as e:
+                if e.status != 429 and e.code not in self.RATE_LIMIT_ERROR_CODES:
+                    raise
+                metrics.increment("twilio_rate_limited")
+                rate_limited += 1
+                delay = min(2 ** rate_limited, 60)
+                if waited + delay > config.NOTIFICATION_MAX_RATE_LIMIT_WAIT_SECONDS:
+                    raise
+                logger.warning(f"Twilio rate limit reached ({e.code}), retrying in {delay}s")
+                self.rate_limiter.pause(self.from_number, delay)
+
+    def send_template_message(self, template_sid: str, content_variables: dict = None,
+                              to: str = None) -> bool:
         """
         Send WhatsApp message using an approved Content Template
         This works even outside the 24-hour conversation window
@@ -153,6 +205,7 @@ class WhatsAppNotifier:
             template_sid: The SID of the approved WhatsApp template (format: HXxxxx...)
             content_variables: Dictionary of variables to replace in template (1-indexed)
                               Example: {"1": "value1", "2": "value2"}
+            to: Recipient (defaults to TWILIO_WHATSAPP_TO)
 
         Returns:
             True if message sent successfully, False otherwise
@@ -165,7 +218,7 @@ class WhatsAppNotifier:
                 # Build message parameters
                 message_params = {
                     "from_": self.from_number,
-                    "to": self.to_number,
+                    "to": to or self.to_number,
                     "content_sid": template_sid
                 }
 
@@ -176,7 +229,7 @@ class WhatsAppNotifier:
                     logger.info(f"Template variables: {content_variables}")
 
                 # Send via Twilio
-                twilio_message = self.client.messages.create(**message_params)
+                twilio_message = self._create_message(**message_params)
 
                 logger.info(
                     f"WhatsApp template message sent successfully. SID: {twilio_message.sid}, "
@@ -221,7 +274,7 @@ class WhatsAppNotifier:
         return False
 
     def send_purchase_order_notification(self, client_name: str, po_number: str = "",
-                                         template_sid: str = None) -> bool:
+                                         template_sid: str = None, to: str = None) -> bool:
         """
         Send purchase order notification using either freeform or template
         Automatically uses template if provided or falls back to freeform
@@ -230,6 +283,7 @@ class WhatsAppNotifier:
             client_name: Name of the client who sent the order
             po_number: Purchase order number (optional)
             template_sid: WhatsApp template SID (optional, use for 24h+ window)
+            to: Recipient (defaults to TWILIO_WHATSAPP_TO)
 
         Returns:
             True if notification sent successfully
@@ -243,7 +297,7 @@ class WhatsAppNotifier:
             if po_number:
                 variables["2"] = po_number
 
-            return self.send_template_message(template_sid, variables)
+            return self.send_template_message(template_sid, variables, to)
         else:
             # Use freeform message (only works within 24h window)
             logger.info(f"Sending PO notification via freeform for client: {client_name}")
@@ -255,7 +309,7 @@ Cliente: {client_name}{po_info}
 
 Se ha detectado una nueva orden de compra en el correo."""
 
-            return self.send_message(message)
+            return self.send_message(message, to)
 
     def send_test_message(self) -> bool:
         """
@@ -351,16 +405,21 @@ Por favor revisa los logs para más detalles."""
             return []
 
     def _update_last_message_time(self):
-        """Update the timestamp of the last sent message"""
+        """Update the timestamp of the last sent message (persisted across restarts)"""
+        self._last_message_time = datetime.now()
         try:
             with open(self.last_message_file, "w") as f:
-                f.write(datetime.now().isoformat())
+                f.write(self._last_message_time.isoformat())
             logger.debug("Updated last message timestamp")
         except Exception as e:
             logger.error(f"Error updating last message time: {str(e)}")
 
     def _get_last_message_time(self) -> Optional[datetime]:
         """Get the timestamp of the last sent message"""
+        return self._last_message_time
+
+    def _load_last_message_time(self) -> Optional[datetime]:
+        """Read the timestamp of the last sent message saved by a previous run"""
         try:
             if self.last_message_file.exists():
                 with open(self.last_message_file, "r") as f: